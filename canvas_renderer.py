@@ -0,0 +1,165 @@
+import time
+from collections import OrderedDict
+from tkinter import font as tkfont
+
+
+class RetainedCanvasRenderer:
+    """
+    Keeps the canvas items of each drawn object (a student, furniture item, stat box,
+    guide, the grid, ...) alive between redraws and updates them in place.
+
+    Each object is an "owner" whose items are addressed by a slot key that is stable
+    from one redraw to the next (e.g. "rect", ("name", 0)). A redraw of an owner is
+    wrapped in begin(owner)/end(owner); item() updates the item already in that slot
+    with coords/itemconfigure (skipping Tk entirely when nothing changed) and only
+    creates an item for a new slot. end() deletes the slots that were not drawn this
+    time, so items are only created or deleted when the structure changes.
+
+    With retained set to False every owner is deleted and recreated on each redraw,
+    which is how the canvas used to be drawn; benchmark_redraw() compares the two.
+    """
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.retained = True
+        self._items = {} # {owner: {slot: [canvas_item_id, kind, coords, options]}}
+        self._drawn = None # Slots drawn so far in the current pass of _owner, in drawing order
+        self._owner = None
+        self._created = False
+
+    def begin(self, owner):
+        if not self.retained: self.remove(owner)
+        self._owner, self._drawn, self._created = owner, [], False
+
+    def item(self, kind, slot, coords, **options):
+        """Draws the canvas item of the given kind ('rectangle', 'text', 'line') in slot of the current owner."""
+        coords = tuple(coords)
+        owner_items = self._items.setdefault(self._owner, {})
+        existing = owner_items.get(slot)
+        if existing is not None and existing[1] == kind:
+            item_id = existing[0]
+            if existing[2] != coords:
+                self.canvas.coords(item_id, *coords)
+                existing[2] = coords
+            if existing[3] != options:
+                changed = {key: value for key, value in options.items() if existing[3].get(key) != value}
+                self.canvas.itemconfigure(item_id, **changed)
+                existing[3] = options
+        else:
+            if existing is not None: self.canvas.delete(existing[0])
+            item_id = getattr(self.canvas, "create_" + kind)(*coords, **options)
+            owner_items[slot] = [item_id, kind, coords, options]
+            self._created = True
+        self._drawn.append(slot)
+        return item_id
+
+    def end(self):
+        """Deletes the current owner's slots that were not drawn and restores the drawing order after new items."""
+        owner, drawn = self._owner, self._drawn
+        self._owner, self._drawn = None, None
+        owner_items = self._items.get(owner)
+        if owner_items is None: return
+        drawn_slots = set(drawn)
+        for slot in [slot for slot in owner_items if slot not in drawn_slots]:
+            self.canvas.delete(owner_items.pop(slot)[0])
+        if not owner_items:
+            del self._items[owner]
+        elif self._created and len(drawn) > 1:
+            # New items go on top of the whole canvas; stack this owner's items in the order they were drawn
+            for previous_slot, slot in zip(drawn, drawn[1:]):
+                self.canvas.tag_raise(owner_items[slot][0], owner_items[previous_slot][0])
+
+    def remove(self, owner):
+        """Deletes every item of owner, e.g. when the object was deleted."""
+        for item_id, *_ in self._items.pop(owner, {}).values():
+            self.canvas.delete(item_id)
+
+    def invalidate(self, owner):
+        """Forgets the cached state of owner's items after they were changed directly (e.g. canvas.move while dragging)."""
+        for existing in self._items.get(owner, {}).values():
+            existing[2], existing[3] = None, {}
+
+    def invalidate_all(self):
+        """Forgets the cached state of every item, e.g. after canvas.scale moved all of them."""
+        for owner in self._items:
+            self.invalidate(owner)
+
+    def prune(self, keep_owners):
+        """Removes every owner not in keep_owners."""
+        for owner in [owner for owner in self._items if owner not in keep_owners]:
+            self.remove(owner)
+
+    def clear(self):
+        self.canvas.delete("all")
+        self._items.clear()
+
+    def item_count(self):
+        return sum(len(owner_items) for owner_items in self._items.values())
+
+
+class FontCache:
+    """
+    LRU cache of Tk font objects keyed by (family, size, weight), with memoized
+    measure() and linespace() for the cached fonts.
+
+    Every Font() and every measure/metrics call is a Tcl round trip; laying out a
+    student box needs dozens of them per redraw. A cached font is never reconfigured,
+    so its metrics stay valid until it is evicted or the cache is cleared (on zoom).
+    """
+    def __init__(self, max_fonts=64, max_measurements=8192):
+        self.max_fonts = max_fonts
+        self.max_measurements = max_measurements
+        self._fonts = OrderedDict() # {(family, size, weight): tkfont.Font}
+        self._linespaces = {} # {font name: int}
+        self._measurements = {} # {(font name, text): int}
+
+    def font(self, family, size, weight="normal"):
+        key = (family, size, weight)
+        font_obj = self._fonts.get(key)
+        if font_obj is not None:
+            self._fonts.move_to_end(key)
+            return font_obj
+        font_obj = tkfont.Font(family=family, size=size, weight=weight)
+        self._fonts[key] = font_obj
+        if len(self._fonts) > self.max_fonts:
+            _, evicted_font = self._fonts.popitem(last=False)
+            self._linespaces.pop(evicted_font.name, None)
+        return font_obj
+
+    def linespace(self, font_obj):
+        linespace = self._linespaces.get(font_obj.name)
+        if linespace is None:
+            linespace = self._linespaces[font_obj.name] = font_obj.metrics('linespace')
+        return linespace
+
+    def measure(self, font_obj, text):
+        key = (font_obj.name, text)
+        width = self._measurements.get(key)
+        if width is None:
+            if len(self._measurements) >= self.max_measurements: self._measurements.clear()
+            width = self._measurements[key] = font_obj.measure(text)
+        return width
+
+    def clear(self):
+        self._fonts.clear()
+        self._linespaces.clear()
+        self._measurements.clear()
+
+
+def benchmark_redraw(redraw, renderer, rounds=20):
+    """
+    Times redraw() with the retained renderer and with delete-and-recreate drawing.
+    Returns {"retained_ms": float, "recreate_ms": float, "items": int} (averages per redraw).
+    """
+    was_retained = renderer.retained
+    results = {}
+    try:
+        for label, retained in (("recreate_ms", False), ("retained_ms", True)):
+            renderer.retained = retained
+            redraw() # Warm-up; also leaves the canvas in the state being measured
+            start_time = time.perf_counter()
+            for _ in range(rounds): redraw()
+            results[label] = (time.perf_counter() - start_time) * 1000 / rounds
+    finally:
+        renderer.retained = was_retained
+    results["items"] = renderer.item_count()
+    return results
@@ -3,6 +3,8 @@ import sys
 from datetime import datetime
 import tkinter as tk
 
+from log_store import new_log_id
+
 # def listener(callback: typing.Callable[[str], None]) -> None: ...
 
 # TODO: make conditional formatting work by quizzes. add thing for homework also.
@@ -149,6 +151,10 @@ MAX_CUSTOM_TYPES = 90 # Max for custom behaviors, homeworks, mark types
 
 
 # --- Command Pattern for Undo/Redo ---
+# Canvas regions a command can invalidate besides individual item IDs (see Command.redraw_scope)
+REDRAW_ALL = "all"
+REDRAW_STAT_BOXES = "stat_boxes"
+
 class Command:
     def __init__(self, app, timestamp=None):
         self.app = app
@@ -156,6 +162,9 @@ class Command:
 
     def execute(self): raise NotImplementedError
     def undo(self): raise NotImplementedError
+    def redraw_scope(self):
+        """Item IDs and regions (REDRAW_ALL, REDRAW_STAT_BOXES) whose canvas items this command changes."""
+        return {REDRAW_ALL}
     def to_dict(self): return {'type': self.__class__.__name__, 'timestamp': self.timestamp, 'data': self._get_data_for_serialization()}
     def _get_data_for_serialization(self): raise NotImplementedError
 
@@ -204,7 +213,7 @@ class MoveGuideCommand(Command):
             if guide_info:
                 data_source[item_id]['world_coord'] = new_coord
         self.app.update_status(f"Moved {len(self.items_moves)} guide(s).")
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
     def undo(self):
         for item_move in self.items_moves:
@@ -214,8 +223,9 @@ class MoveGuideCommand(Command):
             if guide_info:#item_id in data_source:
                 data_source[item_id]['world_coord'] = old_x
         self.app.update_status(f"Undid move of {len(self.items_moves)} guide(s).")
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
+    def redraw_scope(self): return {item_move['id'] for item_move in self.items_moves}
     def _get_data_for_serialization(self): return {'items_moves': self.items_moves}
     @classmethod
     def _from_serializable_data(cls, app, data, timestamp): return cls(app, data['items_moves'], timestamp)
@@ -233,15 +243,16 @@ class AddGuideCommand(Command):
     def execute(self):
         data_source = self.app.guides # if self.item_type == 'student' else self.app.furniture
         data_source[self.item_id] = self.item_data.copy()
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
     def undo(self):
         data_source = self.app.guides # if self.item_type == 'student' else self.app.furniture
         if self.item_id in data_source:
             del data_source[self.item_id]
-            self.app.canvas.delete(self.item_id)
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+            self.app.renderer.remove(self.item_id)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
+    def redraw_scope(self): return {self.item_id}
     def _get_data_for_serialization(self): return {'item_id': self.item_id, 'item_type': self.item_type, 'item_data': self.item_data, 'old_next_id_num': self.old_next_id_num}
     @classmethod
     def _from_serializable_data(cls, app, data, timestamp): return cls(app, data['item_id'], data['item_type'], data['item_data'], data['old_next_id_num'], timestamp)
@@ -261,15 +272,16 @@ class DeleteGuideCommand(Command):
         if self.item_id in data_source:
             del data_source[self.item_id]
         self.app.update_status(f"Deleted {self.item_type} guide at {self.item_data.get("world_coord")}")
-        self.app.canvas.delete(self.item_id)
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.renderer.remove(self.item_id)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
     def undo(self):
         data_source = self.app.guides # if self.item_type == 'student' else self.app.furniture
         data_source[self.item_id] = self.item_data.copy()
         self.app.update_status(f"Undid delete of {self.item_type} guide at {self.item_data.get("world_coord")}")
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
+    def redraw_scope(self): return {self.item_id}
     def _get_data_for_serialization(self):
         return {
             'item_id': self.item_id, 'item_type': self.item_type,
@@ -304,8 +316,9 @@ class MoveItemsCommand(Command):
             if item_id in data_source:
                 data_source[item_id]['x'] = new_x
                 data_source[item_id]['y'] = new_y
+        self.app.update_spatial_index(*self.redraw_scope())
         self.app.update_status(f"Moved {len(self.items_moves)} item(s).")
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
     def undo(self):
         for item_move in self.items_moves:
@@ -321,9 +334,11 @@ class MoveItemsCommand(Command):
             if item_id in data_source:
                 data_source[item_id]['x'] = old_x
                 data_source[item_id]['y'] = old_y
+        self.app.update_spatial_index(*self.redraw_scope())
         self.app.update_status(f"Undid move of {len(self.items_moves)} item(s).")
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
+    def redraw_scope(self): return {item_move['id'] for item_move in self.items_moves}
     def _get_data_for_serialization(self): return {'items_moves': self.items_moves}
     @classmethod
     def _from_serializable_data(cls, app, data, timestamp): return cls(app, data['items_moves'], timestamp)
@@ -359,7 +374,8 @@ class AddItemCommand(Command):
         elif self.item_type == 'stat_box':
             self.app.next_stat_box_id_num = self.item_data.get('original_next_id_num_after_add', self.app.next_stat_box_id_num)
             self.app.update_status(f"Stat Box '{self.item_data['name']}' added.")
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.update_spatial_index(self.item_id)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
     def undo(self):
         if self.item_type == 'student':
@@ -374,7 +390,7 @@ class AddItemCommand(Command):
         if self.item_id in data_source:
             item_name = data_source[self.item_id].get('full_name', data_source[self.item_id].get('name'))
             del data_source[self.item_id]
-            self.app.canvas.delete(self.item_id)
+            self.app.renderer.remove(self.item_id)
             if self.item_type == 'student':
                 self.app.next_student_id_num = self.old_next_id_num
                 self.app.update_status(f"Undid add of student '{item_name}'.")
@@ -384,8 +400,11 @@ class AddItemCommand(Command):
             elif self.item_type == 'stat_box':
                 self.app.next_stat_box_id_num = self.old_next_id_num
                 self.app.update_status(f"Undid add of stat box '{item_name}'.")
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.update_spatial_index(self.item_id)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
+    def redraw_scope(self): # Stat boxes count students
+        return {self.item_id, REDRAW_STAT_BOXES} if self.item_type == 'student' else {self.item_id}
     def _get_data_for_serialization(self): return {'item_id': self.item_id, 'item_type': self.item_type, 'item_data': self.item_data, 'old_next_id_num': self.old_next_id_num}
     @classmethod
     def _from_serializable_data(cls, app, data, timestamp): return cls(app, data['item_id'], data['item_type'], data['item_data'], data['old_next_id_num'], timestamp)
@@ -420,24 +439,19 @@ class DeleteItemCommand(Command):
         if self.item_id in data_source:
             item_name = data_source[self.item_id].get('full_name', data_source[self.item_id].get('name'))
             del data_source[self.item_id]
-        self.app.canvas.delete(self.item_id)
+        self.app.renderer.remove(self.item_id)
         if self.item_id in self.app.selected_items: self.app.selected_items.remove(self.item_id)
 
         if self.item_type == 'student':
-            original_log_count = len(self.app.behavior_log)
-            self.app.behavior_log = [log for log in self.app.behavior_log if log["student_id"] != self.item_id]
-            logs_removed_count = original_log_count - len(self.app.behavior_log)
-
-            original_homework_log_count = len(self.app.homework_log)
-            self.app.homework_log = [log for log in self.app.homework_log if log["student_id"] != self.item_id]
-            homework_logs_removed_count = original_homework_log_count - len(self.app.homework_log)
+            logs_removed_count, homework_logs_removed_count = self.app.log_store.remove_student(self.item_id)
 
             self.app.update_status(f"Student '{item_name}', {logs_removed_count} behavior/quiz log(s), and {homework_logs_removed_count} homework log(s) deleted.")
         elif self.item_type == 'furniture':
             self.app.update_status(f"Furniture '{item_name}' deleted.")
         elif self.item_type == 'stat_box':
             self.app.update_status(f"Stat Box '{item_name}' deleted.")
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.update_spatial_index(self.item_id)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
     def undo(self):
         if self.item_type == 'student':
@@ -452,21 +466,19 @@ class DeleteItemCommand(Command):
         data_source[self.item_id] = self.item_data.copy()
         if self.item_type == 'student':
             self.app.update_student_display_text(self.item_id)
-            for log_entry in self.associated_logs:
-                if log_entry not in self.app.behavior_log: self.app.behavior_log.append(log_entry.copy())
-            self.app.behavior_log.sort(key=lambda x: x.get("timestamp", ""))
-
-            for hw_log_entry in self.associated_homework_logs: # Restore homework logs
-                if hw_log_entry not in self.app.homework_log: self.app.homework_log.append(hw_log_entry.copy())
-            self.app.homework_log.sort(key=lambda x: x.get("timestamp", ""))
+            self.app.log_store.restore("behavior", self.associated_logs)
+            self.app.log_store.restore("homework", self.associated_homework_logs) # Restore homework logs
 
             self.app.update_status(f"Undid delete of student '{self.item_data['full_name']}'. Logs restored.")
         elif self.item_type == 'furniture':
             self.app.update_status(f"Undid delete of furniture '{self.item_data['name']}'.")
         elif self.item_type == 'stat_box':
             self.app.update_status(f"Undid delete of stat box '{self.item_data['name']}'.")
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.update_spatial_index(self.item_id)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
+    def redraw_scope(self): # Stat boxes count students and their logs
+        return {self.item_id, REDRAW_STAT_BOXES} if self.item_type == 'student' else {self.item_id}
     def _get_data_for_serialization(self):
         return {
             'item_id': self.item_id, 'item_type': self.item_type,
@@ -485,35 +497,30 @@ class DeleteItemCommand(Command):
 class LogEntryCommand(Command): # For Behavior and Quiz logs
     def __init__(self, app, log_entry, student_id, timestamp=None):
         super().__init__(app, timestamp)
-        self.log_entry = log_entry
+        # The command keeps its own copy with the entry's log_id, which undo/redo and the journal find it by
+        self.log_entry = log_entry if "log_id" in log_entry else dict(log_entry, log_id=new_log_id())
         self.student_id = student_id
 
     def execute(self):
         # Behavior/Quiz logs go into self.app.behavior_log
-        if not any(le == self.log_entry for le in self.app.behavior_log):
-            self.app.behavior_log.append(self.log_entry.copy())
-            self.app.behavior_log.sort(key=lambda x: x.get("timestamp", ""))
+        self.app.log_store.add("behavior", self.log_entry)
         self.app.update_student_display_text(self.student_id)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
         log_type = self.log_entry.get("type", "behavior")
         behavior_name = self.log_entry.get("behavior", "Unknown")
         student_name = self.app.students.get(self.student_id, {}).get('full_name', 'Unknown Student')
         self.app.update_status(f"{log_type.capitalize()} '{behavior_name}' logged for {student_name}.")
 
     def undo(self):
-        try:
-            self.app.behavior_log.remove(self.log_entry)
-        except ValueError:
-            for i, entry in enumerate(self.app.behavior_log):
-                if entry["timestamp"] == self.log_entry["timestamp"] and \
-                   entry["student_id"] == self.log_entry["student_id"] and \
-                   entry["behavior"] == self.log_entry["behavior"]:
-                    del self.app.behavior_log[i]; break
+        self.app.log_store.remove("behavior", self.log_entry) # Falls back to matching timestamp, student and behavior
         self.app.update_student_display_text(self.student_id)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
         log_type = self.log_entry.get("type", "behavior")
         behavior_name = self.log_entry.get("behavior", "Unknown")
         student_name = self.app.students.get(self.student_id, {}).get('full_name', 'Unknown Student')
         self.app.update_status(f"Undid log of {log_type.capitalize()} '{behavior_name}' for {student_name}.")
 
+    def redraw_scope(self): return {self.student_id, REDRAW_STAT_BOXES}
     def _get_data_for_serialization(self): return {'log_entry': self.log_entry, 'student_id': self.student_id}
     @classmethod
     def _from_serializable_data(cls, app, data, timestamp): return cls(app, data['log_entry'], data['student_id'], timestamp)
@@ -526,34 +533,27 @@ class LogEntryCommand(Command): # For Behavior and Quiz logs
 class LogHomeworkEntryCommand(Command): # New for Homework logs
     def __init__(self, app, log_entry, student_id, timestamp=None):
         super().__init__(app, timestamp)
-        self.log_entry = log_entry
+        self.log_entry = log_entry if "log_id" in log_entry else dict(log_entry, log_id=new_log_id()) # See LogEntryCommand
         self.student_id = student_id
 
     def execute(self):
         # Homework logs go into self.app.homework_log
-        if not any(le == self.log_entry for le in self.app.homework_log):
-            self.app.homework_log.append(self.log_entry.copy())
-            self.app.homework_log.sort(key=lambda x: x.get("timestamp", ""))
-        self.app.update_student_display_text(self.student_id) # Redraw student box
+        self.app.log_store.add("homework", self.log_entry)
+        self.app.update_student_display_text(self.student_id)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True) # Redraw student box
         homework_name = self.log_entry.get("homework_type", self.log_entry.get("behavior", "Unknown Homework")) # Use "homework_type" or "behavior"
         student_name = self.app.students.get(self.student_id, {}).get('full_name', 'Unknown Student')
         self.app.update_status(f"Homework '{homework_name}' logged for {student_name}.")
 
     def undo(self):
-        try:
-            self.app.homework_log.remove(self.log_entry)
-        except ValueError:
-            for i, entry in enumerate(self.app.homework_log):
-                 # Match based on key fields for homework
-                if entry["timestamp"] == self.log_entry["timestamp"] and \
-                   entry["student_id"] == self.log_entry["student_id"] and \
-                   entry.get("homework_type", entry.get("behavior")) == self.log_entry.get("homework_type", self.log_entry.get("behavior")):
-                    del self.app.homework_log[i]; break
+        self.app.log_store.remove("homework", self.log_entry) # Falls back to matching timestamp, student and homework type
         self.app.update_student_display_text(self.student_id)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
         homework_name = self.log_entry.get("homework_type", self.log_entry.get("behavior", "Unknown Homework"))
         student_name = self.app.students.get(self.student_id, {}).get('full_name', 'Unknown Student')
         self.app.update_status(f"Undid log of homework '{homework_name}' for {student_name}.")
 
+    def redraw_scope(self): return {self.student_id, REDRAW_STAT_BOXES}
     def _get_data_for_serialization(self): return {'log_entry': self.log_entry, 'student_id': self.student_id}
     @classmethod
     def _from_serializable_data(cls, app, data, timestamp): return cls(app, data['log_entry'], data['student_id'], timestamp)
@@ -589,7 +589,8 @@ class EditItemCommand(Command):
                 self.app.update_status(f"Furniture '{data_source[self.item_id]['name']}' edited.")
             elif self.item_type == 'stat_box':
                 self.app.update_status(f"Stat Box '{data_source[self.item_id]['name']}' edited.")
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.update_spatial_index(self.item_id)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
     def undo(self):
         if self.item_type == 'student':
@@ -610,8 +611,10 @@ class EditItemCommand(Command):
                 self.app.update_status(f"Undid edit for furniture '{data_source[self.item_id]['name']}'.")
             elif self.item_type == 'stat_box':
                 self.app.update_status(f"Undid edit for stat box '{data_source[self.item_id]['name']}'.")
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.update_spatial_index(self.item_id)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
+    def redraw_scope(self): return {self.item_id}
     def _get_data_for_serialization(self):
         return {
             'item_id': self.item_id, 'item_type': self.item_type,
@@ -658,18 +661,20 @@ class ChangeItemsSizeCommand(Command):
                     data_source[item_id]['width'] = w
                     data_source[item_id]['height'] = h
                 changed_item_names.append(data_source[item_id].get('full_name', data_source[item_id].get('name', item_id)))
+        self.app.update_spatial_index(*self.redraw_scope())
         return changed_item_names
 
     def execute(self):
         names = self._apply_sizes(use_new_sizes=True)
         self.app.update_status(f"Size changed for {len(names)} item(s): {', '.join(names[:3])}{'...' if len(names)>3 else ''}.")
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
     def undo(self):
         names = self._apply_sizes(use_new_sizes=False)
         self.app.update_status(f"Undid size change for {len(names)} item(s): {', '.join(names[:3])}{'...' if len(names)>3 else ''}.")
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
+    def redraw_scope(self): return {item_size_info['id'] for item_size_info in self.items_sizes_changes}
     def _get_data_for_serialization(self): return {'items_sizes_changes': self.items_sizes_changes}
     @classmethod
     def _from_serializable_data(cls, app, data, timestamp): return cls(app, data['items_sizes_changes'], timestamp)
@@ -690,7 +695,7 @@ class MarkLiveQuizQuestionCommand(Command):
         current_score["total_asked"] += 1
         if self.action_taken == "correct": current_score["correct"] += 1
         self.app.live_quiz_scores[self.student_id] = current_score
-        self.app.draw_single_student(self.student_id)
+        self.app.request_redraw(self.redraw_scope())
         student_name = self.app.students[self.student_id]['full_name']
         self.app.update_status(f"Live Quiz: '{self.action_taken.capitalize()}' for {student_name}. Score: {current_score['correct']}/{current_score['total_asked']}")
 
@@ -704,12 +709,13 @@ class MarkLiveQuizQuestionCommand(Command):
             current_score["total_asked"] -= 1
             if self.action_taken == "correct": current_score["correct"] -= 1
             if current_score["total_asked"] <= 0: del self.app.live_quiz_scores[self.student_id]
-        self.app.draw_single_student(self.student_id)
+        self.app.request_redraw(self.redraw_scope())
         student_name = self.app.students[self.student_id]['full_name']
         score_info = self.app.live_quiz_scores.get(self.student_id)
         status = f"Undo Live Quiz Mark for {student_name}. Score: {score_info['correct']}/{score_info['total_asked']}" if score_info else f"Undo Live Quiz Mark for {student_name}. No questions marked."
         self.app.update_status(status)
 
+    def redraw_scope(self): return {self.student_id}
     def _get_data_for_serialization(self):
         return {'student_id': self.student_id, 'action_taken': self.action_taken, 'previous_student_score_state': self.previous_student_score_state}
     @classmethod
@@ -744,7 +750,7 @@ class MarkLiveHomeworkCommand(Command): # New for Live Homework
             current_hw_data["selected_options"] = list(self.homework_actions) # Ensure it's a list
 
         self.app.live_homework_scores[self.student_id] = current_hw_data
-        self.app.draw_single_student(self.student_id) # Redraw to update display
+        self.app.request_redraw(self.redraw_scope()) # Redraw to update display
         student_name = self.app.students[self.student_id]['full_name']
         self.app.update_status(f"Live Homework updated for {student_name}.")
 
@@ -756,10 +762,11 @@ class MarkLiveHomeworkCommand(Command): # New for Live Homework
         elif self.student_id in self.app.live_homework_scores: # Should not happen if previous_homework_state was set
             del self.app.live_homework_scores[self.student_id]
 
-        self.app.draw_single_student(self.student_id)
+        self.app.request_redraw(self.redraw_scope())
         student_name = self.app.students[self.student_id]['full_name']
         self.app.update_status(f"Undo Live Homework update for {student_name}.")
 
+    def redraw_scope(self): return {self.student_id}
     def _get_data_for_serialization(self):
         return {
             'student_id': self.student_id,
@@ -806,9 +813,7 @@ class ChangeItemStyleCommand(Command):
 
             if self.item_type == 'student':
                 self.app.update_student_display_text(self.item_id)
-                self.app.draw_single_student(self.item_id, check_collisions=True)
-            elif self.item_type == 'stat_box':
-                self.app.draw_single_stat_box(self.item_id)
+            self.app.request_redraw(self.redraw_scope(), check_collisions=True)
             self.app.update_status(f"Style '{self.style_property}' updated for {item.get('full_name', item.get('name'))}.")
 
     def undo(self):
@@ -828,11 +833,11 @@ class ChangeItemStyleCommand(Command):
 
             if self.item_type == 'student':
                 self.app.update_student_display_text(self.item_id)
-                self.app.draw_single_student(self.item_id, check_collisions=True)
-            elif self.item_type == 'stat_box':
-                self.app.draw_single_stat_box(self.item_id)
+            self.app.request_redraw(self.redraw_scope(), check_collisions=True)
             self.app.update_status(f"Undid style '{self.style_property}' change for {item.get('full_name', item.get('name'))}.")
 
+    def redraw_scope(self): return {self.item_id}
+
     def _get_data_for_serialization(self):
         return {'item_id': self.item_id, 'item_type': self.item_type, 'style_property': self.style_property, 'old_value': self.old_value, 'new_value': self.new_value}
 
@@ -872,7 +877,7 @@ class ManageStudentGroupCommand(Command):
         self.app.next_group_id_num = self.new_next_group_id_num
         self.app.settings["next_group_id_num"] = self.new_next_group_id_num
         self.app.save_student_groups()
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
         self.app.update_status("Student groups updated.")
 
     def undo(self):
@@ -885,7 +890,7 @@ class ManageStudentGroupCommand(Command):
         self.app.next_group_id_num = self.old_next_group_id_num
         self.app.settings["next_group_id_num"] = self.old_next_group_id_num
         self.app.save_student_groups()
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
         self.app.update_status("Student group update undone.")
 
     def _get_data_for_serialization(self):
@@ -916,13 +921,13 @@ class ResetSettingsCommand(Command):
         self.new_settings = {k: v.copy() if isinstance(v, (dict, list)) else v for k, v in self.app.settings.items()}
         
         self.app.update_status("Settings reset to default.")
-        self.app.draw_all_items(check_collisions_on_redraw=True)
+        self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
     def undo(self):
         if self.old_settings is not None:
             self.app.settings = self.old_settings.copy()
             self.app.update_status("Undo settings reset.")
-            self.app.draw_all_items(check_collisions_on_redraw=True)
+            self.app.request_redraw(self.redraw_scope(), check_collisions=True)
 
     def _get_data_for_serialization(self):
         return {
@@ -940,6 +945,58 @@ class ResetSettingsCommand(Command):
     def get_description(self):
         return "Reset All Settings"
 
+class CompositeCommand(Command):
+    """
+    Several commands executed, undone and redone as one history entry (e.g. a behavior logged for
+    a whole selection, or the scores logged at the end of a live quiz). The sub-commands only change
+    state and request redraws, which coalesce into one paint; the app saves once for the composite.
+    If a sub-command fails, the ones already applied are rolled back before the error is raised.
+    """
+    def __init__(self, app, commands, description=None, timestamp=None):
+        super().__init__(app, timestamp)
+        self.commands = list(commands)
+        self.description = description
+
+    def _run(self, commands, forward):
+        done = []
+        try:
+            for command in commands:
+                if forward: command.execute()
+                else: command.undo()
+                done.append(command)
+        except Exception:
+            for command in reversed(done):
+                if forward: command.undo()
+                else: command.execute()
+            raise
+
+    def execute(self):
+        self._run(self.commands, forward=True)
+        if self.description: self.app.update_status(f"{self.description} ({len(self.commands)} changes).")
+
+    def undo(self):
+        self._run(list(reversed(self.commands)), forward=False)
+        if self.description: self.app.update_status(f"Undid {self.description} ({len(self.commands)} changes).")
+
+    def contains_any(self, command_types):
+        return any(isinstance(command, command_types) for command in self.commands)
+
+    def contains_only(self, command_types):
+        return bool(self.commands) and all(isinstance(command, command_types) for command in self.commands)
+
+    def redraw_scope(self):
+        scope = set()
+        for command in self.commands: scope |= command.redraw_scope()
+        return scope
+    def _get_data_for_serialization(self):
+        return {'commands': [command.to_dict() for command in self.commands], 'description': self.description}
+    @classmethod
+    def _from_serializable_data(cls, app, data, timestamp):
+        commands = [Command.from_dict(app, command_data) for command_data in data['commands']]
+        return cls(app, [command for command in commands if command is not None], data.get('description'), timestamp)
+    def get_description(self):
+        return self.description or f"{len(self.commands)} changes"
+
 # --- Main Execution ---
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,386 @@
+import json
+import tkinter as tk
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from log_store import BEHAVIOR_LOG_TYPES, to_epoch
+
+
+LIVE_RULE_TYPES = ("live_quiz_response", "live_homework_yes_no", "live_homework_select")
+
+# Colors a student box gets from the conditional formatting rules: fill/outline replace the box
+# colors when not None, stripes is the list of {"fill", "outline"} of the rules that apply.
+StudentFormatting = namedtuple("StudentFormatting", ["fill", "outline", "stripes"])
+NO_FORMATTING = StudentFormatting(None, None, [])
+
+
+class CompiledRule:
+    """
+    A conditional formatting rule with its settings read and parsed once. The enabled flag,
+    active modes and active times are checked by the engine from its context; matches()
+    evaluates the rule itself for one student and returns (matched, expires_at), where
+    expires_at is the epoch time at which a match stops holding by itself (or None).
+    """
+    uses_logs = False
+
+    def __init__(self, rule, position):
+        self.rule = rule
+        self.position = position
+        self.type = rule.get("type")
+        self.enabled = rule.get("enabled", True)
+        self.active_modes = frozenset(rule.get("active_modes", []))
+        self.time_slots = [(frozenset(slot.get("days_of_week", range(7))), slot.get("start_time"), slot.get("end_time"))
+                           for slot in rule.get("active_times", [])]
+        self.colors = {"fill": rule.get("color") or None, "outline": rule.get("outline") or None}
+        self.has_colors = bool(self.colors["fill"] or self.colors["outline"])
+        self.application_style = rule.get("application_style")
+
+    def in_active_time(self, now):
+        current_time_str, current_day_of_week = now.strftime("%H:%M"), now.weekday()
+        return any(current_day_of_week in days and start and end and start <= current_time_str < end
+                   for days, start, end in self.time_slots)
+
+    def time_boundaries(self, day):
+        """The datetimes on day (a date) at which one of the time slots may start or end."""
+        boundaries = []
+        for days, start, end in self.time_slots:
+            if day.weekday() not in days: continue
+            for time_str in (start, end):
+                try: hours, minutes = (int(part) for part in time_str.split(":"))
+                except (AttributeError, ValueError): continue
+                boundaries.append(datetime.combine(day, datetime.min.time()) + timedelta(hours=hours, minutes=minutes))
+        return boundaries
+
+    def matches(self, engine, student_id, now):
+        return False, None
+
+
+class BehaviorCountRule(CompiledRule):
+    uses_logs = True
+
+    def __init__(self, rule, position):
+        super().__init__(rule, position)
+        self.behavior_name = rule.get("behavior_name", "")
+        self.count_threshold = rule.get("count_threshold", 1)
+        self.window_seconds = timedelta(hours=rule.get("time_window_hours", 24)).total_seconds()
+
+    def matches(self, engine, student_id, now):
+        # Only counted while recent incidents are shown on the boxes, as they always have been
+        if not self.behavior_name: return False, None
+        if self.count_threshold <= 0: return True, None
+        if not engine.context.incidents_visible: return False, None
+        window = engine.app.log_store.window_times("behavior", student_id, self.behavior_name,
+                                                   to_epoch(now) - self.window_seconds, BEHAVIOR_LOG_TYPES)
+        if len(window) < self.count_threshold: return False, None
+        # The match holds until the oldest of the newest count_threshold logs leaves the window
+        return True, window[-self.count_threshold] + self.window_seconds
+
+
+class QuizScoreThresholdRule(CompiledRule):
+    uses_logs = True
+    COMPARISONS = {"<=": lambda a, b: a <= b, ">=": lambda a, b: a >= b, "==": lambda a, b: abs(a - b) < 0.01,
+                   "<": lambda a, b: a < b, ">": lambda a, b: a > b}
+
+    def __init__(self, rule, position):
+        super().__init__(rule, position)
+        self.compare = self.COMPARISONS.get(rule.get("operator", "<="))
+        self.quiz_name_contains = rule.get("quiz_name_contains", "").lower()
+        self.score_threshold_percent = rule.get("score_threshold_percent", 50.0)
+
+    def matches(self, engine, student_id, now):
+        if self.compare is None: return False, None
+        for log_entry in engine.app.log_store.logs_for_student("behavior", student_id, ("quiz",)):
+            if self.quiz_name_contains and self.quiz_name_contains not in log_entry.get("behavior", "").lower(): continue
+            score_percentage = engine.app._calculate_quiz_score_percentage(log_entry)
+            if score_percentage is not None and self.compare(score_percentage, self.score_threshold_percent): return True, None
+        return False, None
+
+
+class QuizMarkCountRule(CompiledRule):
+    uses_logs = True
+    COMPARISONS = dict(QuizScoreThresholdRule.COMPARISONS, **{"==": lambda a, b: a == b, "!=": lambda a, b: a != b})
+
+    def __init__(self, rule, position):
+        super().__init__(rule, position)
+        self.compare = self.COMPARISONS.get(rule.get("mark_operator", ">="))
+        self.quiz_name_contains = rule.get("quiz_name_contains", "").lower()
+        self.mark_type_id = rule.get("mark_type_id")
+        self.count_threshold = rule.get("mark_count_threshold", 1)
+
+    def matches(self, engine, student_id, now):
+        if not self.mark_type_id or self.compare is None: return False, None
+        for log_entry in engine.app.log_store.logs_for_student("behavior", student_id, ("quiz",)):
+            if self.quiz_name_contains and self.quiz_name_contains not in log_entry.get("behavior", "").lower(): continue
+            actual_count = log_entry.get("marks_data", {}).get(self.mark_type_id, 0)
+            if not isinstance(actual_count, (int, float)): actual_count = 0
+            if self.compare(actual_count, self.count_threshold): return True, None
+        return False, None
+
+
+class LiveQuizResponseRule(CompiledRule):
+    def __init__(self, rule, position, quiz_mark_types):
+        super().__init__(rule, position)
+        self.quiz_response = rule.get("quiz_response")
+        # How each mark type counts ("Correct"/"Incorrect"), worked out once instead of for every box
+        self.response_types = {}
+        for mark_type in quiz_mark_types:
+            if mark_type["id"] in self.response_types: continue
+            name, points = mark_type["name"].lower(), mark_type.get("default_points", 0)
+            if "correct" in name or "bonus" in name or points > 0: self.response_types[mark_type["id"]] = "Correct"
+            elif "incorrect" in name or points == 0: self.response_types[mark_type["id"]] = "Incorrect"
+            else: self.response_types[mark_type["id"]] = ""
+
+    def matches(self, engine, student_id, now):
+        student_live_score = engine.app.live_quiz_scores.get(student_id) if engine.context.live_quiz_active else None
+        if not student_live_score: return False, None
+        response_type = self.response_types.get(student_live_score.get("last_response_details"), "")
+        return bool(response_type and self.quiz_response and response_type == self.quiz_response), None
+
+
+class LiveHomeworkYesNoRule(CompiledRule):
+    def matches(self, engine, student_id, now):
+        context = engine.context
+        if not context.live_homework_active or context.live_homework_session_mode != "Yes/No": return False, None
+        student_hw_data = engine.app.live_homework_scores.get(student_id)
+        if student_hw_data is None: return False, None
+        homework_type_id = self.rule.get("homework_type_id")
+        return bool(homework_type_id in student_hw_data and student_hw_data[homework_type_id] == self.rule.get("homework_response")), None
+
+
+class LiveHomeworkSelectRule(CompiledRule):
+    def matches(self, engine, student_id, now):
+        context = engine.context
+        if not context.live_homework_active or context.live_homework_session_mode != "Select": return False, None
+        student_hw_data = engine.app.live_homework_scores.get(student_id)
+        if student_hw_data is None: return False, None
+        return bool("selected_options" in student_hw_data and self.rule.get("homework_option_name") in student_hw_data["selected_options"]), None
+
+
+RULE_CLASSES = {"behavior_count": BehaviorCountRule, "quiz_score_threshold": QuizScoreThresholdRule, "quiz_mark_count": QuizMarkCountRule,
+                "live_homework_yes_no": LiveHomeworkYesNoRule, "live_homework_select": LiveHomeworkSelectRule}
+
+def compile_rule(rule, position, quiz_mark_types=()):
+    """CompiledRule for a non-group rule; unknown rule types never match."""
+    if rule.get("type") == "live_quiz_response": return LiveQuizResponseRule(rule, position, quiz_mark_types)
+    return RULE_CLASSES.get(rule.get("type"), CompiledRule)(rule, position)
+
+FormattingContext = namedtuple("FormattingContext", ["effective_mode", "live_quiz_active", "live_homework_active",
+                                                     "live_homework_session_mode", "incidents_visible", "groups_enabled"])
+
+
+class ConditionalFormattingEngine:
+    """
+    Works out the colors the conditional formatting rules give each student box.
+
+    The rules in settings are compiled into CompiledRule objects grouped by how they are applied
+    (group base colors, live session overrides, stripes), and recompiled only when the rules or
+    the settings they read change. The app-wide inputs (mode, live sessions) are read once per
+    render pass in begin_pass(). The result for a student is cached and reused until something it
+    depends on changes: the rules, that context, the student's group, their logs
+    (LogStore.student_revision), their live session marks, or the moment a time-windowed count
+    stops matching. For that moment a timer is scheduled that repaints just that student's box.
+
+    Rules with active times are switched on and off by one timer set for the next start or end
+    time across all of them; when it fires, only the students matched by the rules that flipped
+    are re-evaluated and repainted.
+    """
+    EXPIRY_BUFFER_MS = 50 # Fire just after the oldest log has left the window (or the time slot has changed)
+    BOUNDARY_LOOKAHEAD_DAYS = 7 # Time slots repeat weekly
+    def __init__(self, app):
+        self.app = app
+        self.revision = 0 # Bumped on every compile
+        self.context = None
+        self._fingerprint = None
+        self._context_key = None
+        self._group_rules = {} # {group_id: rule}, the first rule for each group
+        self._override_rules = [] # Live session rules applied instead of everything else
+        self._stripe_rules = [] # Every other non-group rule, in settings order
+        self._uses_logs = False
+        self._uses_live_quiz = self._uses_live_homework = False
+        self._time_rules = [] # Rules limited to active times
+        self.active_time_rules = frozenset() # Positions of the time-limited rules inside one of their slots now
+        self._results = {} # {student_id: (dependency key, expires_at, StudentFormatting)}
+        self._expiry_timers = {} # {student_id: (expires_at, Tk after ID)}
+        self._boundary_timer = None # (boundary datetime, Tk after ID)
+
+    # --- Compiling ---
+    def _sync_rules(self):
+        settings = self.app.settings
+        rules = settings.get("conditional_formatting_rules", [])
+        quiz_mark_types = settings.get("quiz_mark_types", [])
+        try: fingerprint = json.dumps([rules, quiz_mark_types], sort_keys=True, default=str)
+        except (TypeError, ValueError): fingerprint = None # Not comparable; recompile every pass
+        if fingerprint is not None and fingerprint == self._fingerprint: return
+        self._fingerprint = fingerprint
+        self.compile(rules, quiz_mark_types)
+
+    def compile(self, rules, quiz_mark_types=()):
+        self._group_rules, self._override_rules, self._stripe_rules = {}, [], []
+        for position, rule in enumerate(rules):
+            rule_type = rule.get("type")
+            if rule_type == "group":
+                self._group_rules.setdefault(rule.get("group_id"), rule)
+                continue
+            compiled = compile_rule(rule, position, quiz_mark_types)
+            if rule_type in LIVE_RULE_TYPES and compiled.application_style == "override": self._override_rules.append(compiled)
+            if rule_type not in LIVE_RULE_TYPES or compiled.application_style == "stripe": self._stripe_rules.append(compiled)
+        compiled_rules = self._override_rules + self._stripe_rules
+        self._uses_logs = any(compiled.uses_logs for compiled in compiled_rules)
+        self._uses_live_quiz = any(compiled.type == "live_quiz_response" for compiled in compiled_rules)
+        self._uses_live_homework = any(compiled.type in LIVE_RULE_TYPES[1:] for compiled in compiled_rules)
+        self._time_rules = [compiled for compiled in compiled_rules if compiled.time_slots]
+        now = datetime.now()
+        self.active_time_rules = frozenset(compiled.position for compiled in self._time_rules if compiled.in_active_time(now))
+        self.revision += 1
+        self._results.clear()
+        self.schedule_time_boundary()
+
+    # --- Context ---
+    def begin_pass(self):
+        """Re-reads the rules and the app-wide inputs; call once before drawing the students of a pass."""
+        app = self.app
+        self._sync_rules()
+        current_app_mode = app.mode_var.get()
+        effective_mode = current_app_mode
+        if current_app_mode == "quiz" and app.is_live_quiz_active: effective_mode = "quiz_session"
+        elif current_app_mode == "homework" and app.is_live_homework_active: effective_mode = "homework_session"
+        self.context = FormattingContext(
+            effective_mode, app.is_live_quiz_active, app.is_live_homework_active, app.settings.get("live_homework_session_mode"),
+            not app._recent_incidents_hidden_globally and app.settings.get("show_recent_incidents_on_boxes", True),
+            app.settings.get("student_groups_enabled", True))
+        self._context_key = (self.revision, self.context)
+
+    def invalidate(self, student_id=None):
+        """Drops the cached result of student_id (or of every student)."""
+        if student_id is None: self._results.clear()
+        else: self._results.pop(student_id, None)
+
+    # --- Evaluation ---
+    def _gate(self, compiled, check_time=True):
+        if not compiled.enabled: return False
+        if compiled.active_modes and self.context.effective_mode not in compiled.active_modes: return False
+        return not check_time or not compiled.time_slots or compiled.position in self.active_time_rules
+
+    def _applies(self, compiled, student_id, now):
+        if not self._gate(compiled): return False, None
+        return compiled.matches(self, student_id, now)
+
+    def formatting_for(self, student_id):
+        """StudentFormatting of student_id, from the cache while none of its inputs changed."""
+        app = self.app
+        student = app.students.get(student_id)
+        if student is None:
+            self._results.pop(student_id, None); self._schedule_expiry(student_id, None)
+            return NO_FORMATTING
+        if self.context is None: self.begin_pass()
+        context = self.context
+        group_id = student.get("group_id")
+        key = (self._context_key, group_id, group_id in app.student_groups,
+               app.log_store.student_revision("behavior", student_id) if self._uses_logs else None,
+               repr(app.live_quiz_scores.get(student_id)) if self._uses_live_quiz and context.live_quiz_active else None,
+               repr(app.live_homework_scores.get(student_id)) if self._uses_live_homework and context.live_homework_active else None)
+        cached = self._results.get(student_id)
+        now = datetime.now()
+        if cached is not None and cached[0] == key and (cached[1] is None or to_epoch(now) < cached[1]): return cached[2]
+
+        formatting, expires_at = self._evaluate(student_id, group_id, now)
+        self._results[student_id] = (key, expires_at, formatting)
+        self._schedule_expiry(student_id, expires_at)
+        return formatting
+
+    # --- Expiry timers ---
+    def _schedule_expiry(self, student_id, expires_at):
+        """Keeps one timer per student for the moment its cached result stops holding (none if expires_at is None)."""
+        timer = self._expiry_timers.get(student_id)
+        if timer is not None:
+            if timer[0] == expires_at: return
+            try: self.app.root.after_cancel(timer[1])
+            except (AttributeError, tk.TclError): pass
+            del self._expiry_timers[student_id]
+        if expires_at is None: return
+        delay_ms = max(0, int((expires_at - to_epoch(datetime.now())) * 1000)) + self.EXPIRY_BUFFER_MS
+        try: after_id = self.app.root.after(delay_ms, lambda: self._on_expiry(student_id))
+        except (AttributeError, tk.TclError): return # No Tk loop; re-evaluated on the next draw
+        self._expiry_timers[student_id] = (expires_at, after_id)
+
+    # --- Time slot boundaries ---
+    def next_time_boundary(self, now):
+        """The first moment after now at which a time-limited rule may turn on or off, or None."""
+        if not self._time_rules: return None
+        for day_offset in range(self.BOUNDARY_LOOKAHEAD_DAYS + 1):
+            day = now.date() + timedelta(days=day_offset)
+            upcoming = [boundary for compiled in self._time_rules for boundary in compiled.time_boundaries(day) if boundary > now]
+            if upcoming: return min(upcoming)
+        return None
+
+    def schedule_time_boundary(self):
+        """Sets the one timer for the next time slot boundary, replacing any earlier one."""
+        if self._boundary_timer is not None:
+            try: self.app.root.after_cancel(self._boundary_timer[1])
+            except (AttributeError, tk.TclError): pass
+            self._boundary_timer = None
+        now = datetime.now()
+        boundary = self.next_time_boundary(now)
+        if boundary is None: return
+        delay_ms = int((boundary - now).total_seconds() * 1000) + self.EXPIRY_BUFFER_MS
+        try: self._boundary_timer = (boundary, self.app.root.after(delay_ms, self._on_time_boundary))
+        except (AttributeError, tk.TclError): pass
+
+    def refresh_active_times(self, now=None):
+        """
+        Re-checks which time-limited rules are active and drops the cached results of the students
+        matched by the rules that flipped. Returns the IDs of those students.
+        """
+        now = now or datetime.now()
+        active = frozenset(compiled.position for compiled in self._time_rules if compiled.in_active_time(now))
+        flipped, self.active_time_rules = active ^ self.active_time_rules, active
+        if not flipped: return set()
+        if self.context is None: self.begin_pass()
+        affected = set()
+        for compiled in self._time_rules:
+            if compiled.position not in flipped or not self._gate(compiled, check_time=False): continue
+            affected.update(student_id for student_id in self.app.students if compiled.matches(self, student_id, now)[0])
+        for student_id in affected: self._results.pop(student_id, None)
+        return affected
+
+    def _on_time_boundary(self):
+        self._boundary_timer = None
+        affected = self.refresh_active_times()
+        if affected: self.app.request_redraw(affected)
+        self.schedule_time_boundary()
+
+    def _on_expiry(self, student_id):
+        self._expiry_timers.pop(student_id, None)
+        self._results.pop(student_id, None)
+        if student_id in self.app.students: self.app.request_redraw({student_id})
+
+    def _evaluate(self, student_id, group_id, now):
+        app, context = self.app, self.context
+        fill = outline = None
+        expiries = []
+        if context.groups_enabled and group_id and group_id in app.student_groups and group_id in self._group_rules:
+            group_rule = self._group_rules[group_id] # The first rule for the group sets the base colors
+            fill, outline = group_rule.get("color") or None, group_rule.get("outline") or None
+
+        if context.live_quiz_active or context.live_homework_active:
+            for compiled in self._override_rules:
+                matched, _ = self._applies(compiled, student_id, now)
+                if matched:
+                    return StudentFormatting(compiled.colors["fill"] or fill, compiled.colors["outline"] or outline, []), None
+
+        stripes = []
+        for compiled in self._stripe_rules:
+            matched, expires_at = self._applies(compiled, student_id, now)
+            if expires_at is not None: expiries.append(expires_at)
+            if matched and compiled.has_colors: stripes.append(dict(compiled.colors))
+        return StudentFormatting(fill, outline, stripes), min(expiries) if expiries else None
+
+    def rule_applies(self, student_id, rule):
+        """Whether one rule (compiled on the spot, not cached) applies to student_id now."""
+        if rule.get("type") == "group" or student_id not in self.app.students: return False
+        if self.context is None: self.begin_pass()
+        compiled = compile_rule(rule, -1, self.app.settings.get("quiz_mark_types", []))
+        now = datetime.now()
+        if compiled.time_slots and not compiled.in_active_time(now): return False
+        if not compiled.enabled or (compiled.active_modes and self.context.effective_mode not in compiled.active_modes): return False
+        return compiled.matches(self, student_id, now)[0]
@@ -1910,7 +1910,7 @@ class ManageStudentGroupsDialog(simpledialog.Dialog):
         # Changes are applied directly, so just set the flag if it was ever true
         self.result = self.groups_changed_flag
         if self.groups_changed_flag:
-            self.app.draw_all_items(check_collisions_on_redraw=True) # Redraw if groups changed
+            self.app.request_redraw(check_collisions=True) # Redraw if groups changed
             self.app.save_student_groups() # Save groups if changed
 
 class AssignStudentsToGroupSubDialog(simpledialog.Dialog):
@@ -0,0 +1,126 @@
+import tempfile
+from typing import Any, NamedTuple
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import get_column_letter
+
+
+# Shared named styles of the exported workbooks; every styled cell refers to one of these
+# by name instead of carrying its own Font/Alignment objects.
+EXPORT_STYLES = {
+    "export_header": (Font(bold=True), Alignment(horizontal='center', vertical='center', wrap_text=True)),
+    "export_column_header": (Font(bold=True), Alignment(horizontal='center')),
+    "export_left": (DEFAULT_FONT, Alignment(horizontal='left', vertical='center', wrap_text=True)),
+    "export_right": (DEFAULT_FONT, Alignment(horizontal='right', vertical='center', wrap_text=False)),
+    "export_title": (Font(bold=True, size=14), Alignment()),
+    "export_section": (Font(bold=True), Alignment()),
+    "export_subheader": (Font(italic=True), Alignment()),
+}
+
+
+class ExportCell(NamedTuple):
+    """A value written with one of the EXPORT_STYLES."""
+    value: Any
+    style: str
+
+
+class ColumnWidths:
+    """
+    Longest text per column, measured as rows are built so the widths can be set
+    without reading the cells back: (longest + 2) * 1.2, clamped to
+    [minimum, maximum].
+    """
+    def __init__(self, minimum=10, maximum=50):
+        self.minimum, self.maximum = minimum, maximum
+        self._lengths = [] # Index 0 is column 1
+
+    def measure(self, row):
+        lengths = self._lengths
+        if len(row) > len(lengths): lengths.extend([0] * (len(row) - len(lengths)))
+        for index, value in enumerate(row):
+            if type(value) is ExportCell: value = value.value
+            if value is None: continue
+            length = len(value) if type(value) is str else len(str(value))
+            if length > lengths[index]: lengths[index] = length
+
+    def widths(self):
+        return {column: min(max((length + 2) * 1.2, self.minimum), self.maximum)
+                for column, length in enumerate(self._lengths, 1)}
+
+
+def row_from_columns(cells):
+    """Turns {column number: value} into a row list, leaving skipped columns empty."""
+    if not cells: return []
+    if min(cells) < 1: raise ValueError("Row or column values must be at least 1")
+    row = [None] * max(cells)
+    for column, value in cells.items(): row[column - 1] = value
+    return row
+
+
+class StreamingWorkbook:
+    """
+    Write-only openpyxl workbook for the exports. Rows go straight to each sheet's
+    temporary file instead of staying in memory as cell objects, so column widths
+    and frozen panes have to be given when the sheet is created.
+
+    on_progress(workbook), if given, is called every progress_every rows and when a
+    sheet is started; if it raises (e.g. a cancelled export job), the temporary files
+    are removed before the exception propagates.
+    """
+    def __init__(self, on_progress=None, progress_every=500):
+        self.workbook = Workbook(write_only=True)
+        self.on_progress = on_progress
+        self.progress_every = progress_every
+        self.rows_written = 0
+        self.sheet_count = 0
+        for name, (font, alignment) in EXPORT_STYLES.items():
+            self.workbook.add_named_style(NamedStyle(name=name, font=font, alignment=alignment))
+
+    def create_sheet(self, title, widths=None, freeze_panes=None):
+        ws = self.workbook.create_sheet(title=title)
+        for column, width in (widths or {}).items():
+            ws.column_dimensions[get_column_letter(column)].width = width
+        if freeze_panes: ws.freeze_panes = freeze_panes
+        self.sheet_count += 1
+        self.report_progress()
+        return ws
+
+    def append(self, ws, row):
+        """Appends a row of plain values and ExportCells to ws."""
+        values = []
+        for value in row:
+            if type(value) is ExportCell:
+                cell = WriteOnlyCell(ws, value=value.value)
+                cell.style = value.style
+                value = cell
+            values.append(value)
+        ws.append(values)
+        self.rows_written += 1
+        if self.rows_written % self.progress_every == 0: self.report_progress()
+
+    def report_progress(self):
+        """Calls on_progress now (it is otherwise called every progress_every rows)."""
+        if self.on_progress is None: return
+        try:
+            self.on_progress(self)
+        except BaseException:
+            self.discard()
+            raise
+
+    def discard(self):
+        """
+        Removes the temporary files of a workbook that will not be saved. openpyxl only
+        removes them when the workbook is saved, so it is saved to an anonymous file
+        that is deleted again on closing.
+        """
+        try:
+            with tempfile.TemporaryFile() as scratch_file:
+                self.workbook.save(scratch_file)
+        except Exception as e:
+            print(f"Could not remove temporary export files: {e}")
+
+    def save(self, file_path):
+        self.workbook.save(file_path)
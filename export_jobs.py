@@ -0,0 +1,153 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import NamedTuple
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work function once the job has been cancelled."""
+
+
+@contextmanager
+def replace_when_written(file_path):
+    """
+    Yields a temporary path next to file_path for an export to write to, and moves it over
+    file_path once the block completes. If the block raises (a cancelled job, a failed
+    write), the temporary file is removed and file_path is left as it was.
+    """
+    temp_path = file_path + ".tmp"
+    try:
+        yield temp_path
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path): os.remove(temp_path)
+        raise
+
+
+class ExportSnapshot(NamedTuple):
+    """
+    What the exporters read from the app, deep-copied on the Tk thread before a job starts
+    so the worker never sees the data change under it.
+    """
+    students: dict
+    settings: dict
+    student_groups: dict
+    all_homework_session_types: list
+    logs: list
+
+
+class ExportJob:
+    """
+    One background export. work(job) runs on the worker thread and calls job.progress()
+    as it goes; progress() raises JobCancelled once cancel() was called, so the work stops
+    at its next report. The callbacks run on the Tk thread (see ExportJobRunner.poll).
+    A quiet job (e.g. an autosave) is not meant to be shown in the progress display.
+    """
+    def __init__(self, name, work, on_done=None, on_error=None, on_cancelled=None, quiet=False):
+        self.name = name
+        self.work = work
+        self.quiet = quiet
+        self.on_done = on_done # on_done(result)
+        self.on_error = on_error # on_error(exception)
+        self.on_cancelled = on_cancelled # on_cancelled()
+        self.state = "queued" # "queued", "running", "done", "failed" or "cancelled"
+        self.message = "Waiting..."
+        self.done, self.total = None, None
+        self._cancel_event = threading.Event()
+        self._post = None # Set by the runner
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set(): raise JobCancelled(self.name)
+
+    def progress(self, message, done=None, total=None):
+        """Reports progress from the worker (done out of total, when known) and stops the job if it was cancelled."""
+        self.check_cancelled()
+        self._post(("progress", self, (message, done, total)))
+
+
+class ExportJobRunner:
+    """
+    Runs export jobs one at a time on a background thread. The worker only ever talks to
+    the UI through a queue: poll(), called from the Tk thread with after(), applies the
+    progress reports and runs each job's callbacks, so no Tk call is made off the Tk thread.
+    """
+    def __init__(self, on_progress=None):
+        self.on_progress = on_progress # on_progress(job), on the Tk thread after each state or progress change
+        self._jobs = queue.Queue()
+        self._events = queue.Queue()
+        self._unfinished = [] # Jobs submitted and not yet reported finished by poll(), in order
+        self._worker = None
+
+    def submit(self, name, work, on_done=None, on_error=None, on_cancelled=None, quiet=False):
+        job = ExportJob(name, work, on_done, on_error, on_cancelled, quiet)
+        job._post = self._events.put
+        self._unfinished.append(job)
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._worker_loop, name="ExportWorker", daemon=True)
+            self._worker.start()
+        self._jobs.put(job)
+        if self.on_progress: self.on_progress(job)
+        return job
+
+    def _worker_loop(self):
+        while True:
+            job = self._jobs.get()
+            if job is None: return
+            if job.cancel_requested:
+                self._events.put(("cancelled", job, None)); continue
+            self._events.put(("running", job, None))
+            try:
+                result = job.work(job)
+            except JobCancelled:
+                self._events.put(("cancelled", job, None))
+            except Exception as e: # Reported back to the UI thread
+                self._events.put(("failed", job, e))
+            else:
+                self._events.put(("done", job, result))
+
+    def poll(self):
+        """Applies the worker's reports and runs the finished jobs' callbacks. Call from the Tk thread."""
+        while True:
+            try: kind, job, payload = self._events.get_nowait()
+            except queue.Empty: return
+            if kind == "progress":
+                if job.state != "running": continue
+                job.message, job.done, job.total = payload
+            else:
+                job.state = kind
+            if kind in ("done", "failed", "cancelled") and job in self._unfinished:
+                self._unfinished.remove(job)
+            if self.on_progress: self.on_progress(job)
+            try:
+                if kind == "done" and job.on_done: job.on_done(payload)
+                elif kind == "failed" and job.on_error: job.on_error(payload)
+                elif kind == "cancelled" and job.on_cancelled: job.on_cancelled()
+            except Exception as e:
+                print(f"Error in export job callback ({job.name}): {e}")
+
+    def active_jobs(self):
+        return list(self._unfinished)
+
+    def cancel_all(self):
+        for job in self._unfinished: job.cancel()
+
+    def shutdown(self, timeout=10):
+        """
+        Cancels every job and stops the worker. Returns False if the running job did not stop in
+        time; the exporters write through replace_when_written, so it leaves no partial file.
+        """
+        self.cancel_all()
+        if self._worker is None: return True
+        self._jobs.put(None)
+        self._worker.join(timeout)
+        stopped = not self._worker.is_alive()
+        self._worker = None
+        return stopped
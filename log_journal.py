@@ -0,0 +1,123 @@
+import os
+import re
+import json
+import cryptography.fernet
+
+from data_encryption import encrypt_data, decrypt_data
+
+
+class LogJournal:
+    """
+    Append-only journal of log commands (behavior/quiz and homework) recorded since
+    the last full save of the main data file.
+
+    Each record is written as one line: the JSON for the record, encrypted with the
+    same Fernet key as the data files (Fernet tokens never contain newlines).
+
+    When a full save snapshot is taken the active journal is sealed into a numbered
+    segment (rotate); the segment is deleted once that snapshot is safely on disk
+    (discard_segments). Segments left behind by a crash are replayed on the next load.
+    """
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self.record_count = 0 # Records in the active journal, i.e. not yet part of any snapshot
+        self._next_segment_num = max([num for num, _ in self._sealed_segments()], default=0) + 1
+        if os.path.exists(journal_path):
+            self.record_count = len(self._read_file(journal_path))
+
+    def _sealed_segments(self):
+        """Returns [(segment_num, path)] for sealed segments, oldest first."""
+        journal_dir = os.path.dirname(self.journal_path) or "."
+        journal_name = os.path.basename(self.journal_path)
+        pattern = re.compile(re.escape(journal_name) + r"\.(\d+)$")
+        segments = []
+        try:
+            for fname in os.listdir(journal_dir):
+                match = pattern.match(fname)
+                if match: segments.append((int(match.group(1)), os.path.join(journal_dir, fname)))
+        except OSError:
+            return []
+        return sorted(segments)
+
+    def append(self, action, command_dict, encrypt=True):
+        """Appends one record. action is 'execute', 'undo' or 'redo'."""
+        record_string = json.dumps({"action": action, "command": command_dict})
+        if encrypt:
+            record_bytes = encrypt_data(record_string)
+        else:
+            record_bytes = record_string.encode('utf-8')
+        with open(self.journal_path, 'ab') as f:
+            f.write(record_bytes + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.record_count += 1
+
+    def _read_file(self, file_path):
+        records = []
+        try:
+            with open(file_path, 'rb') as f:
+                lines = f.read().splitlines()
+        except IOError as e:
+            print(f"Error reading log journal {os.path.basename(file_path)}: {e}")
+            return []
+        for line_num, line in enumerate(lines, 1):
+            if not line.strip(): continue
+            try:
+                try:
+                    record_string = decrypt_data(line)
+                except cryptography.fernet.InvalidToken:
+                    record_string = line.decode('utf-8') # Written while encryption was turned off
+                record = json.loads(record_string)
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                # Most likely a record cut short by a crash mid-write; everything after it is unusable.
+                print(f"Log journal: stopping replay of {os.path.basename(file_path)} at unreadable record {line_num}: {e}")
+                break
+            if isinstance(record, dict) and "action" in record and "command" in record:
+                records.append(record)
+        return records
+
+    def read_records(self):
+        """Returns the records of all sealed segments and the active journal, in the order they were written."""
+        records = []
+        for _, segment_path in self._sealed_segments():
+            records.extend(self._read_file(segment_path))
+        if os.path.exists(self.journal_path):
+            records.extend(self._read_file(self.journal_path))
+        return records
+
+    def has_records(self):
+        return self.record_count > 0
+
+    def rotate(self):
+        """
+        Seals the active journal into a segment and returns every sealed segment path.
+        Called when a full save snapshot is taken; appends after this go to a fresh journal.
+        """
+        if os.path.exists(self.journal_path):
+            segment_path = f"{self.journal_path}.{self._next_segment_num}"
+            try:
+                os.replace(self.journal_path, segment_path)
+                self._next_segment_num += 1
+            except OSError as e:
+                print(f"Could not seal log journal {os.path.basename(self.journal_path)}: {e}")
+                return [path for _, path in self._sealed_segments()]
+        self.record_count = 0
+        return [path for _, path in self._sealed_segments()]
+
+    def discard_segments(self, segment_paths):
+        """Deletes sealed segments whose records are now part of the saved data file."""
+        for segment_path in segment_paths:
+            try:
+                if os.path.exists(segment_path): os.remove(segment_path)
+            except OSError as e:
+                print(f"Could not remove log journal segment {os.path.basename(segment_path)}: {e}")
+
+    def clear(self):
+        """Removes the journal and all sealed segments, e.g. when the data they belong to is replaced."""
+        self.discard_segments([path for _, path in self._sealed_segments()])
+        try:
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+        except OSError as e:
+            print(f"Could not clear log journal {os.path.basename(self.journal_path)}: {e}")
+        self.record_count = 0
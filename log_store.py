@@ -0,0 +1,732 @@
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+import bisect
+import uuid
+import itertools
+import random
+import tempfile
+import time
+import types
+from collections import Counter
+from datetime import datetime, date, timedelta
+from typing import NamedTuple
+import cryptography.fernet
+
+from data_encryption import encrypt_data, decrypt_data
+
+
+LOG_KINDS = ("behavior", "homework")
+_index_generations = itertools.count(1) # Every index built gets a new generation, so revisions never repeat
+BEHAVIOR_LOG_TYPES = ("behavior", "quiz")
+HOMEWORK_LOG_TYPES = ("homework", "homework_session_y", "homework_session_s")
+
+
+class LogTime(NamedTuple):
+    """A parsed log timestamp: the datetime, seconds since 1970-01-01 (wall clock) and the day ordinal."""
+    dt: datetime
+    epoch: float
+    ordinal: int
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+
+def to_epoch(dt):
+    """Seconds since 1970-01-01 of a (wall clock) datetime, comparable with LogTime.epoch."""
+    return (dt.replace(tzinfo=None) - _EPOCH).total_seconds()
+
+def midnight_epoch(ordinal):
+    """to_epoch of the start of the day with the given ordinal."""
+    return (ordinal - _EPOCH_ORDINAL) * 86400
+
+def epoch_ordinal(epoch):
+    """Day ordinal of a to_epoch value (the inverse of midnight_epoch for the start of that day)."""
+    return int(epoch // 86400) + _EPOCH_ORDINAL
+
+def log_time(timestamp):
+    """
+    Parsed form of an ISO log timestamp. Log entries keep their ISO string (the on-disk format); the
+    store parses it when an entry is indexed and keeps the epoch in its per-student index, so its
+    date/time comparisons are number comparisons. Raises ValueError/TypeError for invalid timestamps,
+    like datetime.fromisoformat.
+    """
+    dt = datetime.fromisoformat(timestamp)
+    return LogTime(dt, to_epoch(dt), dt.toordinal())
+
+def entry_log_time(entry):
+    """LogTime of a log entry, or None if it has no valid timestamp."""
+    try: return log_time(entry["timestamp"])
+    except (KeyError, TypeError, ValueError): return None
+
+def new_log_id():
+    return f"log_{uuid.uuid4().hex[:16]}"
+
+def assign_log_ids(log_list):
+    """Gives every entry without one a log_id (logs recorded before IDs existed). Returns how many were assigned."""
+    assigned_count = 0
+    for entry in log_list:
+        if "log_id" not in entry:
+            entry["log_id"] = new_log_id(); assigned_count += 1
+    return assigned_count
+
+def _timestamp_key(entry):
+    return entry.get("timestamp", "")
+
+def _entry_key(entry):
+    """Content key of a log entry, used to find the stored row for an entry again."""
+    return hashlib.sha1(json.dumps(entry, sort_keys=True).encode('utf-8')).hexdigest()
+
+def _entry_name(kind, entry):
+    return entry.get("behavior") if kind == "behavior" else entry.get("homework_type", entry.get("behavior"))
+
+def _same_log_event(kind, a, b):
+    """Loose match used when an entry is no longer equal to its stored copy (same fields the commands' undo used)."""
+    return a.get("timestamp") == b.get("timestamp") and a.get("student_id") == b.get("student_id") and \
+           _entry_name(kind, a) == _entry_name(kind, b)
+
+def database_files(database_path):
+    """The database file and the files SQLite keeps next to it in WAL mode (changes not yet checkpointed)."""
+    return [database_path, database_path + "-wal", database_path + "-shm"]
+
+def remove_database_files(database_path):
+    """Deletes a log database with its WAL files. Its connections must be closed first."""
+    for file_path in database_files(database_path):
+        if os.path.exists(file_path): os.remove(file_path)
+
+def homework_log_completed(entry):
+    """Whether a homework log counts as completed for the completion stat."""
+    if "Done" in entry.get('homework_status', '') or "Complete" in entry.get('homework_status', ''): return True
+    details = entry.get('homework_details', {})
+    if entry.get('type') == 'homework_session_y': return any(value == 'yes' for value in details.values()) # At least one item done
+    if entry.get('type') == 'homework_session_s':
+        return "Done" in details.get('selected_options', []) or "Complete" in details.get('selected_options', [])
+    return False
+
+
+class DayTotals:
+    """
+    Running totals of one day's logs, read by the stat boxes: who is present, behavior logs per
+    name, the quiz score sum/count and completed/total homework. Kept up to date by the store as
+    entries of that day are added and removed, so reading a stat does not scan the logs.
+    """
+    def __init__(self, ordinal, quiz_score):
+        self.ordinal = ordinal
+        self.quiz_score = quiz_score # Callable: quiz log entry -> score percentage or None
+        self.presence = Counter() # {student_id: logs of any kind that day}
+        self.behavior_counts = Counter() # {behavior name: "behavior" logs}
+        self.quiz_scores = {} # {id(entry): score percentage} of the scored quiz logs
+        self.quiz_score_sum = 0.0
+        self.homework_total = 0
+        self.homework_completed = 0
+
+    def apply(self, kind, entry, sign):
+        """Adds (sign 1) or removes (sign -1) one logged entry of this day."""
+        self._count(self.presence, entry["student_id"], sign)
+        if kind == "behavior":
+            if entry.get("type") == "behavior": self._count(self.behavior_counts, entry.get("behavior"), sign)
+            elif entry.get("type") == "quiz":
+                if sign > 0:
+                    score = self.quiz_score(entry)
+                    if score is not None:
+                        self.quiz_scores[id(entry)] = score; self.quiz_score_sum += score
+                else:
+                    score = self.quiz_scores.pop(id(entry), None)
+                    if score is not None: self.quiz_score_sum -= score
+        else:
+            self.homework_total += sign
+            if homework_log_completed(entry): self.homework_completed += sign
+
+    @staticmethod
+    def _count(counter, key, sign):
+        counter[key] += sign
+        if counter[key] <= 0: del counter[key]
+
+    @property
+    def present_student_ids(self):
+        return set(self.presence)
+
+    @property
+    def behavior_total(self):
+        return sum(self.behavior_counts.values())
+
+    @property
+    def quiz_score_count(self):
+        return len(self.quiz_scores)
+
+
+def _day_bounds(start_date=None, end_date=None):
+    """ISO timestamp bounds [start, end) for an inclusive date range; ISO strings sort chronologically."""
+    start_iso = start_date.isoformat() if start_date else None
+    end_iso = (end_date + timedelta(days=1)).isoformat() if end_date else None
+    return start_iso, end_iso
+
+
+class LogStore:
+    """
+    Query and mutation API for the behavior/quiz and homework logs.
+
+    This default store works directly on app.behavior_log and app.homework_log (looked up on
+    every call, as they are replaced on load). Everything that adds or removes log entries, and
+    the per-student, stats, attendance and export queries, go through a store so that the
+    SQLite backend can serve them from indexes instead.
+
+    Per-student lookups (the recent logs drawn on every student box) use an in-memory index,
+    student_id -> (epoch seconds, entries), both sorted by time; each timestamp is parsed once,
+    when its entry is indexed. Mutations made through the
+    store keep it up to date; it is rebuilt if the log list was replaced (load). Everything else,
+    journal replay included, changes the lists only through the store. Each student also has a revision that changes whenever
+    their logs do, so results derived from them can be cached (see student_revision), and the times
+    of their logs are also kept per (type, name) for sliding-window counts (see window_times).
+    The totals of the current day for the stat boxes are kept the same way (see day_totals).
+    """
+    is_persistent = False # True if mutations are already on disk when they return
+
+    def __init__(self, app):
+        self.app = app
+        self._indexes = {} # {kind: {"source": log list, "size": int, "students": {student_id: (times, entries)}, "by_id": {log_id: entry},
+                           #         "generation": int, "mutations": int, "revisions": {student_id: int}, "names": {(student_id, type, name): times}}}
+        self._day_totals = None # DayTotals of the last day asked for
+        self._day_totals_key = None # (day ordinal, behavior index generation, homework index generation)
+
+    def _log_list(self, kind):
+        return self.app.behavior_log if kind == "behavior" else self.app.homework_log
+
+    # --- Indexes ---
+    def _index(self, kind):
+        log_list = self._log_list(kind)
+        index = self._indexes.get(kind)
+        if index is None or index["source"] is not log_list or index["size"] != len(log_list):
+            index = {"kind": kind, "source": log_list, "size": len(log_list), "students": {}, "by_id": {},
+                     "generation": next(_index_generations), "mutations": 0, "revisions": {}, "names": {}}
+            for entry in sorted(log_list, key=_timestamp_key):
+                if "log_id" in entry: index["by_id"][entry["log_id"]] = entry
+                entry_time = entry_log_time(entry)
+                if entry_time is None: continue
+                times, entries = index["students"].setdefault(entry["student_id"], ([], []))
+                times.append(entry_time.epoch); entries.append(entry)
+                index["names"].setdefault(self._name_key(kind, entry), []).append(entry_time.epoch)
+            self._indexes[kind] = index
+        return index
+
+    def _student_index(self, kind):
+        return self._index(kind)["students"]
+
+    @staticmethod
+    def _name_key(kind, entry):
+        return (entry.get("student_id"), entry.get("type"), _entry_name(kind, entry))
+
+    @staticmethod
+    def _touch(index, student_id):
+        index["mutations"] += 1
+        index["revisions"][student_id] = index["revisions"].get(student_id, 0) + 1
+
+    def _index_insert(self, index, entry):
+        self._touch(index, entry.get("student_id"))
+        if "log_id" in entry: index["by_id"][entry["log_id"]] = entry
+        entry_time = entry_log_time(entry)
+        if entry_time is not None:
+            times, entries = index["students"].setdefault(entry["student_id"], ([], []))
+            position = bisect.bisect_right(times, entry_time.epoch)
+            times.insert(position, entry_time.epoch); entries.insert(position, entry)
+            bisect.insort_right(index["names"].setdefault(self._name_key(index["kind"], entry), []), entry_time.epoch)
+            if self._day_totals is not None and entry_time.ordinal == self._day_totals.ordinal:
+                self._day_totals.apply(index["kind"], entry, 1)
+        index["size"] = len(index["source"])
+
+    def _index_remove(self, index, entry):
+        self._touch(index, entry.get("student_id"))
+        index["by_id"].pop(entry.get("log_id"), None)
+        times, entries = index["students"].get(entry.get("student_id"), ([], []))
+        entry_time = entry_log_time(entry)
+        start = bisect.bisect_left(times, entry_time.epoch) if entry_time else 0
+        end = bisect.bisect_right(times, entry_time.epoch) if entry_time else 0
+        for position in range(start, end):
+            if entries[position] is entry:
+                del times[position]; del entries[position]
+                name_times = index["names"].get(self._name_key(index["kind"], entry), [])
+                name_position = bisect.bisect_left(name_times, entry_time.epoch)
+                if name_position < len(name_times) and name_times[name_position] == entry_time.epoch: del name_times[name_position]
+                if self._day_totals is not None and entry_time.ordinal == self._day_totals.ordinal:
+                    self._day_totals.apply(index["kind"], entry, -1)
+                break
+        index["size"] = len(index["source"])
+
+    def _find_same_event(self, kind, index, entry):
+        """
+        Logged entry for the same event as entry (timestamp, student and name), via the student's index.
+        Only for entries recorded before log IDs existed (old undo history and journals).
+        """
+        entry_time = entry_log_time(entry)
+        if entry_time is None: return None
+        times, entries = index["students"].get(entry.get("student_id"), ([], []))
+        for position in range(bisect.bisect_left(times, entry_time.epoch), bisect.bisect_right(times, entry_time.epoch)):
+            if _same_log_event(kind, entries[position], entry): return entries[position]
+        return None
+
+    def _find_position(self, kind, index, entry):
+        """Position of entry in its log list: by log_id (or the same event) and a bisect on the timestamp."""
+        log_list = self._log_list(kind)
+        logged_entry = index["by_id"].get(entry.get("log_id"))
+        if logged_entry is None: # Entries recorded before log IDs existed (e.g. in an old undo history)
+            logged_entry = self._find_same_event(kind, index, entry)
+        if logged_entry is None: return None
+        position = bisect.bisect_left(log_list, _timestamp_key(logged_entry), key=_timestamp_key)
+        while position < len(log_list) and _timestamp_key(log_list[position]) == _timestamp_key(logged_entry):
+            if log_list[position] is logged_entry: return position
+            position += 1
+        return None
+
+    def contains(self, kind, entry):
+        """Whether entry is logged: by log_id, or for an entry without one, an entry for the same event."""
+        index = self._index(kind)
+        if "log_id" in entry: return entry["log_id"] in index["by_id"]
+        return self._find_same_event(kind, index, entry) is not None
+
+    # --- Mutations ---
+    def add(self, kind, entry):
+        """
+        Adds a copy of entry unless an entry with its log_id is already logged. An entry without a
+        log_id is always added, and its copy gets a new one (entry itself is not changed).
+        Returns the logged copy, or None if it was already logged.
+        """
+        log_list = self._log_list(kind)
+        index = self._index(kind)
+        if entry.get("log_id") in index["by_id"]: return None
+        entry_copy = entry.copy()
+        if "log_id" not in entry_copy: entry_copy["log_id"] = new_log_id()
+        bisect.insort_right(log_list, entry_copy, key=_timestamp_key)
+        self._index_insert(index, entry_copy)
+        return entry_copy
+
+    def remove(self, kind, entry):
+        """Removes entry (found by log_id, or the entry for the same event). Returns the removed entry or None."""
+        index = self._index(kind)
+        position = self._find_position(kind, index, entry)
+        if position is None: return None
+        removed_entry = self._log_list(kind).pop(position)
+        self._index_remove(index, removed_entry)
+        return removed_entry
+
+    def remove_student(self, student_id):
+        """Removes every log of a student. Returns (behavior/quiz logs removed, homework logs removed)."""
+        removed_counts = []
+        for kind in LOG_KINDS:
+            log_list = self._log_list(kind)
+            index = self._index(kind)
+            original_count = len(log_list)
+            log_list[:] = [log for log in log_list if log["student_id"] != student_id]
+            removed_counts.append(original_count - len(log_list))
+            self._touch(index, student_id)
+            _, student_entries = index["students"].pop(student_id, ([], []))
+            for entry in student_entries:
+                index["by_id"].pop(entry.get("log_id"), None)
+                index["names"].pop(self._name_key(kind, entry), None)
+                entry_time = entry_log_time(entry)
+                if self._day_totals is not None and entry_time is not None and entry_time.ordinal == self._day_totals.ordinal:
+                    self._day_totals.apply(kind, entry, -1)
+            index["size"] = len(log_list)
+        return tuple(removed_counts)
+
+    def restore(self, kind, entries):
+        """Re-adds entries removed earlier (e.g. undoing a student delete)."""
+        for entry in entries:
+            self.add(kind, entry)
+
+    def close(self):
+        pass
+
+    # --- Queries ---
+    def day_totals(self, day):
+        """
+        DayTotals of day (normally today). Built from that day's logs when first asked for, when the
+        day rolls over or when a log list was replaced; otherwise returned as kept up to date.
+        """
+        key = (day.toordinal(), self._index("behavior")["generation"], self._index("homework")["generation"])
+        if self._day_totals is None or self._day_totals_key != key:
+            totals = DayTotals(day.toordinal(), self.app._calculate_quiz_score_percentage)
+            for kind in LOG_KINDS:
+                for times, entries in self._student_index(kind).values():
+                    for position in range(bisect.bisect_left(times, midnight_epoch(totals.ordinal)),
+                                          bisect.bisect_left(times, midnight_epoch(totals.ordinal + 1))):
+                        totals.apply(kind, entries[position], 1)
+            self._day_totals, self._day_totals_key = totals, key
+        return self._day_totals
+
+    def invalidate_day_totals(self):
+        """Forces day_totals to be rebuilt, e.g. after the quiz mark types (and so the scores) changed."""
+        self._day_totals = None
+
+    def revision(self, kind):
+        """Changes whenever any log of kind changes (or the log list is replaced)."""
+        index = self._index(kind)
+        return (index["generation"], index["mutations"])
+
+    def student_revision(self, kind, student_id):
+        """Changes whenever the logs of kind for student_id change (or the log list is replaced)."""
+        index = self._index(kind)
+        return (index["generation"], index["revisions"].get(student_id, 0))
+
+    def window_times(self, kind, student_id, name, since_epoch, types):
+        """
+        Sorted epoch times of the logs of student_id with the given name and one of types at or after
+        since_epoch: a sliding-window count is len() of this, and it drops when the oldest time leaves.
+        """
+        names = self._index(kind)["names"]
+        window = []
+        for log_type in types:
+            times = names.get((student_id, log_type, name))
+            if times: window.extend(times[bisect.bisect_left(times, since_epoch):])
+        if len(types) > 1: window.sort()
+        return window
+
+    def logs_for_student(self, kind, student_id, types=None, since=None, after=None):
+        """
+        Logs of one student, oldest first, optionally limited to types, to timestamps >= since
+        and to timestamps > after (datetimes). A bisect into the student's index plus a slice.
+        """
+        times, entries = self._student_index(kind).get(student_id, ([], []))
+        start = 0
+        if since is not None: start = bisect.bisect_left(times, to_epoch(since))
+        if after is not None: start = max(start, bisect.bisect_right(times, to_epoch(after)))
+        return [log for log in entries[start:] if types is None or log.get("type") in types]
+
+    def query(self, kind, types=None, start_date=None, end_date=None, student_ids=None):
+        """
+        Logs of one kind, oldest first, filtered by type, inclusive date range and students. The list is
+        sorted by its ISO timestamps, so the date range is a bisect on the strings (as in the SQLite store).
+        """
+        log_list = self._log_list(kind)
+        start_iso, end_iso = _day_bounds(start_date, end_date)
+        start = bisect.bisect_left(log_list, start_iso, key=_timestamp_key) if start_iso else 0
+        end = bisect.bisect_left(log_list, end_iso, key=_timestamp_key) if end_iso else len(log_list)
+        student_ids = set(student_ids) if student_ids is not None else None
+        matching_logs = []
+        for log in log_list[start:end]:
+            if types is not None and log.get("type") not in types: continue
+            if student_ids is not None and log["student_id"] not in student_ids: continue
+            matching_logs.append(log)
+        return matching_logs
+
+    def presence_by_day(self, start_date, end_date, student_ids=None):
+        """
+        {date: set of student_ids with at least one log (of any kind) that day} for start_date..end_date.
+        One pass over each student's index: a bisect to the start of the range, and once a student is
+        present on a day, a bisect past the rest of that day's logs. Cost grows with the days a student
+        was present, not with the size of the logs or the number of report cells.
+        """
+        presence_by_ordinal = {}
+        range_end_epoch = midnight_epoch(end_date.toordinal() + 1)
+        for kind in LOG_KINDS:
+            student_index = self._student_index(kind)
+            for student_id in (student_index if student_ids is None else student_ids):
+                times, _ = student_index.get(student_id, ([], []))
+                position = bisect.bisect_left(times, midnight_epoch(start_date.toordinal()))
+                end_position = bisect.bisect_left(times, range_end_epoch)
+                while position < end_position:
+                    ordinal = epoch_ordinal(times[position])
+                    presence_by_ordinal.setdefault(ordinal, set()).add(student_id)
+                    position = bisect.bisect_left(times, midnight_epoch(ordinal + 1), position, end_position)
+        return {date.fromordinal(ordinal): present_ids for ordinal, present_ids in presence_by_ordinal.items()}
+
+    def earliest_log_date(self):
+        """Date of the oldest behavior/quiz or homework log, or None if there are none."""
+        log_times = [entry_log_time(log_list[0]) for log_list in (self._log_list(kind) for kind in LOG_KINDS) if log_list]
+        log_times = [entry_time for entry_time in log_times if entry_time is not None]
+        return date.fromordinal(min(entry_time.ordinal for entry_time in log_times)) if log_times else None
+
+
+class LogDatabase:
+    """
+    SQLite file holding log entries, one row per entry. The full entry is kept as JSON in
+    payload (Fernet-encrypted when encrypt is set, like the data files); the columns used
+    for filtering are stored alongside it in the clear so they can be indexed.
+    """
+    SCHEMA_VERSION = 2 # 2: log_id column
+    COLUMNS = "(log_kind, student_id, timestamp, type, behavior, entry_key, payload, log_id)"
+
+    def __init__(self, database_path, encrypt=True):
+        self.database_path = database_path
+        self.encrypt = encrypt
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.database_path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._create_schema()
+        return self._conn
+
+    def _create_schema(self):
+        with self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS logs (
+                    log_kind TEXT NOT NULL,
+                    student_id TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    type TEXT,
+                    behavior TEXT,
+                    entry_key TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    log_id TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_logs_student_time ON logs (student_id, timestamp);
+                CREATE INDEX IF NOT EXISTS idx_logs_type_time ON logs (type, timestamp);
+                CREATE INDEX IF NOT EXISTS idx_logs_behavior ON logs (behavior);
+                CREATE INDEX IF NOT EXISTS idx_logs_time ON logs (timestamp);
+                CREATE INDEX IF NOT EXISTS idx_logs_entry_key ON logs (log_kind, entry_key);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """)
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(logs)")]
+            if "log_id" not in columns: # Schema version 1
+                self._conn.execute("ALTER TABLE logs ADD COLUMN log_id TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_log_id ON logs (log_id)")
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)", (str(self.SCHEMA_VERSION),))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def assign_missing_log_ids(self):
+        """Gives the rows stored before log IDs existed a log_id, in place. Returns how many were updated."""
+        rows = self.conn.execute("SELECT rowid, log_kind, payload FROM logs WHERE log_id IS NULL").fetchall()
+        if not rows: return 0
+        updates = []
+        for rowid, kind, payload in rows:
+            entry = self._decode_payload(payload)
+            entry["log_id"] = new_log_id()
+            updates.append(self._row_for(kind, entry)[5:] + (rowid,)) # (entry_key, payload, log_id, rowid)
+        with self.conn:
+            self.conn.executemany("UPDATE logs SET entry_key = ?, payload = ?, log_id = ? WHERE rowid = ?", updates)
+        return len(updates)
+
+    def backup_bytes(self):
+        """
+        The whole database as the bytes of a standalone database file, including changes still in the WAL
+        file (copying the database file itself would miss them). Made with SQLite's online backup.
+        """
+        temp_fd, temp_path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(temp_fd)
+        try:
+            backup_conn = sqlite3.connect(temp_path)
+            try:
+                self.conn.backup(backup_conn)
+                backup_conn.execute("PRAGMA journal_mode=DELETE") # A single file, without WAL files next to it
+            finally:
+                backup_conn.close()
+            with open(temp_path, 'rb') as f:
+                return f.read()
+        finally:
+            remove_database_files(temp_path)
+
+    def _row_for(self, kind, entry):
+        payload_string = json.dumps(entry)
+        payload = encrypt_data(payload_string) if self.encrypt else payload_string.encode('utf-8')
+        return (kind, entry["student_id"], entry.get("timestamp", ""), entry.get("type"),
+                _entry_name(kind, entry), _entry_key(entry), payload, entry.get("log_id"))
+
+    @staticmethod
+    def _decode_payload(payload):
+        try:
+            payload_string = decrypt_data(payload)
+        except cryptography.fernet.InvalidToken:
+            payload_string = payload.decode('utf-8') # Stored while encryption was turned off
+        return json.loads(payload_string)
+
+    def _fetch_entries(self, sql, params=()):
+        return [self._decode_payload(payload) for (payload,) in self.conn.execute(sql, params)]
+
+    # --- Mutations (each is its own transaction) ---
+    def insert(self, kind, entry):
+        with self.conn:
+            self.conn.execute(f"INSERT INTO logs {self.COLUMNS} VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._row_for(kind, entry))
+
+    def delete(self, kind, entry):
+        with self.conn:
+            cursor = None
+            if entry.get("log_id"):
+                cursor = self.conn.execute("DELETE FROM logs WHERE log_id = ? AND log_kind = ?", (entry["log_id"], kind))
+            if cursor is None or cursor.rowcount == 0:
+                cursor = self.conn.execute(
+                    "DELETE FROM logs WHERE rowid = (SELECT rowid FROM logs WHERE log_kind = ? AND entry_key = ? LIMIT 1)",
+                    (kind, _entry_key(entry)))
+            if cursor.rowcount == 0: # Entry changed since it was stored; fall back to the event fields
+                self.conn.execute(
+                    "DELETE FROM logs WHERE rowid = (SELECT rowid FROM logs WHERE log_kind = ? AND student_id = ? AND timestamp = ? AND behavior IS ? LIMIT 1)",
+                    (kind, entry["student_id"], entry.get("timestamp", ""), _entry_name(kind, entry)))
+
+    def delete_student(self, student_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM logs WHERE student_id = ?", (student_id,))
+
+    def replace_all(self, behavior_log, homework_log):
+        """Replaces the stored logs with the given lists in a single transaction. Returns the number of rows written."""
+        rows = [self._row_for("behavior", entry) for entry in behavior_log]
+        rows.extend(self._row_for("homework", entry) for entry in homework_log)
+        with self.conn:
+            self.conn.execute("DELETE FROM logs")
+            self.conn.executemany(f"INSERT INTO logs {self.COLUMNS} VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_full_import', ?)", (datetime.now().isoformat(),))
+        return len(rows)
+
+    # --- Queries ---
+    def load_all(self):
+        """Returns (behavior_log, homework_log), each sorted by timestamp."""
+        return (self._fetch_entries("SELECT payload FROM logs WHERE log_kind = 'behavior' ORDER BY timestamp, rowid"),
+                self._fetch_entries("SELECT payload FROM logs WHERE log_kind = 'homework' ORDER BY timestamp, rowid"))
+
+    def query(self, kind, types=None, start_iso=None, end_iso=None, student_ids=None):
+        sql = "SELECT payload FROM logs WHERE log_kind = ?"
+        params = [kind]
+        if types is not None:
+            sql += f" AND type IN ({','.join('?' * len(types))})"; params.extend(types)
+        if start_iso is not None:
+            sql += " AND timestamp >= ?"; params.append(start_iso)
+        if end_iso is not None:
+            sql += " AND timestamp < ?"; params.append(end_iso)
+        if student_ids is not None:
+            student_ids = list(student_ids)
+            sql += f" AND student_id IN ({','.join('?' * len(student_ids))})"; params.extend(student_ids)
+        return self._fetch_entries(sql + " ORDER BY timestamp, rowid", params)
+
+    def presence_by_day(self, start_iso, end_iso, student_ids=None):
+        presence = {}
+        rows = self.conn.execute(
+            "SELECT DISTINCT substr(timestamp, 1, 10), student_id FROM logs WHERE timestamp >= ? AND timestamp < ?",
+            (start_iso, end_iso))
+        student_ids = set(student_ids) if student_ids is not None else None
+        for day_text, student_id in rows:
+            if student_ids is not None and student_id not in student_ids: continue
+            try: log_date = date.fromisoformat(day_text)
+            except ValueError: continue
+            presence.setdefault(log_date, set()).add(student_id)
+        return presence
+
+
+class SQLiteLogStore(LogStore):
+    """
+    Log store backed by a LogDatabase. Every insert or delete is committed as its own
+    transaction, so log commands don't need a data file save (or the journal) to be durable.
+    The in-memory lists are kept in step for the code that still reads them directly;
+    the range queries are answered from the database indexes, while per-student lookups
+    (drawn for every box on every redraw) stay on the in-memory index.
+    """
+    is_persistent = True
+
+    def __init__(self, app, database_path):
+        super().__init__(app)
+        self.db = LogDatabase(database_path)
+
+    def _sync_encryption(self):
+        self.db.encrypt = self.app.settings.get("encrypt_data_files", True)
+
+    def add(self, kind, entry):
+        added = super().add(kind, entry)
+        if added is not None:
+            self._sync_encryption()
+            self.db.insert(kind, added)
+        return added
+
+    def remove(self, kind, entry):
+        removed = super().remove(kind, entry)
+        if removed is not None:
+            self.db.delete(kind, removed)
+        return removed
+
+    def remove_student(self, student_id):
+        removed_counts = super().remove_student(student_id)
+        self.db.delete_student(student_id)
+        return removed_counts
+
+    def import_logs(self):
+        """One-shot import of the in-memory logs into the database, replacing whatever it held."""
+        self._sync_encryption()
+        return self.db.replace_all(self.app.behavior_log, self.app.homework_log)
+
+    def close(self):
+        self.db.close()
+
+    def query(self, kind, types=None, start_date=None, end_date=None, student_ids=None):
+        start_iso, end_iso = _day_bounds(start_date, end_date)
+        return self.db.query(kind, types, start_iso, end_iso, student_ids)
+
+    def presence_by_day(self, start_date, end_date, student_ids=None):
+        start_iso, end_iso = _day_bounds(start_date, end_date)
+        return self.db.presence_by_day(start_iso, end_iso, student_ids)
+
+
+def migrate_json_data_file(data_file_path, database_path, encrypt=True):
+    """
+    One-shot migration of the behavior/quiz and homework logs of a v10 data file
+    (classroom_data_v10.json, encrypted or not) into a log database. Returns the row count.
+    The data file itself is left untouched.
+    """
+    with open(data_file_path, 'rb') as f:
+        file_bytes = f.read()
+    try:
+        data_string = decrypt_data(file_bytes)
+    except cryptography.fernet.InvalidToken:
+        data_string = file_bytes.decode('utf-8')
+    data = json.loads(data_string)
+    if data.get("log_storage") == "sqlite":
+        raise ValueError(f"{os.path.basename(data_file_path)} already keeps its logs in a log database.")
+    db = LogDatabase(database_path, encrypt=encrypt)
+    try:
+        return db.replace_all(data.get("behavior_log", []), data.get("homework_log", []))
+    finally:
+        db.close()
+
+
+def benchmark_attendance(students=30, days=365, logs_per_day=40, sample_days=5, seed=1):
+    """
+    Times the attendance presence map on a synthetic year of logs: presence_by_day against the
+    old per-cell approach (for every day and student, any() over all logs with fromisoformat).
+    The per-cell approach is only run for sample_days days and scaled up to the full range.
+    Returns {"logs": int, "one_pass_ms": float, "per_cell_ms": float}.
+    """
+    rng = random.Random(seed)
+    start_date = date(2023, 9, 1)
+    student_ids = [f"student_{number}" for number in range(1, students + 1)]
+    behavior_log, homework_log = [], []
+    for day_offset in range(days):
+        day_start = datetime.combine(start_date + timedelta(days=day_offset), datetime.min.time()) + timedelta(hours=8)
+        for _ in range(logs_per_day):
+            entry = {"student_id": rng.choice(student_ids), "timestamp": (day_start + timedelta(minutes=rng.randrange(480))).isoformat()}
+            if rng.random() < 0.8: behavior_log.append(dict(entry, type="behavior", behavior="Talking"))
+            else: homework_log.append(dict(entry, type="homework", homework_type="Reading"))
+    behavior_log.sort(key=_timestamp_key); homework_log.sort(key=_timestamp_key)
+    store = LogStore(types.SimpleNamespace(behavior_log=behavior_log, homework_log=homework_log, settings={}))
+    end_date = start_date + timedelta(days=days - 1)
+
+    start_time = time.perf_counter()
+    presence = store.presence_by_day(start_date, end_date, student_ids)
+    report = {day: {student_id: "P" if student_id in presence.get(day, ()) else "A" for student_id in student_ids}
+              for day in (start_date + timedelta(days=offset) for offset in range(days))}
+    one_pass_ms = (time.perf_counter() - start_time) * 1000
+
+    start_time = time.perf_counter()
+    for day in (start_date + timedelta(days=offset) for offset in range(sample_days)):
+        for student_id in student_ids:
+            status = "P" if any(log["student_id"] == student_id and datetime.fromisoformat(log["timestamp"]).date() == day
+                                for log in behavior_log + homework_log) else "A"
+            assert status == report[day][student_id]
+    per_cell_ms = (time.perf_counter() - start_time) * 1000 * days / sample_days
+    return {"logs": len(behavior_log) + len(homework_log), "one_pass_ms": one_pass_ms, "per_cell_ms": per_cell_ms}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--benchmark-attendance"]:
+        results = benchmark_attendance()
+        print(f"Attendance report, 30 students x 365 days ({results['logs']} logs): "
+              f"{results['one_pass_ms']:.1f} ms one pass vs ~{results['per_cell_ms']:.0f} ms scanning the logs per cell")
+        sys.exit(0)
+    if len(sys.argv) != 3:
+        print("Usage: python log_store.py <classroom_data_v10.json> <classroom_logs_v10.sqlite3>")
+        print("       python log_store.py --benchmark-attendance")
+        sys.exit(1)
+    row_count = migrate_json_data_file(sys.argv[1], sys.argv[2])
+    print(f"Migrated {row_count} log entries into {sys.argv[2]}.")
@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import threading
+
+from data_encryption import encrypt_data
+
+
+class SaveManager:
+    """
+    Writes the application's JSON stores and keeps per-file statistics.
+
+    Code that changes a store marks its file dirty (mark_dirty); write_if_dirty then
+    serializes and writes only the dirty stores and records the others as unchanged,
+    without encoding them. A store is also dirty if it was last read or written with a
+    different encryption setting. is_dirty is the coarse flag that lets periodic
+    autosaves skip the whole pass when nothing changed.
+
+    Writes are grouped into passes (begin_pass/end_pass). Once start_worker has been
+    called, passes are serialized, encrypted and written on a background thread; the
+    caller must hand over data that is no longer mutated (a snapshot). A pass submitted
+    while another is still waiting is merged into it, so bursts of saves coalesce.
+    Without the worker, passes are written synchronously.
+    """
+    def __init__(self):
+        self._dirty_files = set() # Stores changed since they were last handed to write(); UI thread only
+        self._file_encryption = {} # {file_path: encrypt flag the file was last read or written with}
+        self._encryption_lock = threading.Lock()
+        self.is_dirty = False
+        self.last_report = [] # [{"file": str, "bytes": int, "seconds": float, "written": bool}]
+        self._current_pass = None
+
+        self._condition = threading.Condition()
+        self._pending_pass = None # Next pass for the worker; later passes are merged into it
+        self._worker_busy = False
+        self._worker = None
+        self._stop_requested = False
+        self._completed = [] # Finished passes waiting for the UI thread: [(sources, report, errors, failed file paths)]
+
+    def mark_dirty(self, *file_paths):
+        """Flags that there is something to save, and which stores (files) changed, if known."""
+        self.is_dirty = True
+        self._dirty_files.update(file_paths)
+
+    def mark_clean(self):
+        self.is_dirty = False
+
+    def loaded(self, file_path, encrypt):
+        """Records that file_path was just read from disk (encrypted or not), so it is clean."""
+        self._dirty_files.discard(file_path)
+        with self._encryption_lock:
+            self._file_encryption[file_path] = encrypt
+
+    def forget(self):
+        """Drops every dirty flag and recorded encryption, e.g. after the files on disk were replaced."""
+        self._dirty_files.clear()
+        with self._encryption_lock:
+            self._file_encryption.clear()
+
+    def is_store_dirty(self, file_path, encrypt=True):
+        if file_path in self._dirty_files: return True
+        with self._encryption_lock:
+            return file_path in self._file_encryption and self._file_encryption[file_path] != encrypt
+
+    # --- Passes ---
+    def begin_pass(self, source="manual"):
+        self._current_pass = {"sources": [source], "writes": {}, "skipped": [], "after_write": []}
+
+    def after_write(self, file_path, callback):
+        """Runs callback (possibly on the worker thread) once file_path from the current pass is safely on disk."""
+        if self._current_pass is not None:
+            self._current_pass["after_write"].append((file_path, callback))
+
+    def end_pass(self):
+        """Submits the current pass. Results are collected with pop_completed()."""
+        save_pass, self._current_pass = self._current_pass, None
+        if save_pass is None: return
+        if self._worker is None:
+            self._completed.append(self._run_pass(save_pass))
+            return
+        with self._condition:
+            if self._pending_pass is None:
+                self._pending_pass = save_pass
+            else: # Coalesce with the pass that is still waiting; newer data wins
+                self._pending_pass["sources"].extend(save_pass["sources"])
+                self._pending_pass["writes"].update(save_pass["writes"])
+                self._pending_pass["skipped"].extend(save_pass["skipped"])
+                self._pending_pass["after_write"].extend(save_pass["after_write"])
+            self._condition.notify_all()
+
+    def write(self, file_path, data, encrypt=True):
+        """
+        Adds data for file_path to the current pass (or submits it as a pass of its own), whether
+        or not it is dirty. With the worker running, data must not be mutated afterwards.
+        """
+        self._dirty_files.discard(file_path) # Marked dirty again if the write fails (see pop_completed)
+        if self._current_pass is not None:
+            self._current_pass["writes"][file_path] = (data, encrypt)
+            return True
+        self.begin_pass("single_file")
+        self._current_pass["writes"][file_path] = (data, encrypt)
+        self.end_pass()
+        return True
+
+    def write_if_dirty(self, file_path, get_data, encrypt=True):
+        """
+        Writes get_data() to file_path if the store is dirty; otherwise get_data is not called and the
+        store is reported as unchanged. Returns True if the write was queued.
+        """
+        if self.is_store_dirty(file_path, encrypt): return self.write(file_path, get_data(), encrypt)
+        if self._current_pass is not None: self._current_pass["skipped"].append(file_path)
+        return False
+
+    def _run_pass(self, save_pass):
+        report, errors, written_ok, failed = [], [], set(), []
+        for file_path, (data, encrypt) in save_pass["writes"].items():
+            try:
+                report.append(self._write_file(file_path, data, encrypt))
+                written_ok.add(file_path)
+            except Exception as e: # Reported back to the UI thread
+                errors.append((os.path.basename(file_path), e)); failed.append(file_path)
+        for file_path in dict.fromkeys(save_pass["skipped"]):
+            if file_path not in save_pass["writes"]:
+                report.append({"file": os.path.basename(file_path), "bytes": 0, "seconds": 0.0, "written": False})
+        for file_path, callback in save_pass["after_write"]:
+            if file_path in written_ok:
+                try: callback()
+                except Exception as e: errors.append((os.path.basename(file_path), e))
+        self.last_report = report
+        return (save_pass["sources"], report, errors, failed)
+
+    def _write_file(self, file_path, data, encrypt):
+        start_time = time.perf_counter()
+        json_data_string = json.dumps(data, indent=4)
+        data_to_write_bytes = encrypt_data(json_data_string) if encrypt else json_data_string.encode('utf-8')
+        # Write to a temporary file and swap it in, so a crash mid-write never leaves a truncated store
+        temp_path = file_path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data_to_write_bytes)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, file_path)
+        with self._encryption_lock:
+            self._file_encryption[file_path] = encrypt
+        return {"file": os.path.basename(file_path), "bytes": len(data_to_write_bytes), "seconds": time.perf_counter() - start_time, "written": True}
+
+    def pop_completed(self):
+        """
+        Returns and clears the finished passes as [(sources, report, errors)]. Call from the UI thread;
+        stores whose write failed are marked dirty again.
+        """
+        with self._condition:
+            completed, self._completed = self._completed, []
+        for _, _, _, failed in completed:
+            self._dirty_files.update(failed)
+        return [(sources, report, errors) for sources, report, errors, _ in completed]
+
+    # --- Background worker ---
+    def start_worker(self):
+        if self._worker is not None: return
+        self._stop_requested = False
+        self._worker = threading.Thread(target=self._worker_loop, name="SaveWorker", daemon=True)
+        self._worker.start()
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                while self._pending_pass is None and not self._stop_requested:
+                    self._condition.wait()
+                if self._pending_pass is None and self._stop_requested: return
+                save_pass, self._pending_pass = self._pending_pass, None
+                self._worker_busy = True
+            result = self._run_pass(save_pass)
+            with self._condition:
+                self._completed.append(result)
+                self._worker_busy = False
+                self._condition.notify_all()
+
+    def is_idle(self):
+        with self._condition:
+            return self._pending_pass is None and not self._worker_busy
+
+    def flush(self, timeout=30):
+        """Blocks until every submitted pass has been written. Returns False on timeout."""
+        if self._worker is None: return True
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._pending_pass is not None or self._worker_busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: return False
+                self._condition.wait(remaining)
+        return True
+
+    def stop_worker(self, timeout=30):
+        """Flushes outstanding writes and stops the worker; later passes are written synchronously."""
+        if self._worker is None: return True
+        flushed = self.flush(timeout)
+        with self._condition:
+            self._stop_requested = True
+            self._condition.notify_all()
+        self._worker.join(timeout=1)
+        self._worker = None
+        return flushed
+
+    # --- Reporting ---
+    def format_report(self, report=None):
+        """One-line summary of a save pass, e.g. '2/9 files written, 1.4 MB, 38 ms'."""
+        report = self.last_report if report is None else report
+        written = [r for r in report if r["written"]]
+        total_bytes = sum(r["bytes"] for r in written)
+        total_ms = sum(r["seconds"] for r in report) * 1000
+        if total_bytes >= 1024 * 1024: size_text = f"{total_bytes / (1024 * 1024):.1f} MB"
+        else: size_text = f"{total_bytes / 1024:.1f} KB"
+        return f"{len(written)}/{len(report)} files written, {size_text}, {total_ms:.0f} ms"
+
+    def format_report_details(self, report=None):
+        report = self.last_report if report is None else report
+        return "\n".join(
+            f"  {r['file']}: {'written' if r['written'] else 'unchanged'}, {r['bytes']} bytes, {r['seconds'] * 1000:.1f} ms"
+            for r in report
+        )
@@ -9,6 +9,8 @@ from datetime import datetime, timedelta, date as datetime_date
 from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font as OpenpyxlFont, Alignment as OpenpyxlAlignment
 from openpyxl.utils import get_column_letter
+from excel_export import StreamingWorkbook, ExportCell, ColumnWidths, row_from_columns
+from export_jobs import ExportJobRunner, ExportSnapshot, JobCancelled, replace_when_written
 import re
 import shutil
 import shutil
@@ -20,7 +22,8 @@ from PIL import Image
 from settingsdialog import SettingsDialog
 from commands import Command, DeleteGuideCommand, MoveItemsCommand, AddItemCommand, DeleteItemCommand, LogEntryCommand, \
     LogHomeworkEntryCommand, EditItemCommand, ChangeItemsSizeCommand, MarkLiveQuizQuestionCommand, \
-        MarkLiveHomeworkCommand, ChangeItemStyleCommand, ManageStudentGroupCommand, MoveGuideCommand, AddGuideCommand
+        MarkLiveHomeworkCommand, ChangeItemStyleCommand, ManageStudentGroupCommand, MoveGuideCommand, AddGuideCommand, \
+        CompositeCommand, REDRAW_ALL, REDRAW_STAT_BOXES
 from dialogs import PasswordPromptDialog, AddEditStudentDialog, AddFurnitureDialog, AddStatBoxDialog, BehaviorDialog, \
     ManualHomeworkLogDialog, QuizScoreDialog, LiveQuizMarkDialog, LiveHomeworkMarkDialog, ExitConfirmationDialog, \
         ImportExcelOptionsDialog, SizeInputDialog, StudentStyleDialog,  AttendanceReportDialog, ManageStudentGroupsDialog, StatBoxStyleDialog
@@ -31,6 +34,12 @@ from scheduledialog import ScheduleDialog
 from data_locker import unlock_file, DATA_FILE
 import json
 from data_encryption import encrypt_data, decrypt_data
+from log_journal import LogJournal
+from save_manager import SaveManager
+from canvas_renderer import RetainedCanvasRenderer, FontCache, benchmark_redraw
+from spatial_index import SpatialIndex
+from conditional_formatting import ConditionalFormattingEngine
+from log_store import LogStore, SQLiteLogStore, LogDatabase, BEHAVIOR_LOG_TYPES, HOMEWORK_LOG_TYPES, log_time, assign_log_ids, database_files, remove_database_files
 # Replace with your actual path to gswinXXc.exe
 #EpsImagePlugin.gs_windows_binary = "C:\\Program Files\\gs\\gs10.05.1\bin\\gswin64c.exe"
 # Only use this ^ if something really doesn't work. Otherwise, it works even with just installing Ghostscript regularly, without any additional steps.
@@ -39,6 +48,10 @@ import darkdetect # For dark mode detection
 # Conditional import for platform-specific screenshot capability
 import threading
 import io
+import copy
+import sqlite3
+from collections import deque
+import time
 import tempfile
 import cryptography.fernet # For making sure that the program can properly handle encrypted and non-encrypted data files
 try:
@@ -61,6 +74,7 @@ except ImportError:
 APP_NAME = "BehaviorLogger"
 APP_VERSION = "v57.0" # Version incremented
 CURRENT_DATA_VERSION_TAG = "v10" # Incremented for guide saving
+CURRENT_DATA_VERSION = int(CURRENT_DATA_VERSION_TAG[1:]) # Stored in the data file as "data_version"
 
 # --- Profile Management ---
 g_current_profile_name = None
@@ -90,7 +104,12 @@ DRAG_THRESHOLD = 5
 DEFAULT_GRID_SIZE = 20
 MAX_UNDO_HISTORY_DAYS = 90
 LAYOUT_COLLISION_OFFSET = 5
+LAYOUT_RESOLVE_MAX_ITERATIONS = 1000 # Pushing boxes processed per collision pass before the rest is left for the next redraw
 RESIZE_HANDLE_SIZE = 10 # World units for resize handle
+VIEWPORT_CULL_MARGIN = 200 # Screen pixels around the visible canvas in which items are still drawn
+LOD_LOW, LOD_MEDIUM, LOD_FULL = "low", "medium", "full" # Levels of detail for student boxes, by zoom
+ZOOM_RERENDER_DELAY_MS = 150 # Zooming must pause this long before the scaled canvas is redrawn at full quality
+ZOOM_SCALED_TAGS = ("student_item", "furniture_item", "stat_box_item", "guide", "grid_line") # Items scaled while zooming
 
 # --- Path Handling ---
 def get_app_data_path(filename):
@@ -143,6 +162,8 @@ LAYOUT_TEMPLATES_DIR_NAME = "layout_templates"
 STUDENT_GROUPS_FILE_PATTERN = f"student_groups_{CURRENT_DATA_VERSION_TAG}.json"
 QUIZ_TEMPLATES_FILE_PATTERN = f"quiz_templates_{CURRENT_DATA_VERSION_TAG}.json"
 HOMEWORK_TEMPLATES_FILE_PATTERN = f"homework_templates_{CURRENT_DATA_VERSION_TAG}.json" # New
+LOG_JOURNAL_FILE_PATTERN = f"classroom_data_{CURRENT_DATA_VERSION_TAG}.journal" # Log commands since the last full save
+LOG_DATABASE_FILE_PATTERN = f"classroom_logs_{CURRENT_DATA_VERSION_TAG}.sqlite3" # Logs, when the SQLite log storage is enabled
 
 DATA_FILE = get_app_data_path(DATA_FILE_PATTERN)
 CUSTOM_BEHAVIORS_FILE = get_app_data_path(CUSTOM_BEHAVIORS_FILE_PATTERN)
@@ -153,6 +174,8 @@ LAYOUT_TEMPLATES_DIR = get_app_data_path(LAYOUT_TEMPLATES_DIR_NAME)
 STUDENT_GROUPS_FILE = get_app_data_path(STUDENT_GROUPS_FILE_PATTERN)
 QUIZ_TEMPLATES_FILE = get_app_data_path(QUIZ_TEMPLATES_FILE_PATTERN)
 HOMEWORK_TEMPLATES_FILE = get_app_data_path(HOMEWORK_TEMPLATES_FILE_PATTERN) # New
+LOG_JOURNAL_FILE = get_app_data_path(LOG_JOURNAL_FILE_PATTERN)
+LOG_DATABASE_FILE = get_app_data_path(LOG_DATABASE_FILE_PATTERN)
 LOCK_FILE_PATH = get_app_data_path(f"{APP_NAME}.lock") # Lock file
 IMAGENAMEW = "export_layout_as_image_helper"
 
@@ -285,6 +308,8 @@ class SeatingChartApp:
                 "show_rulers": "Show Rulers",
                 "show_grid": "Show Grid",
                 "grid_color": "Grid Color",
+                "lod_low_zoom_threshold": "Simplified Boxes Below Zoom",
+                "lod_medium_zoom_threshold": "Names Only Below Zoom",
                 "save_guides_to_file": "Save Guides with Layout Data",
                 "guides_stay_when_rulers_hidden": "Keep Guides in Memory when Rulers are Off",
                 "guides_color": "Guide Color",
@@ -333,6 +358,7 @@ class SeatingChartApp:
                 "excel_export_include_summaries_by_default": "Include Summary Sheet in Export",
                 "enable_excel_autosave": "Enable Excel Log Autosave",
                 "output_dpi": "Image Export DPI",
+                "use_sqlite_log_storage": "Store Logs in SQLite Database",
             },
             "Stat Boxes": {
                 "statbox_presence_definition": "Definition of 'Present' for Stats"
@@ -392,10 +418,20 @@ class SeatingChartApp:
         
         self.settings = self._get_default_settings()
         self.settings_sharing_config = {}
+        self._saved_settings_stores = {} # {file path: global settings / sharing config as last loaded or saved}
+        self._log_snapshots = {} # {kind: (LogStore.revision, deep copy of the log list) last handed to the save worker}
         self.password_manager = PasswordManager(self.settings)
 
-        self.canvas_frame = None; self.canvas = None; self.h_scrollbar = None; self.v_scrollbar = None
+        self.canvas_frame = None; self.canvas = None; self.renderer = None; self.font_cache = FontCache(); self.h_scrollbar = None; self.v_scrollbar = None
+        self._pending_redraw_scope = set(); self._pending_redraw_collisions = False; self._redraw_after_id = None # See request_redraw
+        self._culled_items = set() # Items outside the viewport that were not drawn; drawn once scrolled into view
+        self.spatial_index = SpatialIndex() # World rectangles of students, furniture and stat boxes; see update_spatial_index
+        self.layout_generation = 0; self._spatial_index_generation = None # See invalidate_spatial_index
+        self._lod_cache_key = None; self._lod_level = LOD_FULL
+        self._zoom_render_after_id = None # See zoom_canvas
+        self._student_layout_cache = {} # {student_id: (layout key, world height of the box text)}
         self.status_bar_label = None; self.zoom_display_label = None
+        self.export_progress_frame = None; self._export_progress_animating = False
         self.mode_var = tk.StringVar(value=self.settings["current_mode"])
         self.edit_mode_var = tk.BooleanVar(value=False)
 
@@ -450,6 +486,16 @@ class SeatingChartApp:
         self.temporary_guides: List[Dict[str, Any]] = [] # List of {'type': 'h'/'v', 'world_coord': float, 'canvas_id': int}
         
         
+        self.log_journal = LogJournal(LOG_JOURNAL_FILE) # Log commands are appended here instead of rewriting DATA_FILE
+        self.save_manager = SaveManager() # Skips writing stores whose content hasn't changed
+        self.save_manager.start_worker() # Serializing, encrypting and writing happen off the Tk thread
+        self.export_jobs = ExportJobRunner(on_progress=self._on_export_job_progress) # Exports and backups run on a worker thread
+        self._excel_autosave_needed = True # Set whenever the main data file is rewritten
+        self.log_store = LogStore(self) # Replaced by an SQLiteLogStore when that backend is enabled
+        self.conditional_formatting = ConditionalFormattingEngine(self) # Compiled rules and cached colors per student box
+        self._logs_in_database = False # True when the data file's logs live in LOG_DATABASE_FILE
+        self.last_migration_report = [] # [(version migrated from, seconds)] of the last data migration
+
         self.load_custom_behaviors()
         self.load_custom_homework_types() # NEW
         self.load_custom_homework_statuses() # RENAMED
@@ -464,6 +510,7 @@ class SeatingChartApp:
 
         self.load_data() # Loads main data, including settings
         self.load_and_apply_settings() # Apply shared settings
+        self._apply_log_storage_backend() # The log storage setting may be a shared one
         self.settings["available_fonts"] = sorted(list(tkfont.families()))
         self._ensure_next_ids()
         self.theme_auto(init=True)
@@ -472,16 +519,14 @@ class SeatingChartApp:
         self.setup_ui()
         # self.root.after_idle(self.draw_all_items) # Defer initial draw until window is mapped
         self.update_status(f"Application started. Data loaded from: {os.path.dirname(DATA_FILE)}") # type: ignore
+        self.root.after(250, self._poll_save_results)
+        self.root.after(100, self._poll_export_jobs)
         self.update_undo_redo_buttons_state()
         self.toggle_mode(initial=True) # Apply initial mode
         self.root.after(30000, self.periodic_checks)
         self.root.after(self.settings.get("autosave_interval_ms", 30000), self.autosave_data_wrapper)
-        
-        # Schedule the first time-based formatting update to align with the clock.
-        now = datetime.now()
-        seconds_until_first_minute = 60 - now.second
-        milliseconds_until_first_minute = (seconds_until_first_minute * 1000) + 50 # Add 50ms buffer
-        self.root.after(milliseconds_until_first_minute, self.update_time_based_formatting)
+        self.update_time_based_formatting()
+        self.schedule_day_rollover()
 
         self.root.protocol("WM_DELETE_WINDOW", self.on_exit_protocol)
         
@@ -503,6 +548,7 @@ class SeatingChartApp:
         profile_settings_path = get_app_data_path("settings.json")
 
         sharing_config = self._read_and_decrypt_file(sharing_config_path) or {}
+        loaded_sharing_config = copy.deepcopy(sharing_config) # Keys added below still need saving
         global_settings = self._read_and_decrypt_file(global_settings_path) or {}
         profile_settings = self._read_and_decrypt_file(profile_settings_path) or {}
 
@@ -524,18 +570,20 @@ class SeatingChartApp:
 
         self.settings = final_settings
         self.settings_sharing_config = sharing_config
+        self._saved_settings_stores = {global_settings_path: copy.deepcopy(self._split_settings()[0]),
+                                       sharing_config_path: copy.deepcopy(loaded_sharing_config)}
         # Re-apply any settings that affect the UI immediately
         # self.theme_auto()
-        # self.draw_all_items()
+        # self.request_redraw()
 
 
     def on_canvas_configure(self, event):
         """
         Called when the canvas is first configured or resized.
-        We use this to trigger the very first draw_all_items() call,
+        We use this to trigger the very first redraw,
         ensuring the canvas has its final size.
         """
-        self.draw_all_items()
+        self.request_redraw()
         
     def capture_tkinter_window(self, filename="tkinter_screenshot.png"):
         """
@@ -606,6 +654,7 @@ class SeatingChartApp:
             if not file_content: # File is empty
                 return None
 
+            was_encrypted = True
             try:
                 # Attempt to decrypt first
                 decrypted_data_string = decrypt_data(file_content)
@@ -613,31 +662,32 @@ class SeatingChartApp:
                 # If decryption fails, it's likely plaintext (or corrupt)
                 # Assume it's a UTF-8 encoded string.
                 decrypted_data_string = file_content.decode('utf-8')
+                was_encrypted = False
 
-            return json.loads(decrypted_data_string)
+            loaded_data = json.loads(decrypted_data_string)
+            self.save_manager.loaded(file_path, encrypt=was_encrypted) # Clean until something marks it dirty
+            return loaded_data
 
         except (json.JSONDecodeError, IOError, UnicodeDecodeError) as e:
             print(f"Error loading and decoding file {os.path.basename(file_path)}: {e}")
             return None
 
-    def _encrypt_and_write_file(self, file_path, data_to_write):
-        """Encodes data to JSON, encrypts if enabled, and writes to a file."""
+    def _encrypt_and_write_file(self, file_path, data_to_write, is_snapshot=False):
+        """
+        Hands data to the save manager, which encodes it to JSON, encrypts if enabled and writes it
+        in the background (skipped if unchanged). Unless is_snapshot is set, data is copied first
+        so later edits can't race the writer. Returns True if the write was queued.
+        """
         try:
-            json_data_string = json.dumps(data_to_write, indent=4)
-            
+            if not is_snapshot: data_to_write = copy.deepcopy(data_to_write)
             # Use the app's setting to decide whether to encrypt
-            if self.settings.get("encrypt_data_files", True):
-                data_to_write_bytes = encrypt_data(json_data_string)
-            else:
-                data_to_write_bytes = json_data_string.encode('utf-8')
-
-            with open(file_path, 'wb') as f:
-                f.write(data_to_write_bytes)
+            return self.save_manager.write(file_path, data_to_write, encrypt=self.settings.get("encrypt_data_files", True))
 
         except IOError as e:
             print(f"Error saving file {os.path.basename(file_path)}: {e}")
         except Exception as e:
             print(f"An unexpected error occurred while saving {os.path.basename(file_path)}: {e}")
+        return False
 
     def _get_default_settings(self):
         return {
@@ -746,9 +796,14 @@ class SeatingChartApp:
             "guides_stay_when_rulers_hidden": True, # New setting for guides
             "next_guide_id_num": 1, # Added in migration, also good here
             "guides_color": "blue", # Default color for guides
+            "lod_low_zoom_threshold": 0.5, # Below this zoom student boxes show only their color and initials
+            "lod_medium_zoom_threshold": 0.75, # Below this zoom student boxes show names but no logs
             "hidden_default_homework_types": [], # New for hiding default homework types
             "statbox_presence_definition": "any_log",
             "statbox_presence_behavior": "",
+            "use_log_journal": True, # Append log commands to a journal instead of rewriting the data file
+            "log_journal_compact_threshold": 500, # Journal records before a full save is forced
+            "use_sqlite_log_storage": False, # Keep logs in an indexed SQLite database instead of the data file
         }
 
     def _ensure_next_ids(self):
@@ -837,17 +892,25 @@ class SeatingChartApp:
             self.show_lock_screen()
         self.root.after(30000, self.periodic_checks)
 
-    def update_time_based_formatting(self):
-        """Periodically redraws all items to update time-based conditional formatting. Runs on the minute."""
-        # This check is to avoid redrawing if no time-based rules exist.
-        if any(rule.get("active_times") for rule in self.settings.get("conditional_formatting_rules", [])):
-            self.draw_all_items()
-        
-        # Schedule the next run for the start of the next minute.
+    def schedule_day_rollover(self):
+        """Repaints the stat boxes just after midnight, when they start counting the new day."""
         now = datetime.now()
-        seconds_until_next_minute = 60 - now.second
-        milliseconds_until_next_minute = (seconds_until_next_minute * 1000) + 50 # Add 50ms buffer
-        self.root.after(milliseconds_until_next_minute, self.update_time_based_formatting)
+        next_midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        delay_ms = int((next_midnight - now).total_seconds() * 1000) + 50 # Add 50ms buffer
+        self.root.after(delay_ms, self._on_day_rollover)
+
+    def _on_day_rollover(self):
+        self.request_redraw({REDRAW_STAT_BOXES})
+        self.schedule_day_rollover()
+
+    def update_time_based_formatting(self):
+        """
+        Arms the timer for the next start or end time of a time-limited conditional formatting rule.
+        When it fires, only the students affected by the rules that turned on or off are repainted,
+        and the timer is set again; it is also re-armed whenever the rules change.
+        """
+        self.conditional_formatting.begin_pass() # Compiles the current rules if needed
+        self.conditional_formatting.schedule_time_boundary()
 
     def show_lock_screen(self):
         if hasattr(self, '_lock_screen_active') and self._lock_screen_active.winfo_exists(): return
@@ -886,7 +949,8 @@ class SeatingChartApp:
         return dialog.result
 
     def execute_command(self, command: Command):
-        is_sensitive_edit = isinstance(command, (AddItemCommand, DeleteItemCommand, EditItemCommand, ChangeItemsSizeCommand, ManageStudentGroupCommand))
+        sensitive_types = (AddItemCommand, DeleteItemCommand, EditItemCommand, ChangeItemsSizeCommand, ManageStudentGroupCommand)
+        is_sensitive_edit = isinstance(command, sensitive_types) or (isinstance(command, CompositeCommand) and command.contains_any(sensitive_types))
         if is_sensitive_edit and self.settings.get("password_on_edit_action", False) and self.password_manager.is_password_set():
             if not self.prompt_for_password("Confirm Action", "Enter password to make this change:", for_editing=True):
                 self.update_status("Action cancelled: Password not provided or incorrect."); return
@@ -895,7 +959,12 @@ class SeatingChartApp:
             self.undo_stack.append(command)
             self.redo_stack.clear()
             self.update_undo_redo_buttons_state()
-            if not isinstance(command, (MarkLiveQuizQuestionCommand, MarkLiveHomeworkCommand)):
+            if self._should_journal_command(command):
+                self._journal_command("execute", command)
+            elif self._is_stored_log_command(command):
+                self.save_manager.mark_dirty() # The log store has committed the change; undo history follows with the next autosave
+            elif not isinstance(command, (MarkLiveQuizQuestionCommand, MarkLiveHomeworkCommand)):
+                self.save_manager.mark_dirty()
                 self.save_data_wrapper(source="command_execution")
             self.password_manager.record_activity()
         except Exception as e:
@@ -909,11 +978,16 @@ class SeatingChartApp:
             command = self.undo_stack.pop()
             try:
                 command.undo()
+                self.invalidate_spatial_index()
                 self.redo_stack.append(command)
                 self.update_undo_redo_buttons_state()
-                if not isinstance(command, (MarkLiveQuizQuestionCommand, MarkLiveHomeworkCommand)):
+                if self._should_journal_command(command):
+                    self._journal_command("undo", command)
+                elif self._is_stored_log_command(command):
+                    self.save_manager.mark_dirty() # The log store has committed the change; undo history follows with the next autosave
+                elif not isinstance(command, (MarkLiveQuizQuestionCommand, MarkLiveHomeworkCommand)):
+                    self.save_manager.mark_dirty()
                     self.save_data_wrapper(source="undo_command")
-                self.draw_all_items()
                 self.password_manager.record_activity()
             except Exception as e:
                 messagebox.showerror("Undo Error", f"Error undoing action: {e}", parent=self.root)
@@ -926,16 +1000,77 @@ class SeatingChartApp:
             command = self.redo_stack.pop()
             try:
                 command.execute()
+                self.invalidate_spatial_index()
                 self.undo_stack.append(command)
                 self.update_undo_redo_buttons_state()
-                if not isinstance(command, (MarkLiveQuizQuestionCommand, MarkLiveHomeworkCommand)):
+                if self._should_journal_command(command):
+                    self._journal_command("redo", command)
+                elif self._is_stored_log_command(command):
+                    self.save_manager.mark_dirty() # The log store has committed the change; undo history follows with the next autosave
+                elif not isinstance(command, (MarkLiveQuizQuestionCommand, MarkLiveHomeworkCommand)):
+                    self.save_manager.mark_dirty()
                     self.save_data_wrapper(source="redo_command")
-                self.draw_all_items()
                 self.password_manager.record_activity()
             except Exception as e:
                 messagebox.showerror("Redo Error", f"Error redoing action: {e}", parent=self.root)
                 self.redo_stack.append(command); print(f"Redo error: {e}\n{type(command)}")
 
+    def _should_journal_command(self, command):
+        return self.settings.get("use_log_journal", True) and not self.log_store.is_persistent and \
+               isinstance(command, (LogEntryCommand, LogHomeworkEntryCommand))
+
+    def _is_stored_log_command(self, command):
+        if not self.log_store.is_persistent: return False
+        if isinstance(command, CompositeCommand): return command.contains_only((LogEntryCommand, LogHomeworkEntryCommand))
+        return isinstance(command, (LogEntryCommand, LogHomeworkEntryCommand))
+
+    def _journal_command(self, action, command):
+        """Appends a log command to the journal; falls back to a full save if that fails or the journal is due for compaction."""
+        try:
+            self.log_journal.append(action, command.to_dict(), encrypt=self.settings.get("encrypt_data_files", True))
+        except (IOError, OSError, TypeError, ValueError) as e:
+            print(f"Could not append to log journal ({e}). Saving full data file instead.")
+            self.save_data_wrapper(source=f"{action}_command" if action != "execute" else "command_execution")
+            return
+        if self.log_journal.record_count >= self.settings.get("log_journal_compact_threshold", 500):
+            self.save_data_wrapper(source="journal_compaction")
+
+    def _replay_log_journal(self):
+        """
+        Re-applies the journaled log commands written since the last full save of DATA_FILE.
+        Records whose effect is already in the loaded snapshot (a sealed segment whose save
+        completed but wasn't cleaned up) are skipped.
+        """
+        records = self.log_journal.read_records()
+        if not records: return
+        if self.log_store.is_persistent: # Replay only changes the in-memory lists the journal was written for
+            self.log_store.close(); self.log_store = LogStore(self) # The configured backend is set up after loading
+        replayed_count = 0
+        for record in records:
+            cmd_data = record["command"]
+            log_entry = cmd_data.get("data", {}).get("log_entry")
+            if cmd_data.get("type") == "LogEntryCommand": log_kind = "behavior"
+            elif cmd_data.get("type") == "LogHomeworkEntryCommand": log_kind = "homework"
+            else: continue
+            if not log_entry: continue
+
+            # Through the log store, so its per-student index stays in step with the lists
+            if record["action"] in ("execute", "redo"):
+                if self.log_store.contains(log_kind, log_entry): continue
+                self.log_store.add(log_kind, log_entry)
+                if record["action"] == "redo" and self.redo_stack and self.redo_stack[-1].to_dict() == cmd_data:
+                    self.redo_stack.pop()
+                elif record["action"] == "execute":
+                    self.redo_stack.clear()
+                cmd_obj = Command.from_dict(self, cmd_data)
+                if cmd_obj: self.undo_stack.append(cmd_obj)
+            elif record["action"] == "undo":
+                if self.log_store.remove(log_kind, log_entry) is None: continue
+                if self.undo_stack and self.undo_stack[-1].to_dict() == cmd_data:
+                    self.redo_stack.append(self.undo_stack.pop())
+            replayed_count += 1
+        print(f"Replayed {replayed_count} journaled log change(s) from {os.path.basename(self.log_journal.journal_path)}.")
+
     def update_undo_redo_buttons_state(self):
         if hasattr(self, 'undo_btn'): self.undo_btn.config(state=tk.NORMAL if self.undo_stack else tk.DISABLED)
         if hasattr(self, 'redo_btn'): self.redo_btn.config(state=tk.NORMAL if self.redo_stack else tk.DISABLED)
@@ -1004,6 +1139,7 @@ class SeatingChartApp:
         self.root.bind_all("<Control-Shift-Z>", lambda event: self.redo_last_action()) # Common alternative for redo
         self.root.bind_all("<Control-r>", lambda event: self.reload_canvas())
         self.root.bind_all("<Control-R>", lambda event: self.reload_canvas())
+        self.root.bind_all("<Control-B>", lambda event: self.benchmark_canvas_redraw())
         self.root.bind_all("<S>", lambda event: self.open_settings_dialog())
         self.root.bind_all("<p>", lambda event: self.show_help_dialog())
         self.root.bind_all("<Control-plus>", lambda event: self.zoom_canvas(1.1))
@@ -1132,7 +1268,8 @@ class SeatingChartApp:
         self.canvas_frame = ttk.Frame(self.main_frame); self.canvas_frame.pack(fill=tk.BOTH, after=self.top_frame, expand=True)
         self.h_scrollbar = ttk.Scrollbar(self.canvas_frame, orient=tk.HORIZONTAL, command=self.canvas_xview_custom)
         self.v_scrollbar = ttk.Scrollbar(self.canvas_frame, orient=tk.VERTICAL, command=self.canvas_yview_custom) #else "#1F1F1F"
-        self.canvas = tk.Canvas(self.canvas_frame, bg=self.canvas_color, relief=tk.SUNKEN, borderwidth=1, xscrollcommand=self.h_scrollbar.set, yscrollcommand=self.v_scrollbar.set) # type: ignore
+        self.canvas = tk.Canvas(self.canvas_frame, bg=self.canvas_color, relief=tk.SUNKEN, borderwidth=1, xscrollcommand=self.on_canvas_xscroll, yscrollcommand=self.on_canvas_yscroll) # type: ignore
+        self.renderer = RetainedCanvasRenderer(self.canvas)
         self.canvas.bind("<Configure>", self.on_canvas_configure)
         self.h_scrollbar.pack(side=tk.BOTTOM, fill=tk.X); self.v_scrollbar.pack(side=tk.RIGHT, fill=tk.Y); self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.canvas.config(scrollregion=(0, 0, self.canvas_orig_width * self.current_zoom_level, self.canvas_orig_height * self.current_zoom_level))
@@ -1146,11 +1283,19 @@ class SeatingChartApp:
         if sys.platform == "darwin": self.canvas.bind("<Shift-MouseWheel>", self.on_mousewheel_scroll_horizontal_mac)
         else: self.canvas.bind("<Shift-MouseWheel>", self.on_mouse_wheel_horizontal) # For Windows/Linux with Shift
 
-        self.status_bar_label = ttk.Label(self.root, text="Welcome!", relief=tk.SUNKEN, anchor=tk.W, padding=5); self.status_bar_label.pack(side=tk.BOTTOM, fill=tk.X)
+        self.status_bar_frame = ttk.Frame(self.root); self.status_bar_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        self.status_bar_label = ttk.Label(self.status_bar_frame, text="Welcome!", relief=tk.SUNKEN, anchor=tk.W, padding=5); self.status_bar_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        # Progress of background exports, shown next to the status text while a job is queued or running
+        self.export_progress_frame = ttk.Frame(self.status_bar_frame, relief=tk.SUNKEN, padding=(5, 2))
+        self.export_progress_label = ttk.Label(self.export_progress_frame, text=""); self.export_progress_label.pack(side=tk.LEFT, padx=(0, 5))
+        self.export_progress_bar = ttk.Progressbar(self.export_progress_frame, length=150, mode="determinate"); self.export_progress_bar.pack(side=tk.LEFT)
+        ttk.Button(self.export_progress_frame, text="Cancel", command=self.cancel_export_jobs).pack(side=tk.LEFT, padx=(5, 0))
         self.canvas.focus_set()
         self.toggle_student_groups_ui_visibility()
         self.toggle_manage_boxes_visibility()
 
+    def on_canvas_xscroll(self, *args): self.h_scrollbar.set(*args); self.materialize_visible_items() # Any view change: scrolling, panning, resizing
+    def on_canvas_yscroll(self, *args): self.v_scrollbar.set(*args); self.materialize_visible_items()
     def canvas_xview_custom(self, *args): self.canvas.xview(*args); self.password_manager.record_activity()
     def canvas_yview_custom(self, *args): self.canvas.yview(*args); self.password_manager.record_activity()
     def on_mousewheel_scroll(self, event):
@@ -1184,6 +1329,7 @@ class SeatingChartApp:
             if not self.prompt_for_password("Unlock to Save & Quit", "Enter password to save and quit:"): return
         if self.is_live_quiz_active and not self.prompt_end_live_session_on_mode_switch("quiz"): return
         if self.is_live_homework_active and not self.prompt_end_live_session_on_mode_switch("homework"): return # New
+        if not self._finish_export_jobs("quitting"): return
         self.save_data_wrapper(source="save_and_quit")
         self.on_exit_protocol(force_quit=True) # Call main exit to release lock
 
@@ -1219,7 +1365,7 @@ class SeatingChartApp:
                 scores_dict.clear()
                 start_btn.config(state=tk.NORMAL); end_btn.config(state=tk.DISABLED)
                 self.update_status(f"Class {session_type_to_check.capitalize()} session discarded.")
-                self.draw_all_items(check_collisions_on_redraw=True); return True
+                self.request_redraw(check_collisions=True); return True
             else: return False # Cancel
         return True # No active session of this type
 
@@ -1259,7 +1405,7 @@ class SeatingChartApp:
                 self.end_live_homework_btn.config(state=tk.NORMAL if self.is_live_homework_active else tk.DISABLED)
             else: self.live_homework_button_frame.pack_forget()
 
-        self.draw_all_items(check_collisions_on_redraw=True)
+        self.request_redraw(check_collisions=True)
         self.save_data_wrapper(source="toggle_mode")
         self.password_manager.record_activity()
 
@@ -1274,7 +1420,7 @@ class SeatingChartApp:
         is_edit_mode = self.edit_mode_var.get()
         self.update_status(f"Edit Mode {'Enabled. Click item corners to resize' if is_edit_mode else 'Disabled'}.")
         self.toggle_manage_boxes_visibility()
-        self.draw_all_items(check_collisions_on_redraw=True)
+        self.request_redraw(check_collisions=True)
         self.password_manager.record_activity()
 
     def start_live_quiz_session_dialog(self):
@@ -1288,7 +1434,7 @@ class SeatingChartApp:
             self.is_live_quiz_active = True; self.live_quiz_scores.clear()
             self.start_live_quiz_btn.config(state=tk.DISABLED); self.end_live_quiz_btn.config(state=tk.NORMAL)
             self.update_status(f"Class Quiz '{self.current_live_quiz_name}' started. Click a student to mark.")
-            self.draw_all_items(check_collisions_on_redraw=True); self.password_manager.record_activity()
+            self.request_redraw(check_collisions=True); self.password_manager.record_activity()
         else: self.update_status("Class Quiz start cancelled.")
 
     def end_live_quiz_session(self, confirm=True):
@@ -1306,12 +1452,11 @@ class SeatingChartApp:
                              "behavior": self.current_live_quiz_name, "score_details": score_data.copy(),
                              "comment": "From Class Quiz session.", "type": "quiz", "day": datetime.now().strftime('%A')}
                 log_commands.append(LogEntryCommand(self, log_entry, student_id))
-        for cmd in log_commands: self.execute_command(cmd)
-        if log_commands: self.save_data_wrapper(source="end_live_quiz")
+        if log_commands: self.execute_command(CompositeCommand(self, log_commands, f"Class Quiz '{self.current_live_quiz_name}' scores"))
         self.update_status(f"Class Quiz '{self.current_live_quiz_name}' ended. {len(log_commands)} student scores logged.")
         self.is_live_quiz_active = False; self.current_live_quiz_name = ""; self.live_quiz_scores.clear()
         self.start_live_quiz_btn.config(state=tk.NORMAL); self.end_live_quiz_btn.config(state=tk.DISABLED)
-        self.draw_all_items(check_collisions_on_redraw=True); self.password_manager.record_activity()
+        self.request_redraw(check_collisions=True); self.password_manager.record_activity()
 
     def handle_live_quiz_tap(self, student_id):
         if self.password_manager.is_locked:
@@ -1338,7 +1483,7 @@ class SeatingChartApp:
             self.start_live_homework_btn.config(state=tk.DISABLED)
             self.end_live_homework_btn.config(state=tk.NORMAL)
             self.update_status(f"Homework Session '{self.current_live_homework_name}' started. Click a student to mark.")
-            self.draw_all_items(check_collisions_on_redraw=True)
+            self.request_redraw(check_collisions=True)
             self.password_manager.record_activity()
         else:
             self.update_status("Homework Session start cancelled.")
@@ -1370,13 +1515,12 @@ class SeatingChartApp:
                 }
                 log_commands.append(LogHomeworkEntryCommand(self, log_entry, student_id)) # Use homework log command
 
-        for cmd in log_commands: self.execute_command(cmd)
-        if log_commands: self.save_data_wrapper(source="end_live_homework_session")
+        if log_commands: self.execute_command(CompositeCommand(self, log_commands, f"Homework Session '{self.current_live_homework_name}' entries"))
 
         self.update_status(f"Homework Session '{self.current_live_homework_name}' ended. {len(log_commands)} student entries logged.")
         self.is_live_homework_active = False; self.current_live_homework_name = ""; self.live_homework_scores.clear()
         self.start_live_homework_btn.config(state=tk.NORMAL); self.end_live_homework_btn.config(state=tk.DISABLED)
-        self.draw_all_items(check_collisions_on_redraw=True); self.password_manager.record_activity()
+        self.request_redraw(check_collisions=True); self.password_manager.record_activity()
 
     def handle_live_homework_tap(self, student_id):
         if self.password_manager.is_locked:
@@ -1468,7 +1612,7 @@ class SeatingChartApp:
         # or could be split into two separate global toggles if needed.
         self._recent_incidents_hidden_globally = not self._recent_incidents_hidden_globally
         self._recent_homeworks_hidden_globally = self._recent_incidents_hidden_globally # Link them for now
-        self.draw_all_items(check_collisions_on_redraw=True)
+        self.request_redraw(check_collisions=True)
         self.update_toggle_incidents_button_text() # Button text reflects combined state
         status_msg = "Recent behavior/homework logs hidden globally." if self._recent_incidents_hidden_globally else "Recent behavior/homework logs shown globally."
         self.update_status(status_msg)
@@ -1504,7 +1648,6 @@ class SeatingChartApp:
         if not student: return []
 
         summary_lines_list = []
-        log_source = self.behavior_log if log_type_key == "behavior" else self.homework_log
         setting_prefix = "recent_incidents" if log_type_key == "behavior" else "recent_homeworks" # For settings keys
         global_hidden_flag = self._recent_incidents_hidden_globally if log_type_key == "behavior" else self._recent_homeworks_hidden_globally
         behavior_key_in_log = "behavior" if log_type_key == "behavior" else "homework_type" # Or "behavior" for manual homework log
@@ -1519,18 +1662,10 @@ class SeatingChartApp:
 
                 # Adjust filter for log type. Behavior logs have "type":"behavior", quiz logs have "type":"quiz".
                 # Homework logs have "type":"homework" or "type":"homework_session".
-                type_filter_values = []
-                if log_type_key == "behavior": type_filter_values = ["behavior", "quiz"] # Behavior tab shows both
-                elif log_type_key == "homework": type_filter_values = ["homework", "homework_session_y", "homework_session_s"]
+                type_filter_values = BEHAVIOR_LOG_TYPES if log_type_key == "behavior" else HOMEWORK_LOG_TYPES # Behavior tab shows both
 
-
-                all_recent_logs = sorted(
-                    [log for log in log_source
-                     if log["student_id"] == student_id and log.get("type") in type_filter_values and
-                        datetime.fromisoformat(log["timestamp"]) >= cutoff_time and
-                        (not cleared_dt or datetime.fromisoformat(log["timestamp"]) > cleared_dt)],
-                    key=lambda x: x["timestamp"], reverse=True
-                )
+                all_recent_logs = self.log_store.logs_for_student(log_type_key, student_id, type_filter_values, since=cutoff_time, after=cleared_dt)
+                all_recent_logs.reverse() # Newest first
 
                 specific_filter_list = self.settings.get(f"selected_{setting_prefix}_filter", None)
                 filtered_logs = []
@@ -1560,51 +1695,6 @@ class SeatingChartApp:
                     if temp_initials: summary_lines_list.append('  '.join(temp_initials))
         return summary_lines_list
 
-    def _get__logs_for_student(self, student_id, log_type_key, num_max, window, name_of_spec): # "behavior" or "homework"
-        student = self.students.get(student_id)
-        if not student: return []
-        #print(num_max)
-        summary_lines_list = []
-        log_source = self.behavior_log if log_type_key == "behavior" else self.homework_log
-        setting_prefix = "recent_incidents" if log_type_key == "behavior" else "recent_homeworks" # For settings keys
-        global_hidden_flag = self._recent_incidents_hidden_globally if log_type_key == "behavior" else self._recent_homeworks_hidden_globally
-        behavior_key_in_log = "behavior" if log_type_key == "behavior" else "homework_type" # Or "behavior" for manual homework log
-
-        if not global_hidden_flag and self.settings.get(f"show_{setting_prefix}_on_boxes", True):
-            num_to_show = num_max
-            if num_to_show > 0:
-                time_window_hours = window
-                cutoff_time = datetime.now() - timedelta(hours=time_window_hours)
-
-                # Adjust filter for log type. Behavior logs have "type":"behavior", quiz logs have "type":"quiz".
-                # Homework logs have "type":"homework" or "type":"homework_session".
-                type_filter_values = []
-                if log_type_key == "behavior": type_filter_values = ["behavior", "quiz"] # Behavior tab shows both
-                elif log_type_key == "homework": type_filter_values = ["homework", "homework_session_y", "homework_session_s"]
-
-
-                all_recent_logs = sorted(
-                    [log for log in log_source
-                     if log["student_id"] == student_id and log.get("type") in type_filter_values and
-                        datetime.fromisoformat(log["timestamp"]) >= cutoff_time],
-                    key=lambda x: x["timestamp"], reverse=True
-                )
-
-                specific_filter_list = [name_of_spec]
-                filtered_logs = []
-                if specific_filter_list is None: filtered_logs = all_recent_logs
-                elif isinstance(specific_filter_list, list) and not specific_filter_list: filtered_logs = [] # Empty list means filter all
-                elif isinstance(specific_filter_list, list):
-                    filtered_logs = [log for log in all_recent_logs if log.get(behavior_key_in_log, log.get("behavior")) in specific_filter_list]
-
-
-                recent_to_display = filtered_logs[:num_to_show]
-                
-                
-                summary_lines_list = [log.get(behavior_key_in_log, log.get("behavior")) for log in recent_to_display if log.get(behavior_key_in_log, log.get("behavior"))]
-                
-        return len(summary_lines_list)
-
     def update_student_display_text(self, student_id):
         student = self.students.get(student_id)
         if not student: return
@@ -1661,185 +1751,16 @@ class SeatingChartApp:
         student["incident_display_lines"] = incident_display_lines
 
     def applies_to_conditional(self, student_id, rule):
-        student_data = self.students.get(student_id)
-        if not student_data: return False # Student data is essential
-
-        # Preliminary checks based on new rule fields
-        if not rule.get("enabled", True): # Default to enabled if key is missing (should be set by load_data)
-            return False
-
-        # Check active_modes
-        active_modes = rule.get("active_modes", [])
-        if active_modes: # If list is not empty, mode must match
-            current_app_mode = self.mode_var.get() # "behavior", "quiz", "homework"
-            effective_mode = current_app_mode # Base mode
-
-            # Determine more specific "session" modes
-            if current_app_mode == "quiz" and self.is_live_quiz_active:
-                effective_mode = "quiz_session"
-            elif current_app_mode == "homework" and self.is_live_homework_active:
-                effective_mode = "homework_session"
-
-            if effective_mode not in active_modes:
-                return False
-
-        # Check active_times
-        active_times = rule.get("active_times", [])
-        if active_times: # If list is not empty, time must match
-            now = datetime.now()
-            current_time_str = now.strftime("%H:%M")
-            current_day_of_week = now.weekday() # Monday is 0 and Sunday is 6
-
-            time_match_found = False
-            for time_slot in active_times:
-                slot_days = time_slot.get("days_of_week", list(range(7))) # Default to all days if not specified
-                if current_day_of_week in slot_days:
-                    start_time_str = time_slot.get("start_time")
-                    end_time_str = time_slot.get("end_time")
-                    if start_time_str and end_time_str:
-                        if start_time_str <= current_time_str < end_time_str:
-                            time_match_found = True
-                            break
-            if not time_match_found:
-                return False
-
-        # If all preliminary checks passed, proceed to rule-specific logic
-        rule_type = rule.get("type")
-
-        # --- Live Session Conditional Formatting Rules ---
-        if rule_type == "live_quiz_response":
-            if not self.is_live_quiz_active or student_id not in self.live_quiz_scores:
-                return False
-            student_live_score = self.live_quiz_scores[student_id]
-            last_response_mark_id = student_live_score.get("last_response_details") # Assuming this is set by MarkLiveQuizQuestionCommand
-            if not last_response_mark_id: return False
-
-            effective_response_type = ""
-            for mt in self.settings.get("quiz_mark_types", []):
-                if mt["id"] == last_response_mark_id:
-                    if "correct" in mt["name"].lower() or "bonus" in mt["name"].lower() or \
-                       (mt.get("default_points", 0) > 0 and not mt.get("is_extra_credit", False)) or \
-                       (mt.get("default_points", 0) > 0 and mt.get("is_extra_credit", True)):
-                        effective_response_type = "Correct"
-                    elif "incorrect" in mt["name"].lower() or mt.get("default_points", 0) == 0:
-                         effective_response_type = "Incorrect"
-                    break
-
-            rule_quiz_response = rule.get("quiz_response")
-            return bool(effective_response_type and rule_quiz_response and effective_response_type == rule_quiz_response)
-
-        elif rule_type == "live_homework_yes_no":
-            if not self.is_live_homework_active or self.settings.get("live_homework_session_mode") != "Yes/No" or \
-               student_id not in self.live_homework_scores:
-                return False
-            student_hw_data = self.live_homework_scores.get(student_id, {})
-            rule_hw_type_id = rule.get("homework_type_id")
-            rule_hw_response = rule.get("homework_response")
-            return bool(rule_hw_type_id in student_hw_data and student_hw_data[rule_hw_type_id] == rule_hw_response)
-
-        elif rule_type == "live_homework_select":
-            if not self.is_live_homework_active or self.settings.get("live_homework_session_mode") != "Select" or \
-               student_id not in self.live_homework_scores:
-                return False
-            student_hw_data = self.live_homework_scores.get(student_id, {})
-            rule_option_name = rule.get("homework_option_name")
-            return bool("selected_options" in student_hw_data and rule_option_name in student_hw_data["selected_options"])
-
-        # --- Standard Conditional Formatting Rules (Non-Live Session) ---
-        if rule_type == "behavior_count":
-            time_window_hours = rule.get("time_window_hours", 24) # Default if not set
-            count_threshold = rule.get("count_threshold", 1)
-            behavior_name = rule.get("behavior_name", "")
-            if not behavior_name: # Behavior name is essential for this rule type
-                return False
-
-            # _get__logs_for_student returns the count of matching logs to be displayed
-            # The third argument to _get__logs_for_student is num_max (for display),
-            # but here it's used as the threshold for comparison.
-            # This might be okay if _get__logs_for_student correctly counts beyond num_max internally
-            # or if the intent is to check against the *displayed* count.
-            # For now, assuming existing logic of _get__logs_for_student is what's intended.
-            actual_count = self._get__logs_for_student(student_id, "behavior", count_threshold, time_window_hours, behavior_name)
-            
-            # The comparison was actual_count >= count_threshold.
-            # If _get__logs_for_student returns a count that is capped by its num_max (which is count_threshold here),
-            # then (result >= count_threshold) would only be true if result == count_threshold.
-            # This needs careful check of _get__logs_for_student's behavior or adjustment here.
-            # For now, sticking to the original comparison structure.
-            if actual_count >= count_threshold:
-                return True
-            return False # Explicitly return False if condition not met
-
-        elif rule_type == "quiz_score_threshold":
-            operator = rule.get("operator", "<=")
-            quiz_name_contains = rule.get("quiz_name_contains", "")
-            score_threshold_percent = rule.get("score_threshold_percent", 50.0)
-            
-            # Placeholder for actual quiz score logic - to be implemented next
-            # This will iterate through relevant quiz logs for the student
-            # calculate score % and compare.
-            for log_entry in self.behavior_log:
-                if log_entry.get("student_id") == student_id and log_entry.get("type") == "quiz":
-                    # Check quiz name
-                    if quiz_name_contains and quiz_name_contains.lower() not in log_entry.get("behavior", "").lower():
-                        continue
-
-                    current_score_percentage = self._calculate_quiz_score_percentage(log_entry)
-                    if current_score_percentage is None:
-                        continue
-
-                    # Compare with threshold
-                    if operator == "<=" and current_score_percentage <= score_threshold_percent: return True
-                    elif operator == ">=" and current_score_percentage >= score_threshold_percent: return True
-                    elif operator == "==" and abs(current_score_percentage - score_threshold_percent) < 0.01 : return True # Using tolerance for float comparison
-                    elif operator == "<" and current_score_percentage < score_threshold_percent: return True
-                    elif operator == ">" and current_score_percentage > score_threshold_percent: return True
-            return False # No matching quiz log found or condition not met
-
-        elif rule_type == "quiz_mark_count":
-            quiz_name_contains = rule.get("quiz_name_contains", "").lower()
-            mark_type_id_to_check = rule.get("mark_type_id")
-            operator = rule.get("mark_operator", ">=") # Default operator
-            count_threshold = rule.get("mark_count_threshold", 1)
-
-            if not mark_type_id_to_check: # Mark type ID is essential
-                return False
-
-            for log_entry in self.behavior_log:
-                if log_entry.get("student_id") == student_id and log_entry.get("type") == "quiz":
-                    # Check quiz name
-                    if quiz_name_contains and quiz_name_contains not in log_entry.get("behavior", "").lower():
-                        continue
-
-                    marks_data = log_entry.get("marks_data", {})
-                    actual_count = marks_data.get(mark_type_id_to_check, 0) # Default to 0 if mark_type not in log
-
-                    if not isinstance(actual_count, (int, float)): # Ensure we are comparing numbers
-                        actual_count = 0
-
-                    # Compare with threshold
-                    if operator == ">=" and actual_count >= count_threshold: return True
-                    elif operator == "<=" and actual_count <= count_threshold: return True
-                    elif operator == "==" and actual_count == count_threshold: return True
-                    elif operator == ">" and actual_count > count_threshold: return True
-                    elif operator == "<" and actual_count < count_threshold: return True
-                    elif operator == "!=" and actual_count != count_threshold: return True
-            return False # No matching quiz log found or condition not met
-
-        elif rule_type == "group":
-            # Group rules are handled directly in draw_single_student before this method is called.
-            # If it reaches here, it means it's not a group rule being evaluated by this function.
-            return False
-        
-        return False # Default for unknown or unhandled rule types
-        #if student_data.get()
+        """Whether one conditional formatting rule applies to a student now. Student boxes use the cached conditional_formatting.formatting_for()."""
+        return self.conditional_formatting.rule_applies(student_id, rule)
         
     def draw_single_student(self, student_id, check_collisions=False):
         # ... (largely same as v51, but needs to handle new "homework_score_header/item" and "separator" types for drawing)
         # This method is long, so I'll highlight the key change area for incident_display_lines
         try:
             student_data = self.students.get(student_id)
-            if not student_data: return
+            if not student_data:
+                self.renderer.remove(student_id); self._student_layout_cache.pop(student_id, None); return
             self.update_student_display_text(student_id)
 
             style_overrides = student_data.get("style_overrides", {})
@@ -1886,148 +1807,90 @@ class SeatingChartApp:
 
             group_id = student_data.get("group_id"); group_indicator_color = None
             if self.settings.get("student_groups_enabled", True) and group_id and group_id in self.student_groups:
-                group_data = self.student_groups[group_id]
-                group_indicator_color = group_data.get("color")
-                # Apply the first matching group rule to the base fill_color and outline_color_orig
-                for rule in self.settings.get("conditional_formatting_rules", []):
-                    if rule.get("type") == "group" and rule.get("group_id") == group_id:
-                        if rule.get("color"): # Check if color is not empty or None
-                            fill_color = rule["color"]
-                        if rule.get("outline"): # Check if outline is not empty or None
-                            outline_color_orig = rule["outline"]
-                        break # First matching group rule takes precedence for base colors
-
-            # Now, collect all other (non-group) applicable conditional formatting rules
-            active_rules_colors = []
-            # Base colors that will be used if no other rules apply or for the first stripe.
-            # These might have been set by a group rule already.
-            # If active_rules_colors remains empty, these base colors will be used for the whole box.
-            
-            # Store the base colors derived from defaults, overrides, or group rules.
-            # These will be used if no other active_rules_colors are found, or as the first "layer" if we decide to.
-            # For now, if active_rules_colors gets populated, those will define the stripes.
-            # If active_rules_colors is empty, the single fill_color/outline_color_orig will be used.
-
-            if self.settings.get("conditional_formatting_rules", []):
-                for rule in self.settings.get("conditional_formatting_rules", []):
-                    if rule.get("type") == "group":
-                        continue  # Group rules already processed for base color
-
-                    if self.applies_to_conditional(student_id, rule):
-                        rule_fill = rule.get("color")
-                        rule_outline = rule.get("outline")
-                        if rule_fill or rule_outline: # Only add if the rule specifies a color
-                            active_rules_colors.append({
-                                "fill": rule_fill if rule_fill else None,
-                                "outline": rule_outline if rule_outline else None
-                            })
-                            # No break here, collect all matching non-group rules.
-            
-            # If active_rules_colors is empty, the drawing logic
-            # will use the existing fill_color and outline_color_orig for the single rectangle.
-            # If populated, it will draw stripes based on these collected colors.
-            # The original fill_color and outline_color_orig (potentially set by a group rule)
-            # can be considered the "base" if no other rules apply.
-
-            live_override_applied = False
-            # Process override rules first for live sessions
-            if self.is_live_quiz_active or self.is_live_homework_active:
-                for rule in self.settings.get("conditional_formatting_rules", []):
-                    if rule.get("type") in ["live_quiz_response", "live_homework_yes_no", "live_homework_select"] and \
-                       rule.get("application_style") == "override":
-                        if self.applies_to_conditional(student_id, rule):
-                            if rule.get("color"): fill_color = rule["color"]
-                            if rule.get("outline"): outline_color_orig = rule["outline"]
-                            active_rules_colors = []  # Clear any standard stripes if overridden
-                            live_override_applied = True
-                            break
-
-            # Collect stripe rules (standard and live, if no live override took place)
-            if not live_override_applied:
-                active_rules_colors = [] # Ensure it's clean before collecting stripes
-                for rule in self.settings.get("conditional_formatting_rules", []):
-                    rule_type = rule.get("type")
-                    is_live_rule = rule_type in ["live_quiz_response", "live_homework_yes_no", "live_homework_select"]
-
-                    if rule_type == "group":
-                        continue
+                group_indicator_color = self.student_groups[group_id].get("color")
 
-                    applies_now = False
-                    if is_live_rule:
-                        if rule.get("application_style") == "stripe":
-                            if (self.is_live_quiz_active and rule_type == "live_quiz_response") or \
-                               (self.is_live_homework_active and rule_type in ["live_homework_yes_no", "live_homework_select"]):
-                                applies_now = self.applies_to_conditional(student_id, rule)
-                    else:
-                        applies_now = self.applies_to_conditional(student_id, rule)
-
-                    if applies_now:
-                        rule_fill = rule.get("color")
-                        rule_outline = rule.get("outline")
-                        if rule_fill or rule_outline:
-                            active_rules_colors.append({
-                                "fill": rule_fill if rule_fill else None,
-                                "outline": rule_outline if rule_outline else None
-                            })
+            # Rule colors: a group rule sets the base colors, a live session override replaces them, other rules add stripes
+            formatting = self.conditional_formatting.formatting_for(student_id)
+            if formatting.fill: fill_color = formatting.fill
+            if formatting.outline: outline_color_orig = formatting.outline
+            active_rules_colors = formatting.stripes
 
-            # Font setup using new specific settings
-            name_font_obj = tkfont.Font(family=font_family, size=font_size_canvas, weight="bold")
+            # Font setup using new specific settings (fonts and their metrics are cached across redraws)
+            fonts = self.font_cache
+            name_font_obj = fonts.font(font_family, font_size_canvas, "bold")
 
             behavior_log_font_size_canvas = int(max(5, self.settings.get("behavior_log_font_size", DEFAULT_FONT_SIZE -1) * self.current_zoom_level))
-            incident_font_obj = tkfont.Font(family=font_family, size=behavior_log_font_size_canvas)
+            incident_font_obj = fonts.font(font_family, behavior_log_font_size_canvas)
 
             quiz_log_font_size_canvas = int(max(5, self.settings.get("quiz_log_font_size", DEFAULT_FONT_SIZE) * self.current_zoom_level))
             quiz_score_font_color_setting = self.settings.get("live_quiz_score_font_color")
             quiz_score_font_bold_setting = self.settings.get("live_quiz_score_font_style_bold")
             quiz_score_font_weight = "bold" if quiz_score_font_bold_setting else "normal"
-            quiz_score_font_obj = tkfont.Font(family=font_family, size=quiz_log_font_size_canvas, weight=quiz_score_font_weight)
+            quiz_score_font_obj = fonts.font(font_family, quiz_log_font_size_canvas, quiz_score_font_weight)
 
             homework_log_font_size_canvas = int(max(5, self.settings.get("homework_log_font_size", DEFAULT_FONT_SIZE -1) * self.current_zoom_level))
             hw_score_font_color_setting = self.settings.get("live_homework_score_font_color", DEFAULT_HOMEWORK_SCORE_FONT_COLOR)
             hw_score_font_bold_setting = self.settings.get("live_homework_score_font_style_bold", DEFAULT_HOMEWORK_SCORE_FONT_STYLE_BOLD)
             hw_score_font_weight = "bold" if hw_score_font_bold_setting else "normal"
             # For homework_score_header, use the dedicated homework_log_font_size
-            hw_score_font_obj = tkfont.Font(family=font_family, size=homework_log_font_size_canvas, weight=hw_score_font_weight)
+            hw_score_font_obj = fonts.font(font_family, homework_log_font_size_canvas, hw_score_font_weight)
             # For homework_score_item, also use homework_log_font_size (or could be a new setting if finer control is needed)
-            hw_score_item_font_obj = tkfont.Font(family=font_family, size=homework_log_font_size_canvas, weight=hw_score_font_weight)
+            hw_score_item_font_obj = fonts.font(font_family, homework_log_font_size_canvas, hw_score_font_weight)
             
-            self.canvas.delete(student_id)
+            self.renderer.begin(student_id)
             rect_tag = ("student_item", student_id, "rect")
 
             world_padding = 5; canvas_padding = world_padding * self.current_zoom_level
-            current_y_offset_for_calc_world = world_padding
-            for name_line_text in student_data.get("display_lines", []):
-                font_for_calc = tkfont.Font(family=font_family, size=font_size_world, weight="bold")
-                current_y_offset_for_calc_world += font_for_calc.metrics('linespace')
-
-            if student_data.get("incident_display_lines"):
-                current_y_offset_for_calc_world += world_padding / 2
-                for line_info in student_data.get("incident_display_lines", []):
-                    line_text, line_type = line_info["text"], line_info["type"]
-                    current_font_world_calc = tkfont.Font(family=font_family, size=font_size_world -1)
-                    if line_type == "quiz_score": current_font_world_calc = tkfont.Font(family=font_family, size=font_size_world, weight=quiz_score_font_weight)
-                    elif line_type == "homework_score_header": current_font_world_calc = tkfont.Font(family=font_family, size=font_size_world, weight=hw_score_font_weight)
-                    elif line_type == "homework_score_item": current_font_world_calc = tkfont.Font(family=font_family, size=max(5, font_size_world -1), weight=hw_score_font_weight)
-                    elif line_type == "separator": current_font_world_calc = tkfont.Font(family=font_family, size=max(4, font_size_world -2)) # Smaller for separator
-
-                    text_width_pixels_world = current_font_world_calc.measure(line_text)
-                    visual_lines_world = 1
-                    available_width_for_text_world = world_width - 2 * world_padding
-                    if available_width_for_text_world > 0 and text_width_pixels_world > available_width_for_text_world:
-                        visual_lines_world = -(-text_width_pixels_world // available_width_for_text_world)
-                    current_y_offset_for_calc_world += visual_lines_world * current_font_world_calc.metrics('linespace')
-
-            world_text_content_height_with_padding = current_y_offset_for_calc_world + world_padding
+            # The text layout in world units does not depend on zoom, so it is only redone when the text or fonts change
+            layout_key = (tuple(student_data.get("display_lines", [])),
+                          tuple((line_info["text"], line_info["type"]) for line_info in student_data.get("incident_display_lines", [])),
+                          font_family, font_size_world, quiz_score_font_weight, hw_score_font_weight, world_width)
+            cached_layout = self._student_layout_cache.get(student_id)
+            if cached_layout is not None and cached_layout[0] == layout_key:
+                world_text_content_height_with_padding = cached_layout[1]
+            else:
+                current_y_offset_for_calc_world = world_padding
+                for name_line_text in student_data.get("display_lines", []):
+                    font_for_calc = fonts.font(font_family, font_size_world, "bold")
+                    current_y_offset_for_calc_world += fonts.linespace(font_for_calc)
+
+                if student_data.get("incident_display_lines"):
+                    current_y_offset_for_calc_world += world_padding / 2
+                    for line_info in student_data.get("incident_display_lines", []):
+                        line_text, line_type = line_info["text"], line_info["type"]
+                        current_font_world_calc = fonts.font(font_family, font_size_world -1)
+                        if line_type == "quiz_score": current_font_world_calc = fonts.font(font_family, font_size_world, quiz_score_font_weight)
+                        elif line_type == "homework_score_header": current_font_world_calc = fonts.font(font_family, font_size_world, hw_score_font_weight)
+                        elif line_type == "homework_score_item": current_font_world_calc = fonts.font(font_family, max(5, font_size_world -1), hw_score_font_weight)
+                        elif line_type == "separator": current_font_world_calc = fonts.font(font_family, max(4, font_size_world -2)) # Smaller for separator
+
+                        text_width_pixels_world = fonts.measure(current_font_world_calc, line_text)
+                        visual_lines_world = 1
+                        available_width_for_text_world = world_width - 2 * world_padding
+                        if available_width_for_text_world > 0 and text_width_pixels_world > available_width_for_text_world:
+                            visual_lines_world = -(-text_width_pixels_world // available_width_for_text_world)
+                        current_y_offset_for_calc_world += visual_lines_world * fonts.linespace(current_font_world_calc)
+
+                world_text_content_height_with_padding = current_y_offset_for_calc_world + world_padding
+                self._student_layout_cache[student_id] = (layout_key, world_text_content_height_with_padding)
             world_dynamic_height = max(world_base_height, world_text_content_height_with_padding)
             canvas_dynamic_height = world_dynamic_height * self.current_zoom_level
             student_data['_current_world_height'] = world_dynamic_height
             student_data['_current_world_width'] = world_width
+            self.update_spatial_index(student_id)
+
+            lod = self.current_lod_level()
+            if lod == LOD_LOW and active_rules_colors:
+                # Too small for stripes to be told apart; the box takes the color of the first rule that applies
+                fill_color = active_rules_colors[0].get("fill") or fill_color
+                outline_color_orig = active_rules_colors[0].get("outline") or outline_color_orig
+                active_rules_colors = []
 
             # Box drawing logic:
             if not active_rules_colors:
                 # No specific non-group rules apply, draw a single box with base/group colors
-                self.canvas.create_rectangle(canvas_x, canvas_y, canvas_x + canvas_width, canvas_y + canvas_dynamic_height,
-                                             fill=fill_color, outline=outline_color_orig, width=max(1, int(2 * self.current_zoom_level)), tags=rect_tag)
+                self.renderer.item("rectangle", "rect", (canvas_x, canvas_y, canvas_x + canvas_width, canvas_y + canvas_dynamic_height),
+                                   fill=fill_color, outline=outline_color_orig, width=max(1, int(2 * self.current_zoom_level)), tags=rect_tag)
             else:
                 num_effective_rules = min(len(active_rules_colors), 3) # Max 3 stripes
                 stripe_height_canvas = canvas_dynamic_height / num_effective_rules
@@ -2051,7 +1914,7 @@ class SeatingChartApp:
                     if i == num_effective_rules - 1:
                         stripe_y_end = canvas_y + canvas_dynamic_height
 
-                    self.canvas.create_rectangle(canvas_x, stripe_y_start, canvas_x + canvas_width, stripe_y_end,
+                    self.renderer.item("rectangle", ("stripe", i), (canvas_x, stripe_y_start, canvas_x + canvas_width, stripe_y_end),
                                                  fill=stripe_fill,
                                                  outline=stripe_outline,
                                                  width=max(1, int(1 * self.current_zoom_level)), # Thinner outline for stripes
@@ -2061,7 +1924,7 @@ class SeatingChartApp:
             current_y_text_draw_canvas = canvas_y + canvas_padding
             available_text_width_canvas = canvas_width - 2 * canvas_padding
             colored = True if self.settings.get("always_show_text_background_panel", False) or active_rules_colors else False
-            if self.settings.get("enable_text_background_panel", True) and colored:
+            if lod == LOD_FULL and self.settings.get("enable_text_background_panel", True) and colored:
                 text_panel_fill = "#F0F0F0" # Light gray for text background
                 text_panel_internal_padding = 2 * self.current_zoom_level # Small padding around text within its panel
 
@@ -2071,8 +1934,8 @@ class SeatingChartApp:
                     name_block_height_canvas = 0
                     max_name_width_pixels = 0
                     for name_line_text_calc in name_lines_content_for_panel:
-                        name_block_height_canvas += name_font_obj.metrics('linespace')
-                        max_name_width_pixels = max(max_name_width_pixels, name_font_obj.measure(name_line_text_calc))
+                        name_block_height_canvas += fonts.linespace(name_font_obj)
+                        max_name_width_pixels = max(max_name_width_pixels, fonts.measure(name_font_obj, name_line_text_calc))
 
                     name_panel_width = min(max_name_width_pixels + 2 * text_panel_internal_padding, available_text_width_canvas - 2 * text_panel_internal_padding)
                     name_panel_height = name_block_height_canvas
@@ -2083,7 +1946,7 @@ class SeatingChartApp:
                     name_panel_y1 = name_panel_y0 + name_panel_height + 2 * text_panel_internal_padding
 
                     if name_panel_y1 < (canvas_y + canvas_dynamic_height - canvas_padding * 0.5):
-                        self.canvas.create_rectangle(name_panel_x0, name_panel_y0, name_panel_x1, name_panel_y1,
+                        self.renderer.item("rectangle", "name_panel", (name_panel_x0, name_panel_y0, name_panel_x1, name_panel_y1),
                                                      fill=text_panel_fill, outline="",
                                                      tags=("student_item", student_id, "text_background_name"))
 
@@ -2091,7 +1954,7 @@ class SeatingChartApp:
                 incident_lines_content_for_panel = student_data.get("incident_display_lines", [])
                 if incident_lines_content_for_panel:
                     incident_block_start_y_for_panel = (canvas_y + canvas_padding) + \
-                                                       sum(name_font_obj.metrics('linespace') for _ in name_lines_content_for_panel) + \
+                                                       sum(fonts.linespace(name_font_obj) for _ in name_lines_content_for_panel) + \
                                                        (canvas_padding / 2 if name_lines_content_for_panel else 0)
                     incident_block_height_canvas = 0
                     max_incident_width_pixels = 0
@@ -2102,14 +1965,14 @@ class SeatingChartApp:
                         if line_type_calc == "quiz_score": current_font_for_calc = quiz_score_font_obj
                         elif line_type_calc == "homework_score_header": current_font_for_calc = hw_score_font_obj
                         elif line_type_calc == "homework_score_item": current_font_for_calc = hw_score_item_font_obj
-                        elif line_type_calc == "separator": current_font_for_calc = tkfont.Font(family=font_family, size=max(4, int((font_size_world-2)*self.current_zoom_level)))
+                        elif line_type_calc == "separator": current_font_for_calc = fonts.font(font_family, max(4, int((font_size_world-2)*self.current_zoom_level)))
 
-                        text_width_pixels_canvas_calc = current_font_for_calc.measure(line_text_calc)
+                        text_width_pixels_canvas_calc = fonts.measure(current_font_for_calc, line_text_calc)
                         available_incident_text_width_calc = available_text_width_canvas - (text_panel_internal_padding if line_type_calc == "homework_score_item" else 0)
                         visual_lines_calc = 1
                         if available_incident_text_width_calc > 0 and text_width_pixels_canvas_calc > available_incident_text_width_calc:
                             visual_lines_calc = -(-text_width_pixels_canvas_calc // available_incident_text_width_calc)
-                        incident_block_height_canvas += visual_lines_calc * current_font_for_calc.metrics('linespace')
+                        incident_block_height_canvas += visual_lines_calc * fonts.linespace(current_font_for_calc)
                         max_incident_width_pixels = max(max_incident_width_pixels, min(text_width_pixels_canvas_calc, available_incident_text_width_calc))
 
                     if incident_block_height_canvas > 0:
@@ -2122,24 +1985,32 @@ class SeatingChartApp:
                         inc_panel_y1 = inc_panel_y0 + incident_panel_height + 2 * text_panel_internal_padding
 
                         if inc_panel_y1 < (canvas_y + canvas_dynamic_height - canvas_padding * 0.5):
-                             self.canvas.create_rectangle(inc_panel_x0, inc_panel_y0, inc_panel_x1, inc_panel_y1,
+                             self.renderer.item("rectangle", "incident_panel", (inc_panel_x0, inc_panel_y0, inc_panel_x1, inc_panel_y1),
                                                          fill=text_panel_fill, outline="",
                                                          tags=("student_item", student_id, "text_background_incidents"))
 
-            # Draw Name Lines (always drawn, panel is conditional)
-            name_lines_content = student_data.get("display_lines", [])
-            for name_line_text in name_lines_content:
-                self.canvas.create_text(canvas_x + canvas_width / 2, current_y_text_draw_canvas, text=name_line_text,
+            if lod == LOD_LOW:
+                first_name = student_data.get("nickname") or student_data.get("first_name", "")
+                initials = (first_name[:1] + student_data.get("last_name", "")[:1]).upper() or student_data.get("full_name", "")[:2]
+                initials_font_obj = fonts.font(font_family, int(max(6, font_size_world * 1.5 * self.current_zoom_level)), "bold")
+                self.renderer.item("text", "initials", (canvas_x + canvas_width / 2, canvas_y + canvas_dynamic_height / 2), text=initials,
+                                   fill=font_color, font=initials_font_obj, tags=("student_item", student_id, "text", "student_name"),
+                                   anchor=tk.CENTER, width=max(1, canvas_width), justify=tk.CENTER)
+
+            # Draw Name Lines (panel is conditional; not drawn at the lowest level of detail)
+            name_lines_content = student_data.get("display_lines", []) if lod != LOD_LOW else []
+            for name_line_num, name_line_text in enumerate(name_lines_content):
+                self.renderer.item("text", ("name", name_line_num), (canvas_x + canvas_width / 2, current_y_text_draw_canvas), text=name_line_text,
                                         fill=font_color, font=name_font_obj, tags=("student_item", student_id, "text", "student_name"),
                                         anchor=tk.N, width=max(1, available_text_width_canvas), justify=tk.CENTER)
-                current_y_text_draw_canvas += name_font_obj.metrics('linespace')
+                current_y_text_draw_canvas += fonts.linespace(name_font_obj)
 
-            # Draw Incident/Score Lines (always drawn, panel is conditional)
-            incident_lines_content = student_data.get("incident_display_lines", [])
+            # Draw Incident/Score Lines (only at full detail, panel is conditional)
+            incident_lines_content = student_data.get("incident_display_lines", []) if lod == LOD_FULL else []
             if incident_lines_content:
                 current_y_text_draw_canvas += canvas_padding / 2 # Space before incidents
 
-                for line_info in incident_lines_content:
+                for line_num, line_info in enumerate(incident_lines_content):
                     line_text, line_type = line_info["text"], line_info["type"]
                     current_font_canvas_draw, current_color_canvas_draw = incident_font_obj, font_color
                     text_anchor_canvas, text_justify_canvas = tk.N, tk.CENTER
@@ -2152,118 +2023,84 @@ class SeatingChartApp:
                         text_anchor_canvas, text_justify_canvas = tk.NW, tk.LEFT
                         text_x_pos_canvas = canvas_x + canvas_padding
                     elif line_type == "separator":
-                        current_font_canvas_draw = tkfont.Font(family=font_family, size=max(4, int((font_size_world-2)*self.current_zoom_level)))
+                        current_font_canvas_draw = fonts.font(font_family, max(4, int((font_size_world-2)*self.current_zoom_level)))
                         current_color_canvas_draw = "gray"
 
-                    self.canvas.create_text(text_x_pos_canvas, current_y_text_draw_canvas, text=line_text,
+                    self.renderer.item("text", ("line", line_num), (text_x_pos_canvas, current_y_text_draw_canvas), text=line_text,
                                             fill=current_color_canvas_draw, font=current_font_canvas_draw,
                                             tags=("student_item", student_id, "text", f"student_{line_type}"),
                                             anchor=text_anchor_canvas, width=max(1, available_text_width_canvas if text_anchor_canvas == tk.N else available_text_width_canvas - canvas_padding),
                                             justify=text_justify_canvas)
-                    text_width_pixels_canvas = current_font_canvas_draw.measure(line_text)
+                    text_width_pixels_canvas = fonts.measure(current_font_canvas_draw, line_text)
                     visual_lines_canvas = 1
                     if available_text_width_canvas > 0 and text_width_pixels_canvas > available_text_width_canvas:
                         visual_lines_canvas = -(-text_width_pixels_canvas // available_text_width_canvas)
-                    current_y_text_draw_canvas += visual_lines_canvas * current_font_canvas_draw.metrics('linespace')
+                    current_y_text_draw_canvas += visual_lines_canvas * fonts.linespace(current_font_canvas_draw)
 
-            if self.settings.get("student_groups_enabled", True) and group_indicator_color:
+            if lod != LOD_LOW and self.settings.get("student_groups_enabled", True) and group_indicator_color:
                 indicator_size_canvas = GROUP_COLOR_INDICATOR_SIZE * self.current_zoom_level
                 indicator_padding_canvas = 2 * self.current_zoom_level
                 indicator_x = canvas_x + canvas_width - indicator_size_canvas - indicator_padding_canvas
                 indicator_y = canvas_y + indicator_padding_canvas
-                self.canvas.create_rectangle(indicator_x, indicator_y, indicator_x + indicator_size_canvas, indicator_y + indicator_size_canvas,
+                self.renderer.item("rectangle", "group_indicator", (indicator_x, indicator_y, indicator_x + indicator_size_canvas, indicator_y + indicator_size_canvas),
                                             fill=group_indicator_color, outline=outline_color_orig, tags=("student_item", student_id, "group_indicator"))
             if student_id in self.selected_items:
                 sel_outline_width = max(1, int(2 * self.current_zoom_level))
-                self.canvas.create_rectangle(canvas_x - sel_outline_width, canvas_y - sel_outline_width,
-                                             canvas_x + canvas_width + sel_outline_width, canvas_y + canvas_dynamic_height + sel_outline_width,
+                self.renderer.item("rectangle", "selection_highlight", (canvas_x - sel_outline_width, canvas_y - sel_outline_width,
+                                             canvas_x + canvas_width + sel_outline_width, canvas_y + canvas_dynamic_height + sel_outline_width),
                                              outline="red", width=sel_outline_width, tags=("student_item", student_id, "selection_highlight"))
             if self.edit_mode_var.get() and student_id in self.selected_items:
                 handle_size_canvas = RESIZE_HANDLE_SIZE * self.current_zoom_level
                 br_x = canvas_x + canvas_width - handle_size_canvas / 2 # Center handle on corner
                 br_y = canvas_y + canvas_dynamic_height - handle_size_canvas / 2
-                self.canvas.create_rectangle(br_x - handle_size_canvas/2, br_y - handle_size_canvas/2,
-                                             br_x + handle_size_canvas/2, br_y + handle_size_canvas/2,
+                self.renderer.item("rectangle", "resize_handle", (br_x - handle_size_canvas/2, br_y - handle_size_canvas/2,
+                                             br_x + handle_size_canvas/2, br_y + handle_size_canvas/2),
                                              fill="gray", outline="black", tags=("student_item", student_id, "resize_handle", "br_handle"))
+            self.renderer.end()
             if check_collisions and self.settings.get("check_for_collisions", True): self.handle_layout_collision(student_id)
         except AttributeError: pass # Canvas might not be fully initialized during early calls
 
     def _calculate_stat(self, stat_type):
-        today = datetime.now().date()
+        # Today's totals are kept up to date by the log store as entries are added and removed
+        totals = self.log_store.day_totals(datetime.now().date())
 
         if stat_type == "student_presence_percentage":
             total_students = len(self.students)
             if total_students == 0: return "N/A"
-            present_student_ids = {log['student_id'] for log in self.behavior_log if datetime.fromisoformat(log['timestamp']).date() == today}
-            present_student_ids.update({log['student_id'] for log in self.homework_log if datetime.fromisoformat(log['timestamp']).date() == today})
-            percentage = (len(present_student_ids) / total_students) * 100
+            percentage = (len(totals.presence) / total_students) * 100
             return f"{percentage:.0f}% Present"
 
         elif stat_type == "student_presence_fraction":
             total_students = len(self.students)
             if total_students == 0: return "N/A"
-            present_student_ids = {log['student_id'] for log in self.behavior_log if datetime.fromisoformat(log['timestamp']).date() == today}
-            present_student_ids.update({log['student_id'] for log in self.homework_log if datetime.fromisoformat(log['timestamp']).date() == today})
-            return f"{len(present_student_ids)}/{total_students} Present"
+            return f"{len(totals.presence)}/{total_students} Present"
 
         elif stat_type == "class_good_behavior_percentage" or stat_type == "class_bad_behavior_percentage":
-            good_behaviors = {b['name'] for b in self.custom_behaviors if b.get('category') == 'Good'}
-            bad_behaviors = {b['name'] for b in self.custom_behaviors if b.get('category') == 'Bad'}
-
-            total_behavior_logs = 0
-            target_behavior_logs = 0
-
-            for log in self.behavior_log:
-                if datetime.fromisoformat(log['timestamp']).date() == today and log.get('type') == 'behavior':
-                    total_behavior_logs += 1
-                    behavior = log.get('behavior')
-                    if stat_type == "class_good_behavior_percentage" and behavior in good_behaviors:
-                        target_behavior_logs += 1
-                    elif stat_type == "class_bad_behavior_percentage" and behavior in bad_behaviors:
-                        target_behavior_logs += 1
-
+            category = "Good" if stat_type == "class_good_behavior_percentage" else "Bad"
+            target_behaviors = {b['name'] for b in self.custom_behaviors if b.get('category') == category}
+            total_behavior_logs = totals.behavior_total
             if total_behavior_logs == 0: return "No Behaviors Logged"
+            target_behavior_logs = sum(count for behavior, count in totals.behavior_counts.items() if behavior in target_behaviors)
             percentage = (target_behavior_logs / total_behavior_logs) * 100
-            label = "Good" if stat_type == "class_good_behavior_percentage" else "Bad"
-            return f"{percentage:.0f}% {label}"
+            return f"{percentage:.0f}% {category}"
 
         elif stat_type == "average_quiz_score":
-            quiz_scores = []
-            for log in self.behavior_log:
-                if datetime.fromisoformat(log['timestamp']).date() == today and log.get('type') == 'quiz':
-                    score = self._calculate_quiz_score_percentage(log)
-                    if score is not None:
-                        quiz_scores.append(score)
-
-            if not quiz_scores: return "No Quizzes"
-            average_score = sum(quiz_scores) / len(quiz_scores)
+            if not totals.quiz_score_count: return "No Quizzes"
+            average_score = totals.quiz_score_sum / totals.quiz_score_count
             return f"{average_score:.1f}% Avg Score"
 
         elif stat_type == "homework_completion_percentage":
-            total_homework_logs = 0
-            completed_homework_logs = 0
-            for log in self.homework_log:
-                if datetime.fromisoformat(log['timestamp']).date() == today:
-                    total_homework_logs += 1
-                    # Simplified completion logic: "Done" or "Complete" in status/details
-                    if "Done" in log.get('homework_status', '') or "Complete" in log.get('homework_status', ''):
-                        completed_homework_logs += 1
-                    elif log.get('type') == 'homework_session_y':
-                        if any(v == 'yes' for v in log.get('homework_details', {}).values()):
-                            completed_homework_logs += 1 # Count if at least one item is 'yes'
-                    elif log.get('type') == 'homework_session_s':
-                        if "Done" in log.get('homework_details', {}).get('selected_options', []) or "Complete" in log.get('homework_details', {}).get('selected_options', []):
-                            completed_homework_logs += 1
-
-            if total_homework_logs == 0: return "No Homework"
-            completion_percentage = (completed_homework_logs / total_homework_logs) * 100
+            if totals.homework_total == 0: return "No Homework"
+            completion_percentage = (totals.homework_completed / totals.homework_total) * 100
             return f"{completion_percentage:.0f}% Complete"
 
         return "Unknown Stat"
 
     def draw_single_stat_box(self, stat_box_id):
         item_data = self.stat_boxes.get(stat_box_id)
-        if not item_data: return
+        if not item_data:
+            if self.renderer: self.renderer.remove(stat_box_id)
+            return
         world_x, world_y = item_data["x"], item_data["y"]
         world_width = item_data.get("width", DEFAULT_STUDENT_BOX_WIDTH)
         world_height = item_data.get("height", DEFAULT_STUDENT_BOX_HEIGHT)
@@ -2272,42 +2109,46 @@ class SeatingChartApp:
         canvas_height = world_height * self.current_zoom_level
         item_data['_current_world_height'] = world_height
         item_data['_current_world_width'] = world_width
+        self.update_spatial_index(stat_box_id)
         fill_color = item_data.get("fill_color", "lightyellow")
         outline_color = item_data.get("outline_color", "goldenrod")
         name = item_data.get("name", "Stat Box")
         try:
-            self.canvas.delete(stat_box_id)
+            self.renderer.begin(stat_box_id)
             rect_tag = ("stat_box_item", stat_box_id, "rect")
-            self.canvas.create_rectangle(canvas_x, canvas_y, canvas_x + canvas_width, canvas_y + canvas_height,
-                                         fill=fill_color, outline=outline_color, width=max(1, int(2*self.current_zoom_level)), tags=rect_tag)
+            self.renderer.item("rectangle", "rect", (canvas_x, canvas_y, canvas_x + canvas_width, canvas_y + canvas_height),
+                               fill=fill_color, outline=outline_color, width=max(1, int(2*self.current_zoom_level)), tags=rect_tag)
             font_size_canvas = int(max(6, (self.settings.get("student_font_size", DEFAULT_FONT_SIZE) -1) * self.current_zoom_level))
             font_spec = (self.settings.get("student_font_family", DEFAULT_FONT_FAMILY), font_size_canvas)
 
             # Stat display logic will go here
             stat_text = self._calculate_stat(item_data.get("stat_type"))
 
-            self.canvas.create_text(canvas_x + canvas_width / 2, canvas_y + canvas_height / 2, text=f"{name}\n{stat_text}",
+            self.renderer.item("text", "text", (canvas_x + canvas_width / 2, canvas_y + canvas_height / 2), text=f"{name}\n{stat_text}",
                                     fill=self.settings.get("student_font_color", DEFAULT_FONT_COLOR), font=font_spec,
                                     tags=("stat_box_item", stat_box_id, "text"), anchor=tk.CENTER,
                                     width=max(1, canvas_width - int(10*self.current_zoom_level)), justify=tk.CENTER)
             if stat_box_id in self.selected_items:
                 sel_outline_width = max(1, int(2 * self.current_zoom_level))
-                self.canvas.create_rectangle(canvas_x - sel_outline_width, canvas_y - sel_outline_width,
-                                             canvas_x + canvas_width + sel_outline_width, canvas_y + canvas_height + sel_outline_width,
+                self.renderer.item("rectangle", "selection_highlight", (canvas_x - sel_outline_width, canvas_y - sel_outline_width,
+                                             canvas_x + canvas_width + sel_outline_width, canvas_y + canvas_height + sel_outline_width),
                                              outline="red", width=sel_outline_width, tags=("stat_box_item", stat_box_id, "selection_highlight"))
             if self.edit_mode_var.get() and stat_box_id in self.selected_items:
                 handle_size_canvas = RESIZE_HANDLE_SIZE * self.current_zoom_level
                 br_x = canvas_x + canvas_width - handle_size_canvas / 2
                 br_y = canvas_y + canvas_height - handle_size_canvas / 2
-                self.canvas.create_rectangle(br_x - handle_size_canvas/2, br_y - handle_size_canvas/2,
-                                             br_x + handle_size_canvas/2, br_y + handle_size_canvas/2,
+                self.renderer.item("rectangle", "resize_handle", (br_x - handle_size_canvas/2, br_y - handle_size_canvas/2,
+                                             br_x + handle_size_canvas/2, br_y + handle_size_canvas/2),
                                              fill="gray", outline="black", tags=("stat_box_item", stat_box_id, "resize_handle", "br_handle"))
+            self.renderer.end()
         except AttributeError: pass
 
     def draw_single_furniture(self, furniture_id):
         # ... (same as v51)
         item_data = self.furniture.get(furniture_id)
-        if not item_data: return
+        if not item_data:
+            if self.renderer: self.renderer.remove(furniture_id)
+            return
         world_x, world_y = item_data["x"], item_data["y"]
         world_width = item_data.get("width", DEFAULT_STUDENT_BOX_WIDTH)
         world_height = item_data.get("height", DEFAULT_STUDENT_BOX_HEIGHT)
@@ -2316,66 +2157,260 @@ class SeatingChartApp:
         canvas_height = world_height * self.current_zoom_level
         item_data['_current_world_height'] = world_height
         item_data['_current_world_width'] = world_width
+        self.update_spatial_index(furniture_id)
         fill_color = item_data.get("fill_color", "lightgrey")
         outline_color = item_data.get("outline_color", "dimgray")
         name = item_data.get("name", "Furniture")
         try:
-            self.canvas.delete(furniture_id)
+            self.renderer.begin(furniture_id)
             rect_tag = ("furniture_item", furniture_id, "rect")
-            self.canvas.create_rectangle(canvas_x, canvas_y, canvas_x + canvas_width, canvas_y + canvas_height,
-                                         fill=fill_color, outline=outline_color, width=max(1, int(2*self.current_zoom_level)), tags=rect_tag)
+            self.renderer.item("rectangle", "rect", (canvas_x, canvas_y, canvas_x + canvas_width, canvas_y + canvas_height),
+                               fill=fill_color, outline=outline_color, width=max(1, int(2*self.current_zoom_level)), tags=rect_tag)
             font_size_canvas = int(max(6, (self.settings.get("student_font_size", DEFAULT_FONT_SIZE) -1) * self.current_zoom_level))
             font_spec = (self.settings.get("student_font_family", DEFAULT_FONT_FAMILY), font_size_canvas)
-            self.canvas.create_text(canvas_x + canvas_width / 2, canvas_y + canvas_height / 2, text=name,
+            self.renderer.item("text", "text", (canvas_x + canvas_width / 2, canvas_y + canvas_height / 2), text=name,
                                     fill=self.settings.get("student_font_color", DEFAULT_FONT_COLOR), font=font_spec,
                                     tags=("furniture_item", furniture_id, "text"), anchor=tk.CENTER,
                                     width=max(1, canvas_width - int(10*self.current_zoom_level)), justify=tk.CENTER)
             if furniture_id in self.selected_items:
                 sel_outline_width = max(1, int(2 * self.current_zoom_level))
-                self.canvas.create_rectangle(canvas_x - sel_outline_width, canvas_y - sel_outline_width,
-                                             canvas_x + canvas_width + sel_outline_width, canvas_y + canvas_height + sel_outline_width,
+                self.renderer.item("rectangle", "selection_highlight", (canvas_x - sel_outline_width, canvas_y - sel_outline_width,
+                                             canvas_x + canvas_width + sel_outline_width, canvas_y + canvas_height + sel_outline_width),
                                              outline="red", width=sel_outline_width, tags=("furniture_item", furniture_id, "selection_highlight"))
             if self.edit_mode_var.get() and furniture_id in self.selected_items:
                 handle_size_canvas = RESIZE_HANDLE_SIZE * self.current_zoom_level
                 br_x = canvas_x + canvas_width - handle_size_canvas / 2
                 br_y = canvas_y + canvas_height - handle_size_canvas / 2
-                self.canvas.create_rectangle(br_x - handle_size_canvas/2, br_y - handle_size_canvas/2,
-                                             br_x + handle_size_canvas/2, br_y + handle_size_canvas/2,
+                self.renderer.item("rectangle", "resize_handle", (br_x - handle_size_canvas/2, br_y - handle_size_canvas/2,
+                                             br_x + handle_size_canvas/2, br_y + handle_size_canvas/2),
                                              fill="gray", outline="black", tags=("furniture_item", furniture_id, "resize_handle", "br_handle"))
+            self.renderer.end()
         except AttributeError: pass
 
     def draw_all_items(self, check_collisions_on_redraw=False):
         if not self.canvas: return
-        self.canvas.delete("all") # Clear canvas before redrawing everything
+        # Items are kept between redraws and updated in place; whatever is not drawn in this pass is removed
+        drawn_owners = {"grid", "rulers", "border_lines"}
+        drawn_owners.update(self.students, self.furniture, self.stat_boxes, self.guides)
+        self.renderer.prune(drawn_owners)
 
         if self.settings.get("show_grid", False):
             self.draw_grid()
+        else: self.renderer.remove("grid")
 
         if self.settings.get("show_rulers", False):
             self.draw_rulers()
+        else: self.renderer.remove("rulers")
 
         # Draw temporary guides first, so they are under items if needed (though typically on top)
         #self.draw_temporary_guides() # Guides will be drawn after items for better visibility
         # The new self.draw_guides() is called after items.
 
-        all_items_data = list(self.students.values()) + list(self.furniture.values()) + list(self.stat_boxes.values())
-        
         if ((self.edit_mode_var.get() == True or self.settings.get("always_show_box_management", False) == True) and self.settings.get("show_canvas_border_lines", False) == True) or self.settings.get("force_canvas_border_lines", False) == True:
-            self.canvas.create_line(0,0,1,2000, tags=("border_line", "border_vertical")) # These seem to be fixed debug lines, not dynamic with canvas/zoom
-            self.canvas.create_line(0,0,2000,1, tags=("border_line", "border_horizontal")) # Consider removing or making them dynamic if kept.
-        if not all_items_data:
+            self.renderer.begin("border_lines")
+            self.renderer.item("line", "vertical", (0,0,1,2000), tags=("border_line", "border_vertical")) # These seem to be fixed debug lines, not dynamic with canvas/zoom
+            self.renderer.item("line", "horizontal", (0,0,2000,1), tags=("border_line", "border_horizontal")) # Consider removing or making them dynamic if kept.
+            self.renderer.end()
+        else: self.renderer.remove("border_lines")
+        self.update_scroll_region()
+        # Only items in (or near) the viewport are built; the rest are drawn when scrolled into view
+        visible_bounds = self.visible_world_bounds()
+        self._culled_items = set()
+        self.conditional_formatting.begin_pass()
+        for student_id in self.students:
+            if self._cull_if_off_screen(student_id, self.students[student_id], visible_bounds): continue
+            self.draw_single_student(student_id)
+        for furniture_id in self.furniture:
+            if self._cull_if_off_screen(furniture_id, self.furniture[furniture_id], visible_bounds): continue
+            self.draw_single_furniture(furniture_id)
+        for stat_box_id in self.stat_boxes:
+            if self._cull_if_off_screen(stat_box_id, self.stat_boxes[stat_box_id], visible_bounds): continue
+            self.draw_single_stat_box(stat_box_id)
+        if check_collisions_on_redraw and self.settings.get("check_for_collisions", True):
+            self.resolve_layout_collisions(list(self.students))
+
+        self.draw_guides() # Draw guides on top of items
+        # Items created in this pass were added on top; restore the layer order (grid, rulers, border lines, items, guides)
+        for layer_tag in ("border_line", "ruler_marking_text", "ruler_marking", "ruler_bg", "grid_line"):
+            self.canvas.tag_lower(layer_tag)
+        self.canvas.tag_raise("guide")
+        self.update_toggle_incidents_button_text(); self.update_zoom_display()
+        self.update_toggle_rulers_button_text()
+        self.update_toggle_grid_button_text()
+
+    def request_redraw(self, scope=(REDRAW_ALL,), check_collisions=False):
+        """
+        Marks scope (item IDs and regions, see redraw_items) dirty and schedules one render pass for
+        the next idle moment, so any number of requests made while handling one event paint once.
+        """
+        self._pending_redraw_scope.update(scope)
+        self._pending_redraw_collisions = self._pending_redraw_collisions or check_collisions
+        if self._redraw_after_id is None:
+            try: self._redraw_after_id = self.root.after_idle(self.flush_redraw)
+            except (AttributeError, tk.TclError): self._redraw_after_id = None # No Tk loop (yet); painted on the next flush
+
+    def flush_redraw(self):
+        """Paints everything requested through request_redraw now."""
+        if self._redraw_after_id is not None:
+            try: self.root.after_cancel(self._redraw_after_id)
+            except (AttributeError, tk.TclError): pass
+            self._redraw_after_id = None
+        scope, check_collisions = self._pending_redraw_scope, self._pending_redraw_collisions
+        self._pending_redraw_scope, self._pending_redraw_collisions = set(), False
+        if not scope: return
+        if REDRAW_ALL in scope: scope = {REDRAW_ALL}
+        self.redraw_items(scope, check_collisions=check_collisions)
+
+    def redraw_items(self, scope, check_collisions=False):
+        """
+        Repaints only the canvas items in scope, as declared by Command.redraw_scope(): item IDs
+        (students, furniture, stat boxes, guides) plus the regions REDRAW_ALL and REDRAW_STAT_BOXES.
+        """
+        if not self.canvas: return
+        if REDRAW_ALL in scope:
+            self.draw_all_items(check_collisions_on_redraw=check_collisions); return
+        stat_box_ids = set(self.stat_boxes) if REDRAW_STAT_BOXES in scope else set()
+        guides_changed = False
+        visible_bounds = self.visible_world_bounds()
+        self.conditional_formatting.begin_pass()
+        for item_id in scope:
+            if item_id == REDRAW_STAT_BOXES: continue
+            if item_id in self.students:
+                if not self._cull_if_off_screen(item_id, self.students[item_id], visible_bounds):
+                    self.draw_single_student(item_id)
+            elif item_id in self.furniture:
+                if not self._cull_if_off_screen(item_id, self.furniture[item_id], visible_bounds):
+                    self.draw_single_furniture(item_id)
+            elif item_id in self.stat_boxes: stat_box_ids.add(item_id)
+            elif item_id in self.guides: guides_changed = True
+            else: # Deleted since it was drawn
+                self.renderer.remove(item_id); self._culled_items.discard(item_id)
+        for stat_box_id in stat_box_ids: # After students, whose logs they summarize
+            if not self._cull_if_off_screen(stat_box_id, self.stat_boxes[stat_box_id], visible_bounds):
+                self.draw_single_stat_box(stat_box_id)
+        if guides_changed: self.draw_guides()
+        self.canvas.tag_raise("guide")
+        self.update_scroll_region()
+        if check_collisions and self.settings.get("check_for_collisions", True):
+            self.resolve_layout_collisions([item_id for item_id in scope if item_id in self.students])
+
+    def update_spatial_index(self, *item_ids):
+        """Re-reads the world rectangles of item_ids into the spatial index; IDs of deleted items are removed."""
+        for item_id in item_ids:
+            item_data = self.students.get(item_id) or self.furniture.get(item_id) or self.stat_boxes.get(item_id)
+            if item_data is None:
+                self.spatial_index.remove(item_id); continue
+            x1, y1 = item_data['x'], item_data['y']
+            x2 = x1 + item_data.get('_current_world_width', item_data.get('width', DEFAULT_STUDENT_BOX_WIDTH))
+            y2 = y1 + item_data.get('_current_world_height', item_data.get('height', DEFAULT_STUDENT_BOX_HEIGHT))
+            self.spatial_index.update(item_id, x1, y1, x2, y2)
+
+    def rebuild_spatial_index(self):
+        self.spatial_index.clear()
+        self.update_spatial_index(*self.students, *self.furniture, *self.stat_boxes)
+        self._spatial_index_generation = self.layout_generation
+
+    def invalidate_spatial_index(self):
+        """
+        Marks the spatial index as stale after items were replaced wholesale rather than through
+        update_spatial_index (loading a file, a reset, undo/redo); it is rebuilt on next use.
+        """
+        self.layout_generation += 1
+
+    def _ensure_spatial_index(self):
+        if self._spatial_index_generation != self.layout_generation:
+            self.rebuild_spatial_index()
+
+    def _item_type(self, item_id):
+        if item_id in self.students: return "student"
+        if item_id in self.furniture: return "furniture"
+        if item_id in self.stat_boxes: return "stat_box"
+        return None
+
+    def find_item_at(self, screen_x, screen_y, item_types=("student", "furniture", "stat_box")):
+        """Returns (item_id, item_type) of the topmost box of one of item_types under a screen point, or (None, None)."""
+        self._ensure_spatial_index()
+        hits = [item_id for item_id in self.spatial_index.query_point(*self.canvas_to_world_coords_guides(screen_x, screen_y))
+                if self._item_type(item_id) in item_types]
+        if not hits: return None, None
+        if len(hits) > 1:
+            # Overlapping boxes: the one whose canvas items are stacked highest under the point is on top
+            canvas_x, canvas_y = self.canvas.canvasx(screen_x), self.canvas.canvasy(screen_y)
+            stacking = {}
+            for position, canvas_item_id in enumerate(self.canvas.find_overlapping(canvas_x, canvas_y, canvas_x, canvas_y)):
+                for tag in self.canvas.gettags(canvas_item_id):
+                    stacking[tag] = position
+            hits.sort(key=lambda item_id: stacking.get(item_id, -1)) # Boxes not drawn (culled) count as the lowest
+        return hits[-1], self._item_type(hits[-1])
+
+    def current_lod_level(self):
+        """
+        Level of detail for student boxes at the current zoom: LOD_LOW (color and initials),
+        LOD_MEDIUM (names only) or LOD_FULL. Recomputed only when the zoom or the thresholds change.
+        """
+        lod_key = (self.current_zoom_level, self.settings.get("lod_low_zoom_threshold", 0.5), self.settings.get("lod_medium_zoom_threshold", 0.75))
+        if lod_key != self._lod_cache_key:
+            zoom, low_threshold, medium_threshold = lod_key
+            self._lod_level = LOD_LOW if zoom < low_threshold else LOD_MEDIUM if zoom < medium_threshold else LOD_FULL
+            self._lod_cache_key = lod_key
+        return self._lod_level
+
+    def visible_world_bounds(self, margin=VIEWPORT_CULL_MARGIN):
+        """World rectangle (x1, y1, x2, y2) shown on the canvas plus margin screen pixels, or None before the canvas is laid out."""
+        try:
+            canvas_width, canvas_height = self.canvas.winfo_width(), self.canvas.winfo_height()
+            if canvas_width <= 1 or canvas_height <= 1: return None
+            canvas_x1, canvas_y1 = self.canvas.canvasx(-margin), self.canvas.canvasy(-margin)
+            canvas_x2, canvas_y2 = self.canvas.canvasx(canvas_width + margin), self.canvas.canvasy(canvas_height + margin)
+        except (AttributeError, tk.TclError): return None
+        return ((canvas_x1 - self.pan_x) / self.current_zoom_level, (canvas_y1 - self.pan_y) / self.current_zoom_level,
+                (canvas_x2 - self.pan_x) / self.current_zoom_level, (canvas_y2 - self.pan_y) / self.current_zoom_level)
+
+    @staticmethod
+    def _item_in_bounds(item_data, bounds):
+        x1, y1 = item_data['x'], item_data['y']
+        x2 = x1 + item_data.get('_current_world_width', item_data.get('width', DEFAULT_STUDENT_BOX_WIDTH))
+        y2 = y1 + item_data.get('_current_world_height', item_data.get('height', DEFAULT_STUDENT_BOX_HEIGHT))
+        return x2 >= bounds[0] and x1 <= bounds[2] and y2 >= bounds[1] and y1 <= bounds[3]
+
+    def _cull_if_off_screen(self, item_id, item_data, visible_bounds):
+        """Removes the canvas items of an item outside visible_bounds and remembers it for materialize_visible_items."""
+        if visible_bounds is None or item_id in self.selected_items or self._item_in_bounds(item_data, visible_bounds):
+            self._culled_items.discard(item_id); return False # Selected items may be dragged or aligned on screen
+        self.renderer.remove(item_id)
+        self._culled_items.add(item_id)
+        return True
+
+    def materialize_visible_items(self):
+        """Schedules drawing of culled items that have come into view (called on every scroll, pan or resize)."""
+        if not self._culled_items: return
+        visible_bounds = self.visible_world_bounds()
+        came_into_view = set()
+        for item_id in list(self._culled_items):
+            item_data = self.students.get(item_id) or self.furniture.get(item_id) or self.stat_boxes.get(item_id)
+            if item_data is None: self._culled_items.discard(item_id); continue
+            if visible_bounds is None or self._item_in_bounds(item_data, visible_bounds): came_into_view.add(item_id)
+        if came_into_view: self.request_redraw(came_into_view)
+
+    def draw_culled_items(self):
+        """Draws every culled item now, e.g. before exporting the whole canvas as an image."""
+        for item_id in list(self._culled_items):
+            if item_id in self.students: self.draw_single_student(item_id)
+            elif item_id in self.furniture: self.draw_single_furniture(item_id)
+            elif item_id in self.stat_boxes: self.draw_single_stat_box(item_id)
+        self._culled_items.clear()
+
+    def update_scroll_region(self):
+        """Fits the scroll region to the items' current world bounds (plus padding)."""
+        self._ensure_spatial_index()
+        items_bounds = self.spatial_index.bounds()
+        if items_bounds is None:
             try:
                 default_sr_w = self.canvas_orig_width * self.current_zoom_level; default_sr_h = self.canvas_orig_height * self.current_zoom_level
                 self.canvas.configure(scrollregion=(0, 0, default_sr_w, default_sr_h))
             except AttributeError: pass
         else:
-            min_x_world, min_y_world = float('inf'), float('inf'); max_x_world_br, max_y_world_br = float('-inf'), float('-inf')
-            for item_data in all_items_data:
-                item_world_x, item_world_y = item_data['x'], item_data['y']
-                item_world_w = item_data.get('_current_world_width', item_data.get('width', DEFAULT_STUDENT_BOX_WIDTH))
-                item_world_h = item_data.get('_current_world_height', item_data.get('height', DEFAULT_STUDENT_BOX_HEIGHT))
-                min_x_world = min(min_x_world, item_world_x); min_y_world = min(min_y_world, item_world_y)
-                max_x_world_br = max(max_x_world_br, item_world_x + item_world_w); max_y_world_br = max(max_y_world_br, item_world_y + item_world_h)
+            min_x_world, min_y_world, max_x_world_br, max_y_world_br = items_bounds
             padding_world = 100
             scroll_min_x_canvas, scroll_min_y_canvas = self.world_to_canvas_coords(min_x_world - padding_world, min_y_world - padding_world)
             scroll_max_x_canvas, scroll_max_y_canvas = self.world_to_canvas_coords(max_x_world_br + padding_world, max_y_world_br + padding_world)
@@ -2387,19 +2422,10 @@ class SeatingChartApp:
             final_scroll_min_x = min(scroll_min_x_canvas, 0); final_scroll_min_y = min(scroll_min_y_canvas, 0)
             try: self.canvas.config(scrollregion=(final_scroll_min_x, final_scroll_min_y, final_scroll_max_x, final_scroll_max_y))
             except AttributeError: pass
-        for student_id in self.students: self.draw_single_student(student_id, check_collisions=check_collisions_on_redraw)
-        for furniture_id in self.furniture: self.draw_single_furniture(furniture_id)
-        for stat_box_id in self.stat_boxes: self.draw_single_stat_box(stat_box_id)
-
-        self.draw_guides() # Draw guides on top of items
-        self.update_toggle_incidents_button_text(); self.update_zoom_display()
-        self.update_toggle_rulers_button_text()
-        self.update_toggle_grid_button_text()
 
     def draw_guides(self):
         """Draws all stored guides on the canvas."""
         if not self.canvas: return
-        self.canvas.delete("guide") # Delete only items tagged 'guide'
 
         for guide_info in self.guides:
             guide_type = self.guides[guide_info].get('type')
@@ -2407,30 +2433,47 @@ class SeatingChartApp:
             guide_id_tag = self.guides[guide_info].get('id') #guide_info['id'] # e.g., "guide_v_1"
 
             canvas_item_id = None
+            self.renderer.begin(guide_info)
             if guide_type == 'h': # Horizontal guide
                 _, screen_y = self.world_to_canvas_coords(0, world_coord)
-                canvas_item_id = self.canvas.create_line(
-                    0, screen_y, self.canvas.winfo_width(), screen_y,
+                canvas_item_id = self.renderer.item("line", "line",
+                    (0, screen_y, self.canvas.winfo_width(), screen_y),
                     fill=self.guide_line_color, tags=("guide", guide_id_tag, "guide_h"), width=1, dash=(4, 2)
                 )
             elif guide_type == 'v': # Vertical guide
                 screen_x, _ = self.world_to_canvas_coords(world_coord, 0)
-                canvas_item_id = self.canvas.create_line(
-                    screen_x, 0, screen_x, self.canvas.winfo_height(),
+                canvas_item_id = self.renderer.item("line", "line",
+                    (screen_x, 0, screen_x, self.canvas.winfo_height()),
                     fill=self.guide_line_color, tags=("guide", guide_id_tag, "guide_v"), width=1, dash=(4, 2)
                 )
+            self.renderer.end()
             self.guides[guide_info]['canvas_item_id'] = canvas_item_id #guide_info['canvas_item_id'] = canvas_item_id # Store/update Tkinter canvas item ID
 
     def toggle_grid_visibility(self):
         self.settings["show_grid"] = not self.settings.get("show_grid", False)
-        self.draw_all_items()
+        self.request_redraw()
         self.update_toggle_grid_button_text()
         self.update_status(f"Grid {'shown' if self.settings['show_grid'] else 'hidden'}.")
 
     def reload_canvas(self, event=None):
-        self.draw_all_items()
+        self.renderer.clear() # Rebuild every canvas item from scratch
+        self.request_redraw()
         self.update_status("Reloaded")
 
+    def benchmark_canvas_redraw(self, rounds=20):
+        """Times a full redraw with the retained renderer against deleting and recreating every item (Ctrl+Shift+B)."""
+        if not self.canvas: return None
+        self.flush_redraw()
+        def redraw():
+            self.draw_all_items()
+            self.canvas.update_idletasks() # Include Tk's own redisplay of the changed items
+        results = benchmark_redraw(redraw, self.renderer, rounds)
+        summary = (f"Canvas redraw ({len(self.students)} students, {results['items']} items, {rounds} rounds): "
+                   f"{results['retained_ms']:.1f} ms retained vs {results['recreate_ms']:.1f} ms delete/recreate")
+        print(summary)
+        self.update_status(summary)
+        return results
+
     def update_toggle_grid_button_text(self):
         if hasattr(self, 'toggle_grid_btn'):
             text = "Hide Grid" if self.settings.get("show_grid", False) else "Show Grid"
@@ -2463,8 +2506,10 @@ class SeatingChartApp:
         if not self.canvas: return
         grid_size = self.settings.get("grid_size", DEFAULT_GRID_SIZE)
         grid_color = self.settings.get("grid_color", "#d3d3d3")
-        if grid_size <= 0: return
+        if grid_size <= 0:
+            self.renderer.remove("grid"); return
 
+        self.renderer.begin("grid")
         canvas_width_screen = self.canvas.winfo_width()
         canvas_height_screen = self.canvas.winfo_height()
 
@@ -2481,7 +2526,7 @@ class SeatingChartApp:
             canvas_x, _ = self.world_to_canvas_coords(world_x, world_y_start)
             # Draw line across the current visible canvas height, adjusted for ruler if present
             line_y_start_on_canvas = self.ruler_thickness if self.settings.get("show_rulers", False) else 0
-            self.canvas.create_line(canvas_x, line_y_start_on_canvas, canvas_x, canvas_height_screen,
+            self.renderer.item("line", ("v", world_x), (canvas_x, line_y_start_on_canvas, canvas_x, canvas_height_screen),
                                     fill=grid_color, tags="grid_line", width=1, dash=(2,4))
 
         # Horizontal lines
@@ -2489,8 +2534,9 @@ class SeatingChartApp:
             _, canvas_y = self.world_to_canvas_coords(world_x_start, world_y)
             # Draw line across the current visible canvas width, adjusted for ruler if present
             line_x_start_on_canvas = self.ruler_thickness if self.settings.get("show_rulers", False) else 0
-            self.canvas.create_line(line_x_start_on_canvas, canvas_y, canvas_width_screen, canvas_y,
+            self.renderer.item("line", ("h", world_y), (line_x_start_on_canvas, canvas_y, canvas_width_screen, canvas_y),
                                     fill=grid_color, tags="grid_line", width=1, dash=(2,4))
+        self.renderer.end()
 
     def toggle_rulers_visibility(self):
         self.settings["show_rulers"] = not self.settings.get("show_rulers", False)
@@ -2508,7 +2554,7 @@ class SeatingChartApp:
                             self.canvas.delete(guide_info['canvas_id'])
                             guide_info['canvas_id'] = None
 
-        self.draw_all_items() # This will redraw rulers if shown, and guides if data exists and rulers shown
+        self.request_redraw() # This will redraw rulers if shown, and guides if data exists and rulers shown
         self.update_toggle_rulers_button_text()
         self.update_status(f"Rulers {'shown' if self.settings['show_rulers'] else 'hidden'}.")
 
@@ -2519,12 +2565,13 @@ class SeatingChartApp:
 
     def draw_rulers(self):
         if not self.canvas: return
+        self.renderer.begin("rulers")
         # Horizontal Ruler (Top)
-        self.canvas.create_rectangle(0, 0, self.canvas.winfo_width(), self.ruler_thickness,
+        self.renderer.item("rectangle", "h_bg", (0, 0, self.canvas.winfo_width(), self.ruler_thickness),
                                     #  fill=self.ruler_bg_color,
                                      outline=self.ruler_line_color, tags="ruler_bg")
         # Vertical Ruler (Left)
-        self.canvas.create_rectangle(0, self.ruler_thickness, self.ruler_thickness, self.canvas.winfo_height(),
+        self.renderer.item("rectangle", "v_bg", (0, self.ruler_thickness, self.ruler_thickness, self.canvas.winfo_height()),
                                     #  fill=self.ruler_bg_color, 
                                      outline=self.ruler_line_color, tags="ruler_bg")
 
@@ -2555,10 +2602,10 @@ class SeatingChartApp:
             canvas_x, _ = self.world_to_canvas_coords(world_x, world_y_start) # Use world_y_start for consistency
             if canvas_x >= self.ruler_thickness and canvas_x <= canvas_width:
                 tick_len = 5 if world_x % (interval * 2) != 0 else 10
-                self.canvas.create_line(canvas_x, self.ruler_thickness - tick_len, canvas_x, self.ruler_thickness,
+                self.renderer.item("line", ("h_tick", world_x), (canvas_x, self.ruler_thickness - tick_len, canvas_x, self.ruler_thickness),
                                         fill=self.ruler_line_color, tags="ruler_marking")
                 if tick_len == 10:
-                    self.canvas.create_text(canvas_x, self.ruler_thickness - tick_len - 5, text=str(world_x),
+                    self.renderer.item("text", ("h_label", world_x), (canvas_x, self.ruler_thickness - tick_len - 5), text=str(world_x),
                                             fill=self.ruler_text_color, anchor=tk.S, tags="ruler_marking_text", font=(DEFAULT_FONT_FAMILY, 8))
         # Vertical Markings
         start_mark_y = int(world_y_for_vruler_start / interval) * interval
@@ -2566,11 +2613,12 @@ class SeatingChartApp:
             _, canvas_y = self.world_to_canvas_coords(world_x_start, world_y) # Use world_x_start for consistency
             if canvas_y >= self.ruler_thickness and canvas_y <= canvas_height:
                 tick_len = 5 if world_y % (interval * 2) != 0 else 10
-                self.canvas.create_line(self.ruler_thickness - tick_len, canvas_y, self.ruler_thickness, canvas_y,
+                self.renderer.item("line", ("v_tick", world_y), (self.ruler_thickness - tick_len, canvas_y, self.ruler_thickness, canvas_y),
                                         fill=self.ruler_line_color, tags="ruler_marking")
                 if tick_len == 10:
-                    self.canvas.create_text(self.ruler_thickness - tick_len - 5, canvas_y, text=str(world_y),
+                    self.renderer.item("text", ("v_label", world_y), (self.ruler_thickness - tick_len - 5, canvas_y), text=str(world_y),
                                             fill=self.ruler_text_color, anchor=tk.E, tags="ruler_marking_text", font=(DEFAULT_FONT_FAMILY, 8))
+        self.renderer.end()
 
     def draw_temporary_guides(self):
         if not self.canvas: return
@@ -2669,33 +2717,43 @@ class SeatingChartApp:
         return 0.0 # Default to 0% if no points possible or earned meaningfully
 
     def handle_layout_collision(self, moved_item_id):
-        # ... (same as v51)
-        if moved_item_id not in self.students: return
-        moved_item_data = self.students[moved_item_id]
-        moved_x1, moved_y1 = moved_item_data['x'], moved_item_data['y']
-        moved_w = moved_item_data.get('_current_world_width', moved_item_data.get('width', DEFAULT_STUDENT_BOX_WIDTH))
-        moved_h = moved_item_data.get('_current_world_height', moved_item_data.get('height', DEFAULT_STUDENT_BOX_HEIGHT))
-        moved_x2, moved_y2 = moved_x1 + moved_w, moved_y1 + moved_h
-        items_to_shift_data = []
-        all_other_items = []
-        for sid, sdata in self.students.items():
-            if sid != moved_item_id: all_other_items.append({'id': sid, 'type': 'student', 'data': sdata})
-        for fid, fdata in self.furniture.items(): all_other_items.append({'id': fid, 'type': 'furniture', 'data': fdata})
-        for other_item_info in all_other_items:
-            other_id, other_data = other_item_info['id'], other_item_info['data']
-            other_x1, other_y1 = other_data['x'], other_data['y']
-            other_w = other_data.get('_current_world_width', other_data.get('width', DEFAULT_STUDENT_BOX_WIDTH))
-            other_h = other_data.get('_current_world_height', other_data.get('height', DEFAULT_STUDENT_BOX_HEIGHT))
-            other_x2, other_y2 = other_x1 + other_w, other_y1 + other_h
-            is_colliding = not (moved_x2 <= other_x1 or moved_x1 >= other_x2 or moved_y2 <= other_y1 or moved_y1 >= other_y2)
-            if is_colliding:
-                vertical_overlap = moved_y2 - other_y1
-                if vertical_overlap > 0 :
-                    shift_by = vertical_overlap + LAYOUT_COLLISION_OFFSET
-                    items_to_shift_data.append({'id': other_id, 'type': other_item_info['type'], 'old_x': other_x1, 'old_y': other_y1, 'new_x': other_x1, 'new_y': other_y1 + shift_by})
-        if items_to_shift_data:
-            self.execute_command(MoveItemsCommand(self, items_to_shift_data))
-            self.update_status(f"Adjusted layout for {len(items_to_shift_data)} items due to overlap with {moved_item_data['full_name']}.")
+        self.resolve_layout_collisions([moved_item_id])
+
+    def resolve_layout_collisions(self, student_ids, max_iterations=LAYOUT_RESOLVE_MAX_ITERATIONS):
+        """
+        Settles the overlaps caused by the students in student_ids: every student or furniture item
+        overlapping a student is pushed down below it, and pushed students push on in turn. The final
+        positions are worked out in the spatial index first and then applied as a single MoveItemsCommand.
+        At most max_iterations pushing students are processed; anything left settles on the next redraw.
+        Returns the number of items moved.
+        """
+        self._ensure_spatial_index()
+        self.update_spatial_index(*student_ids)
+        original_positions = {} # {item_id: (x, y)} of the items pushed so far
+        pushers = deque(student_id for student_id in student_ids if student_id in self.students)
+        iterations = 0
+        while pushers and iterations < max_iterations:
+            iterations += 1
+            pusher_id = pushers.popleft()
+            pusher_x1, pusher_y1, pusher_x2, pusher_y2 = self.spatial_index.rect(pusher_id)
+            for other_id in self.spatial_index.query(pusher_x1, pusher_y1, pusher_x2, pusher_y2, exclude=pusher_id):
+                other_data = self.students.get(other_id) or self.furniture.get(other_id)
+                if other_data is None: continue # Stat boxes are neither pushed nor push
+                other_x1, other_y1, other_x2, other_y2 = self.spatial_index.rect(other_id)
+                shift_by = pusher_y2 - other_y1 + LAYOUT_COLLISION_OFFSET
+                original_positions.setdefault(other_id, (other_data['x'], other_data['y']))
+                self.spatial_index.update(other_id, other_x1, other_y1 + shift_by, other_x2, other_y2 + shift_by)
+                if other_id in self.students: pushers.append(other_id)
+        if not original_positions: return 0
+        items_to_shift_data = [{'id': item_id, 'type': 'student' if item_id in self.students else 'furniture', 'old_x': old_x, 'old_y': old_y,
+                                'new_x': old_x, 'new_y': self.spatial_index.rect(item_id)[1]}
+                               for item_id, (old_x, old_y) in original_positions.items()]
+        self.execute_command(MoveItemsCommand(self, items_to_shift_data))
+        self.update_spatial_index(*original_positions) # Back in step with the data should the command have failed
+        if len(student_ids) == 1 and student_ids[0] in self.students:
+            self.update_status(f"Adjusted layout for {len(items_to_shift_data)} items due to overlap with {self.students[student_ids[0]]['full_name']}.")
+        else: self.update_status(f"Adjusted layout for {len(items_to_shift_data)} items due to overlaps.")
+        return len(items_to_shift_data)
 
     def world_to_canvas_coords(self, world_x, world_y):
         """
@@ -2767,23 +2825,50 @@ class SeatingChartApp:
         self.zoom_var.set(value=str(float(self.current_zoom_level)*100.0))
         self.zoom_canvas(1)
 
-    def zoom_canvas(self, factor):
-        # ... (same as v51)
+    def zoom_canvas(self, factor, anchor=None):
+        """
+        Zooms by factor (0 resets to 100%) around anchor, a point in screen coordinates that stays in
+        place (defaults to the middle of the canvas). The items already on the canvas are scaled right
+        away with canvas.scale; the full re-render (fonts, text wrapping, level of detail) is deferred
+        until zooming has paused for ZOOM_RERENDER_DELAY_MS, so a burst of wheel events costs one redraw.
+        """
         if self.password_manager.is_locked: return
-        world_center_x_before, world_center_y_before = self.canvas_to_world_coords(self.canvas.winfo_width() // 2, self.canvas.winfo_height() // 2)
+        old_zoom_level = self.current_zoom_level
         if factor == 0: self.current_zoom_level = 1.0
         else: self.current_zoom_level = max(0.1, min(self.current_zoom_level * factor, 10.0))
-        self.draw_all_items(check_collisions_on_redraw=False)
-        # Centering logic after zoom could be added here if desired, similar to v50/v51
+        scale = self.current_zoom_level / old_zoom_level
+        if scale != 1.0:
+            if anchor is None: anchor = (self.canvas.winfo_width() // 2, self.canvas.winfo_height() // 2)
+            anchor_x, anchor_y = self.canvas.canvasx(anchor[0]), self.canvas.canvasy(anchor[1])
+            # Items are at world * zoom + pan, so they scale around (pan_x, pan_y); the view is then
+            # scrolled so that the point that was under the anchor is under it again.
+            for tag in ZOOM_SCALED_TAGS: self.canvas.scale(tag, self.pan_x, self.pan_y, scale, scale)
+            self.renderer.invalidate_all() # Coordinates remembered by the renderer are stale after canvas.scale
+            self.update_scroll_region()
+            try:
+                scroll_x1, scroll_y1, scroll_x2, scroll_y2 = (float(value) for value in str(self.canvas.cget("scrollregion")).split())
+                view_x = self.pan_x + (anchor_x - self.pan_x) * scale - anchor[0]
+                view_y = self.pan_y + (anchor_y - self.pan_y) * scale - anchor[1]
+                if scroll_x2 > scroll_x1: self.canvas.xview_moveto((view_x - scroll_x1) / (scroll_x2 - scroll_x1))
+                if scroll_y2 > scroll_y1: self.canvas.yview_moveto((view_y - scroll_y1) / (scroll_y2 - scroll_y1))
+            except ValueError: pass # No scroll region yet
+        if self._zoom_render_after_id is not None: self.root.after_cancel(self._zoom_render_after_id)
+        self._zoom_render_after_id = self.root.after(ZOOM_RERENDER_DELAY_MS, self.finish_zoom)
         self.update_status(f"Zoom level: {self.current_zoom_level:.2f}x"); self.update_zoom_display(); self.password_manager.record_activity()
         self.zoom_var.set(value=str(self.current_zoom_level*100.0))
         self.zoom_display_label.configure(textvariable=self.zoom_var)
         #print(self.zoom_var.get())
 
+    def finish_zoom(self):
+        """Redraws the canvas at full quality for the new zoom level once zooming has paused."""
+        self._zoom_render_after_id = None
+        self.font_cache.clear() # Canvas font sizes follow the zoom level
+        self.request_redraw()
+
     def on_mousewheel_zoom(self, event):
         if self.password_manager.is_locked: return
         factor = 0.9 if (event.num == 5 or event.delta < 0) else 1.1
-        self.zoom_canvas(factor)
+        self.zoom_canvas(factor, anchor=(event.x, event.y))
     def on_pan_start(self, event):
         # ... (same as v51)
         if self.password_manager.is_locked: return
@@ -2811,15 +2896,7 @@ class SeatingChartApp:
         # ... (same as v51)
         if self.password_manager.is_locked:
             if not self.prompt_for_password("Unlock to Select", "Enter password to select items:"): return
-        world_click_x, world_click_y = self.canvas_to_world_coords(event.x, event.y)
-        item_canvas_ids = self.canvas.find_overlapping(world_click_x -1, world_click_y -1, world_click_x +1, world_click_y+1) # Use screen coords
-        topmost_item_id, topmost_item_type = None, None
-        for item_c_id in reversed(item_canvas_ids):
-            tags = self.canvas.gettags(item_c_id); current_item_id, current_item_type = None, None
-            for tag in tags:
-                if tag.startswith("student_") and tag in self.students: current_item_id, current_item_type = tag, "student"; break
-                elif tag.startswith("furniture_") and tag in self.furniture: current_item_id, current_item_type = tag, "furniture"; break
-            if current_item_id and any("rect" in t for t in tags): topmost_item_id, topmost_item_type = current_item_id, current_item_type; break
+        topmost_item_id, topmost_item_type = self.find_item_at(event.x, event.y, ("student", "furniture"))
         if topmost_item_id:
             if topmost_item_id in self.selected_items: self.selected_items.remove(topmost_item_id)
             else: self.selected_items.add(topmost_item_id)
@@ -2939,7 +3016,7 @@ class SeatingChartApp:
 
                 self.execute_command(AddGuideCommand(self, guide_id_str, guide_type_to_add, new_guide_data, self.next_guide_id_num, ))
                 
-                #self.draw_all_items() # Redraws everything including the new guide via self.draw_guides()
+                #self.request_redraw() # Redraws everything including the new guide via self.draw_guides()
                 self.update_status(f"Added {guide_type_to_add} guide ({guide_id_str}) at {world_coord_to_use:.0f}.")
 
                 # Deactivate add guide mode and reset button state
@@ -3010,7 +3087,7 @@ class SeatingChartApp:
                     guide_id = f"guide_h_{current_guide_id_num}"
                     self.temporary_guides.append({'id': guide_id, 'type': 'h', 'world_coord': self.active_ruler_guide_coord_y, 'canvas_id': None})
                     self.update_status(f"Placed horizontal guide ({guide_id}) at y={self.active_ruler_guide_coord_y:.0f}. Guides are temporary.")
-                self.draw_all_items() # Redraw to show the new guide
+                self.request_redraw() # Redraw to show the new guide
             else: # Clicked on a ruler again, cancel placement
                  self.update_status("Guide placement cancelled.")
             self.active_ruler_guide_coord_x = None
@@ -3094,16 +3171,7 @@ class SeatingChartApp:
                         self.drag_data["original_size_world"] = {"width": orig_w, "height": orig_h}
                         self._drag_started_on_item = True; self.update_status(f"Resizing {item_type} '{item_id}'..."); self.password_manager.record_activity(); return
 
-        item_canvas_ids_click = self.canvas.find_overlapping(world_event_x -1, world_event_y -1, world_event_x +1, world_event_y +1) # Screen coords
-        clicked_item_id, clicked_item_type = None, None
-        for item_c_id in reversed(item_canvas_ids_click):
-            tags = self.canvas.gettags(item_c_id); temp_id, temp_type, is_main_rect = None, None, False
-            for tag in tags:
-                if tag.startswith("student_") and tag in self.students: temp_id, temp_type = tag, "student"
-                elif tag.startswith("furniture_") and tag in self.furniture: temp_id, temp_type = tag, "furniture"
-                elif tag.startswith("statbox_") and tag in self.stat_boxes: temp_id, temp_type = tag, "stat_box"
-                if "rect" in tag: is_main_rect = True
-            if temp_id and is_main_rect: clicked_item_id, clicked_item_type = temp_id, temp_type; break
+        clicked_item_id, clicked_item_type = self.find_item_at(event.x, event.y)
         clicked_on_selected_item = clicked_item_id and clicked_item_id in self.selected_items
         if not (event.state & 0x0004): # Ctrl NOT pressed
             if clicked_item_id and not clicked_on_selected_item:
@@ -3165,6 +3233,7 @@ class SeatingChartApp:
                 screen_x, _ = self.world_to_canvas_coords(new_world_coord, 0)
                 self.canvas.coords(guide_info['canvas_item_id'], screen_x, 0, screen_x, self.canvas.winfo_height())
 
+            self.renderer.invalidate(dragged_guide_id)
             self.password_manager.record_activity()
             return # Event handled, do not pass to student/furniture drag
 
@@ -3179,7 +3248,7 @@ class SeatingChartApp:
                 self.drag_data.clear() # Clear drag data to prevent further processing in on_canvas_release
                 self._drag_started_on_item = False
                 self.update_status("Resizing disabled.")
-                self.draw_all_items(check_collisions_on_redraw=True) # Redraw to remove any visual cues of resize start
+                self.request_redraw(check_collisions=True) # Redraw to remove any visual cues of resize start
                 return
 
             item_id, item_type = self.drag_data["item_id"], self.drag_data["item_type"]
@@ -3224,7 +3293,9 @@ class SeatingChartApp:
             dx_canvas_move = dx_world_move * self.current_zoom_level
             dy_canvas_move = dy_world_move * self.current_zoom_level
             if self.settings.get("allow_box_dragging", True):
-                for selected_id in self.selected_items: self.canvas.move(selected_id, dx_canvas_move, dy_canvas_move)
+                for selected_id in self.selected_items:
+                    self.canvas.move(selected_id, dx_canvas_move, dy_canvas_move)
+                    self.renderer.invalidate(selected_id)
 
         self.drag_data["x"] = world_event_x # Update last world position for next delta
         self.drag_data["y"] = world_event_y
@@ -3281,7 +3352,7 @@ class SeatingChartApp:
             self.drag_data.clear()
             self._drag_started_on_item = False # Reset general drag flag
             self.password_manager.record_activity()
-            self.draw_all_items() # Redraw to ensure canvas is clean and guide is in final state
+            self.request_redraw() # Redraw to ensure canvas is clean and guide is in final state
             return # Event handled
 
         clicked_item_id_at_press = self._potential_click_target
@@ -3302,7 +3373,7 @@ class SeatingChartApp:
             if final_w != old_w or final_h != old_h:
                 size_change_info = [{'id': dragged_item_id, 'type': item_type, 'old_w': old_w, 'old_h': old_h, 'new_w': final_w, 'new_h': final_h}]
                 self.execute_command(ChangeItemsSizeCommand(self, size_change_info))
-            else: self.draw_all_items(check_collisions_on_redraw=True)
+            else: self.request_redraw(check_collisions=True)
             self.update_status(f"Resized {item_type} '{dragged_item_id}'.")
         elif clicked_item_id_at_press and not actual_drag_initiated:
             item_type_of_clicked = "student" if clicked_item_id_at_press in self.students else "furniture"
@@ -3337,7 +3408,7 @@ class SeatingChartApp:
                         data_s = self.students if current_item_type == "student" else self.furniture
                         data_s[item_id_moved]['x'] = original_pos_info["x"]; data_s[item_id_moved]['y'] = original_pos_info["y"]
                 if items_moves_for_command: self.execute_command(MoveItemsCommand(self, items_moves_for_command))
-                else: self.draw_all_items(check_collisions_on_redraw=True)
+                else: self.request_redraw(check_collisions=True)
             
         self.drag_data.clear(); self._potential_click_target = None; self._drag_started_on_item = False; self.password_manager.record_activity()
 
@@ -3512,7 +3583,7 @@ class SeatingChartApp:
             for prop, old_val, new_val in dialog.result:
                 self.execute_command(ChangeItemStyleCommand(self, stat_box_id, "stat_box", prop, old_val, new_val))
             self.password_manager.record_activity()
-            self.draw_all_items()
+            self.request_redraw()
 
     def delete_item_confirm(self, item_id, item_type):
         if self.password_manager.is_locked:
@@ -3619,15 +3690,17 @@ class SeatingChartApp:
         
         if dialog.result:
             behavior, comment = dialog.result
+            log_commands = []
             for student_id in self.selected_items:
                 if "student" in student_id:
                     student = self.students.get(student_id)
                     if not student: continue
                     log_entry = {"timestamp": datetime.now().isoformat(), "student_id": student_id, "student_first_name": student["first_name"],
                                 "student_last_name": student["last_name"], "behavior": behavior, "comment": comment, "type": "behavior", "day": datetime.now().strftime('%A')}
-                    self.execute_command(LogEntryCommand(self, log_entry, student_id))
+                    log_commands.append(LogEntryCommand(self, log_entry, student_id))
+            if log_commands: self.execute_command(CompositeCommand(self, log_commands, f"Logged {behavior}"))
             self.update_status(f"Behavior {behavior} logged for {num_students_selected} students")
-            self.draw_all_items(check_collisions_on_redraw=True); self.password_manager.record_activity()
+            self.password_manager.record_activity()
 
     def change_item_size_dialog(self, item_id, item_type):
         # ... (same as v51)
@@ -3774,7 +3847,7 @@ class SeatingChartApp:
             log_entry = {"timestamp": datetime.now().isoformat(), "student_id": student_id, "student_first_name": student["first_name"],
                          "student_last_name": student["last_name"], "behavior": behavior, "comment": comment, "type": "behavior", "day": datetime.now().strftime('%A')}
             self.execute_command(LogEntryCommand(self, log_entry, student_id))
-            self.draw_all_items(check_collisions_on_redraw=True); self.password_manager.record_activity()
+            self.password_manager.record_activity()
 
     def log_homework_dialog(self, student_id):
         """
@@ -3845,7 +3918,6 @@ class SeatingChartApp:
             self.settings["_last_used_homework_name_timestamp_for_session"] = self.last_used_homework_name_timestamp
             self.settings["_last_used_hw_items_for_session"] = self.initial_num_homework_items
 
-            self.draw_all_items(check_collisions_on_redraw=True)
             self.password_manager.record_activity()
 
         else:
@@ -3884,7 +3956,6 @@ class SeatingChartApp:
                 self.settings["_last_used_homework_name_timestamp_for_session"] = self.last_used_homework_name_timestamp
                 self.settings["_last_used_hw_items_for_session"] = self.initial_num_homework_items
 
-                self.draw_all_items(check_collisions_on_redraw=True)
                 self.password_manager.record_activity()
 
     def log_quiz_score_dialog(self, student_id):
@@ -3915,7 +3986,6 @@ class SeatingChartApp:
             self.settings["_last_used_quiz_name_timestamp_for_session"] = self.last_used_quiz_name_timestamp
             self.settings["_last_used_q_num_for_session"] = self.initial_num_questions
             self.password_manager.record_activity()
-            self.draw_all_items()
     
     def save_data_wrapper(self, event=None, source="manual"):
         self._ensure_next_ids()
@@ -3923,23 +3993,21 @@ class SeatingChartApp:
         serializable_redo_stack = [cmd.to_dict() for cmd in self.redo_stack]
 
         # Separate settings into global and profile-specific
-        global_settings = {}
-        profile_settings = {}
-        for key, is_shared in self.settings_sharing_config.items():
-            if key in self.settings:
-                if is_shared:
-                    global_settings[key] = self.settings[key]
-                else:
-                    profile_settings[key] = self.settings[key]
+        global_settings, profile_settings = self._split_settings()
 
+        # This is the snapshot handed to the save worker, so everything in it is a copy (the undo history
+        # was just serialized into new dicts). With the SQLite log storage the logs are already in
+        # LOG_DATABASE_FILE and are left out.
         data_to_save = {
-            "students": self.students,
-            "furniture": self.furniture,
-            "behavior_log": self.behavior_log,
-            "homework_log": self.homework_log,
-            "settings": profile_settings, # Only save profile-specific settings in the main data file
+            "data_version": CURRENT_DATA_VERSION,
+            "students": copy.deepcopy(self.students),
+            "furniture": copy.deepcopy(self.furniture),
+            "behavior_log": [] if self._logs_in_database else self._log_snapshot("behavior"),
+            "homework_log": [] if self._logs_in_database else self._log_snapshot("homework"),
+            "log_storage": "sqlite" if self._logs_in_database else "json",
+            "settings": copy.deepcopy(profile_settings), # Only save profile-specific settings in the main data file
             "last_excel_export_path": self.last_excel_export_path,
-            "_per_student_last_cleared": self._per_student_last_cleared,
+            "_per_student_last_cleared": copy.deepcopy(self._per_student_last_cleared),
             "undo_stack": serializable_undo_stack,
             "redo_stack": serializable_redo_stack,
             "guides": {},
@@ -3955,35 +4023,94 @@ class SeatingChartApp:
             }
         data_to_save["guides"] = guides_to_save
 
+        self.save_manager.begin_pass(source)
         try:
-            # Save main data file (with profile-specific settings)
-            self._encrypt_and_write_file(DATA_FILE, data_to_save)
-
-            # Save global settings file
-            self._encrypt_and_write_file(get_app_data_path("global_settings.json"), global_settings)
+            # Save main data file (with profile-specific settings). The journal up to this point is part of the
+            # snapshot, so seal it now and drop the sealed segments once the data file is on disk.
+            sealed_journal_segments = self.log_journal.rotate()
+            self._encrypt_and_write_file(DATA_FILE, data_to_save, is_snapshot=True)
+            self.save_manager.after_write(DATA_FILE, lambda: self.log_journal.discard_segments(sealed_journal_segments))
+
+            encrypt = self.settings.get("encrypt_data_files", True)
+            # Settings are changed in place from many places, so the two settings stores are marked
+            # dirty by comparing them with what was last saved (plain dict comparison, no encoding)
+            for file_path, store in ((get_app_data_path("global_settings.json"), global_settings),
+                                     (get_app_data_path("settings_sharing_config.json"), self.settings_sharing_config)):
+                if store != self._saved_settings_stores.get(file_path): self.save_manager.mark_dirty(file_path)
+                if self.save_manager.write_if_dirty(file_path, lambda store=store: copy.deepcopy(store), encrypt):
+                    self._saved_settings_stores[file_path] = copy.deepcopy(store)
+
+            # The config stores are written by their save_* methods whenever they are changed; here only
+            # the ones still dirty (a failed write) or loaded with another encryption setting are rewritten
+            for file_path, store in ((STUDENT_GROUPS_FILE, self.student_groups), (CUSTOM_BEHAVIORS_FILE, self.custom_behaviors),
+                                     (CUSTOM_HOMEWORK_TYPES_FILE, self.custom_homework_types),
+                                     (CUSTOM_HOMEWORK_STATUSES_FILE, self.custom_homework_statuses),
+                                     (QUIZ_TEMPLATES_FILE, self.quiz_templates), (HOMEWORK_TEMPLATES_FILE, self.homework_templates)):
+                self.save_manager.write_if_dirty(file_path, lambda store=store: copy.deepcopy(store), encrypt)
+            self.save_manager.mark_clean()
+        except Exception as e:
+            print(e)
+        finally:
+            self.save_manager.end_pass()
+        self._process_completed_saves() # Without the worker the pass has already been written
 
-            # Save the sharing configuration itself
-            self._encrypt_and_write_file(get_app_data_path("settings_sharing_config.json"), self.settings_sharing_config)
+    def _log_snapshot(self, kind):
+        """
+        Deep copy of a log list for the save worker. The copy is only handed to the worker, which just reads
+        it, so it is reused by later saves until the logs change (see LogStore.revision).
+        """
+        revision = self.log_store.revision(kind)
+        cached = self._log_snapshots.get(kind)
+        if cached is None or cached[0] != revision:
+            cached = (revision, copy.deepcopy(self.behavior_log if kind == "behavior" else self.homework_log))
+            self._log_snapshots[kind] = cached
+        return cached[1]
+
+    def _split_settings(self):
+        """Splits self.settings into (global settings, profile-specific settings) by the sharing configuration."""
+        global_settings = {}
+        profile_settings = {}
+        for key, is_shared in self.settings_sharing_config.items():
+            if key in self.settings:
+                if is_shared:
+                    global_settings[key] = self.settings[key]
+                else:
+                    profile_settings[key] = self.settings[key]
+        return global_settings, profile_settings
+
+    def _process_completed_saves(self):
+        """Reports passes the save worker has finished. Runs on the Tk thread."""
+        for sources, save_report, errors in self.save_manager.pop_completed():
+            if errors:
+                error_text = "; ".join(f"{file_name}: {e}" for file_name, e in errors)
+                print(f"Error saving data: {error_text}")
+                self.update_status(f"Error saving data: {error_text}")
+                if self.root.winfo_exists():
+                    messagebox.showerror("Save Error", f"Could not save data: {error_text}", parent=self.root)
+                continue
+            report_text = self.save_manager.format_report(save_report)
+            if any(r["written"] for r in save_report): print(f"Save ({', '.join(dict.fromkeys(sources))}): {report_text}")
+            if any(r["written"] and r["file"] == os.path.basename(DATA_FILE) for r in save_report):
+                self._excel_autosave_needed = True
 
-            verbose_save = source not in ["autosave", "command_execution", "undo_command", "redo_command", "toggle_mode", "end_live_quiz", "end_live_homework_session", "reset", "assign_group_menu", "load_template", "save_and_quit"]
+            quiet_sources = ["autosave", "command_execution", "undo_command", "redo_command", "toggle_mode", "end_live_quiz", "end_live_homework_session", "reset", "assign_group_menu", "load_template", "save_and_quit", "journal_compaction", "single_file"]
+            verbose_save = any(source not in quiet_sources for source in sources)
             if verbose_save:
-                self.update_status(f"Data saved to {os.path.basename(DATA_FILE)}")
-            elif source == "autosave":
-                self.update_status(f"Autosaved data at {datetime.now().strftime('%H:%M:%S')}")
-
-        except IOError as e:
-            self.update_status(f"Error saving data: {e}")
-            messagebox.showerror("Save Error", f"Could not save data: {e}", parent=self.root)
-        except Exception as e:
-            print(e)
-            
-        # Call all individual config savers
-        self.save_student_groups()
-        self.save_custom_behaviors()
-        self.save_custom_homework_types()
-        self.save_custom_homework_statuses()
-        self.save_quiz_templates()
-        self.save_homework_templates()
+                self.update_status(f"Data saved to {os.path.basename(DATA_FILE)} ({report_text})")
+            elif "autosave" in sources:
+                self.update_status(f"Autosaved data at {datetime.now().strftime('%H:%M:%S')} ({report_text})")
+
+    def _poll_save_results(self):
+        self._process_completed_saves()
+        self.root.after(250, self._poll_save_results)
+
+    def _flush_pending_saves(self, stop_worker=False):
+        """Waits for the save worker to finish writing (e.g. before files are copied, replaced or the app exits)."""
+        if stop_worker: flushed = self.save_manager.stop_worker()
+        else: flushed = self.save_manager.flush()
+        if not flushed: print("Warning: Timed out waiting for pending saves to finish.")
+        self._process_completed_saves()
+        self.log_store.close() # Lets the log database files be replaced or deleted; reopened on next use
 
     def _update_toggle_dragging_button_text(self):
         if hasattr(self, 'toggle_dragging_btn'):
@@ -4024,7 +4151,6 @@ class SeatingChartApp:
                 except Exception as e:
                     messagebox.showerror("Error loading data", f"Error loading data from json {e}:", icon="error")
                 finally:
-                    self.draw_all_items()
                     self.reload_canvas()
             
     
@@ -4045,39 +4171,26 @@ class SeatingChartApp:
                 data = json.loads(decrypted_data_string)
                 """try:
                     with open(target_file, 'r', encoding='utf-8') as f: data = json.load(f)"""
-                data_version_from_filename = None
                 file_basename = os.path.basename(target_file)
-                if "_v3" in file_basename or "_v4" in file_basename or file_basename == f"classroom_data.json": data_version_from_filename = 3
-                elif "_v5" in file_basename: data_version_from_filename = 5
-                elif "_v6" in file_basename: data_version_from_filename = 6
-                elif "_v7" in file_basename: data_version_from_filename = 7
-                elif "_v8" in file_basename: data_version_from_filename = 8 # Previous version
-
-                if data_version_from_filename is None or data_version_from_filename <= 3:
-                    print(f"Migrating data from v3/v4 format (or older) from {target_file}")
-                    data = self._migrate_v3_edited_data(data); data = self._migrate_v4_data(data); data = self._migrate_v5_data(data)
-                    data = self._migrate_v6_data(data); data = self._migrate_v7_data(data); data = self._migrate_v8_data(data); data = self._migrate_v9_data(data)
-                elif data_version_from_filename == 5:
-                    print(f"Migrating data from v5 format from {target_file}")
-                    data = self._migrate_v5_data(data); data = self._migrate_v6_data(data); data = self._migrate_v7_data(data); data = self._migrate_v8_data(data); data = self._migrate_v9_data(data)
-                elif data_version_from_filename == 6:
-                    print(f"Migrating data from v6 format from {target_file}")
-                    data = self._migrate_v6_data(data); data = self._migrate_v7_data(data); data = self._migrate_v8_data(data); data = self._migrate_v9_data(data)
-                elif data_version_from_filename == 7:
-                    print(f"Migrating data from v7 format from {target_file}")
-                    data = self._migrate_v7_data(data); data = self._migrate_v8_data(data); data = self._migrate_v9_data(data)
-                elif data_version_from_filename == 8:
-                    print(f"Migrating data from v8 format from {target_file}")
-                    data = self._migrate_v8_data(data); data = self._migrate_v9_data(data)
-                elif data_version_from_filename == 9: # New: If loading v9 data
-                    print(f"Migrating data from v9 format from {target_file}")
-                    data = self._migrate_v9_data(data)
+                loaded_data_version = self._get_data_version(data, file_basename)
+                if loaded_data_version < CURRENT_DATA_VERSION:
+                    print(f"Migrating data from v{loaded_data_version} format from {target_file}")
+                    data = self._run_data_migrations(data, loaded_data_version)
 
 
                 final_settings = default_settings_copy.copy(); final_settings.update(data.get("settings", {}))
                 data["settings"] = final_settings
                 self.students = data.get("students", {}); self.furniture = data.get("furniture", {})
+                self.invalidate_spatial_index()
                 self.behavior_log = data.get("behavior_log", []); self.homework_log = data.get("homework_log", []) # Load homework log
+                self._logs_in_database = data.get("log_storage") == "sqlite"
+                if self._logs_in_database:
+                    self.behavior_log, self.homework_log = self._read_logs_from_database(data["settings"].get("encrypt_data_files", True))
+                for log_list in (self.behavior_log, self.homework_log): # The log store bisects into them; already sorted unless very old
+                    log_list.sort(key=lambda x: x.get("timestamp", ""))
+                # Before the log store indexes the new lists (the journal replay below goes through it)
+                if assign_log_ids(self.behavior_log) + assign_log_ids(self.homework_log): # Logs recorded before log IDs existed
+                    self.save_manager.mark_dirty() # Logs read from the log database already got theirs there
                 self.settings = data.get("settings", default_settings_copy)
                 self.last_excel_export_path = data.get("last_excel_export_path", None)
                 self._per_student_last_cleared = data.get("_per_student_last_cleared", {})
@@ -4121,6 +4234,10 @@ class SeatingChartApp:
                     if cmd_data.get('timestamp', '0') >= cutoff_date_iso:
                         cmd_obj = Command.from_dict(self, cmd_data)
                         if cmd_obj: self.redo_stack.append(cmd_obj)
+                if self._is_main_data_file_load(target_file, is_restore):
+                    self._replay_log_journal()
+                else:
+                    self.log_journal.clear() # Journal belongs to the data being replaced
                 self.update_undo_redo_buttons_state()
                 self.password_manager = PasswordManager(self.settings) # Re-initialize with loaded settings
                 self.update_lock_button_state()
@@ -4134,12 +4251,14 @@ class SeatingChartApp:
                 else:
                     messagebox.showwarning("Load Error", f"Error loading data file: {e}.\nDefault settings and empty classroom will be used.", parent=self.root)
                 self.students, self.furniture, self.behavior_log, self.homework_log = {}, {}, [], []
+                self._logs_in_database = False
                 self.settings = default_settings_copy.copy()
                 self.last_excel_export_path, self._per_student_last_cleared = None, {}
                 self.undo_stack.clear(); self.redo_stack.clear()
         else:
             if not is_restore: print(f"Data file {target_file} not found. Using default settings and empty classroom.")
             self.students, self.furniture, self.behavior_log, self.homework_log = {}, {}, [], []
+            self._logs_in_database = False
             self.settings = default_settings_copy.copy()
             self.last_excel_export_path, self._per_student_last_cleared = None, {}
             self.undo_stack.clear(); self.redo_stack.clear()
@@ -4157,10 +4276,12 @@ class SeatingChartApp:
         
         # Ensure next ID counters are robustly initialized/updated after data load
         self._ensure_next_ids()
-        if data_loaded_successfully and not is_restore and file_path is None and \
-           (os.path.basename(DATA_FILE) != f"classroom_data_{CURRENT_DATA_VERSION_TAG}.json" or \
-            (data_version_from_filename is not None and data_version_from_filename < int(CURRENT_DATA_VERSION_TAG[1:]))):
-            # If the main data file was from an older version, save it immediately in the new version format
+        self._apply_log_storage_backend()
+        if data_loaded_successfully and loaded_data_version < CURRENT_DATA_VERSION:
+            self.save_manager.mark_dirty() # Keep the migrated data even if it isn't saved right away (restore, import)
+        if data_loaded_successfully and not is_restore and file_path is None and loaded_data_version < CURRENT_DATA_VERSION:
+            # If the main data file was from an older version, save it immediately in the new version format,
+            # stamped with the current data_version, so the migrations don't run again on the next start
             print(f"Data file loaded from an older version ({file_basename}). Saving in new format: classroom_data_{CURRENT_DATA_VERSION_TAG}.json")
             self.save_data_wrapper(source="migration_save")
             # Optionally, attempt to delete the old version file if migration was successful
@@ -4173,6 +4294,92 @@ class SeatingChartApp:
                 except OSError as e_del:
                     print(f"Could not remove old data file {target_file}: {e_del}")
  
+    def _get_data_migrations(self):
+        """Ordered registry of data migrations: (version migrated from, migration to the next version)."""
+        return [
+            (3, self._migrate_v3_edited_data), # v3 and older
+            (4, self._migrate_v4_data),
+            (5, self._migrate_v5_data),
+            (6, self._migrate_v6_data),
+            (7, self._migrate_v7_data),
+            (8, self._migrate_v8_data),
+            (9, self._migrate_v9_data),
+        ]
+
+    def _get_data_version(self, data, file_basename):
+        """Version of a loaded data file: its "data_version" field, or for files saved before it existed, the version in the file name."""
+        if isinstance(data.get("data_version"), int): return data["data_version"]
+        version_match = re.search(r"_v(\d+)\.json$", file_basename)
+        if version_match:
+            file_version = int(version_match.group(1))
+            return 3 if file_version <= 4 else file_version # v4 files start with the v3 migration (as before)
+        return 3 # classroom_data.json and unversioned imports: run every migration
+
+    def _run_data_migrations(self, data, from_version):
+        """Runs each registered migration from from_version up to CURRENT_DATA_VERSION once, timing every step."""
+        migration_report = []
+        total_start_time = time.perf_counter()
+        for migration_from_version, migrate in self._get_data_migrations():
+            if migration_from_version < from_version: continue
+            step_start_time = time.perf_counter()
+            data = migrate(data)
+            migration_report.append((migration_from_version, time.perf_counter() - step_start_time))
+        data["data_version"] = CURRENT_DATA_VERSION
+        for migration_from_version, seconds in migration_report:
+            print(f"  Migration v{migration_from_version} -> v{migration_from_version + 1}: {seconds * 1000:.1f} ms")
+        print(f"Data migration to v{CURRENT_DATA_VERSION} finished in {(time.perf_counter() - total_start_time) * 1000:.1f} ms ({len(migration_report)} step(s)).")
+        self.last_migration_report = migration_report
+        return data
+
+    def _is_main_data_file_load(self, target_file, is_restore):
+        return not is_restore and os.path.abspath(target_file) == os.path.abspath(DATA_FILE)
+
+    def _read_logs_from_database(self, encrypt=True):
+        """Loads the behavior/quiz and homework logs of a data file saved with the SQLite log storage."""
+        database = LogDatabase(LOG_DATABASE_FILE, encrypt=encrypt)
+        try:
+            assigned_count = database.assign_missing_log_ids() # Rows stored before log IDs existed
+            if assigned_count: print(f"Gave {assigned_count} stored log entries a log ID.")
+            behavior_log, homework_log = database.load_all()
+            print(f"Loaded {len(behavior_log) + len(homework_log)} log entries from {os.path.basename(LOG_DATABASE_FILE)}.")
+            return behavior_log, homework_log
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Error reading log database {LOG_DATABASE_FILE}: {e}")
+            messagebox.showerror("Log Database Error", f"Could not read the log database:\n{e}\n\nLogs will appear empty until it is repaired or restored from a backup.", parent=self.root)
+            return [], []
+        finally:
+            database.close()
+
+    def _apply_log_storage_backend(self):
+        """
+        Switches log storage to match the "use_sqlite_log_storage" setting. When the SQLite backend is first
+        enabled, the logs currently held in the data file are imported into LOG_DATABASE_FILE in one transaction.
+        """
+        self.log_store.close() # The database file may have been replaced (restore) or is no longer used
+        if not self.settings.get("use_sqlite_log_storage", False):
+            self.log_store = LogStore(self)
+            if self._logs_in_database:
+                self._logs_in_database = False # Logs go back into the data file on the next save
+                self.save_manager.mark_dirty()
+            return
+        sqlite_store = SQLiteLogStore(self, LOG_DATABASE_FILE)
+        try:
+            if not self._logs_in_database:
+                imported_count = sqlite_store.import_logs()
+                print(f"Imported {imported_count} log entries into {os.path.basename(LOG_DATABASE_FILE)}.")
+                self._logs_in_database = True
+                self.save_manager.mark_dirty()
+                # Save right away: until the data file says its logs are in the database, a restart would import them again
+                self.save_data_wrapper(source="log_storage_migration")
+        except sqlite3.Error as e:
+            sqlite_store.close()
+            print(f"Could not use log database {LOG_DATABASE_FILE}: {e}")
+            messagebox.showerror("Log Database Error", f"Could not set up the log database:\n{e}\n\nLogs will stay in the main data file.", parent=self.root)
+            self.settings["use_sqlite_log_storage"] = False
+            self.log_store = LogStore(self)
+            return
+        self.log_store = sqlite_store
+
     def _migrate_v8_data(self, data): # New migration for v8 -> v9
         """Migration for data version 8 (APP_VERSION v51) to v9 (APP_VERSION v52)."""
         # Add new homework-related settings if missing
@@ -4451,9 +4658,12 @@ class SeatingChartApp:
         return data
 
     def autosave_data_wrapper(self):
-        self.save_data_wrapper(source="autosave")
-        if hasattr(self, 'autosave_excel_log') and callable(self.autosave_excel_log):
-             self.autosave_excel_log() # Call autosave for Excel if it exists
+        # Nothing to do unless a command changed data since the last save or log changes are waiting in the journal
+        if self.save_manager.is_dirty or self.log_journal.has_records():
+            self.save_data_wrapper(source="autosave")
+        if self._excel_autosave_needed and hasattr(self, 'autosave_excel_log') and callable(self.autosave_excel_log):
+            self._excel_autosave_needed = False
+            self.autosave_excel_log() # Call autosave for Excel if it exists
         self.root.after(self.settings.get("autosave_interval_ms", 30000), self.autosave_data_wrapper)
 
     def autosave_excel_log(self):
@@ -4477,7 +4687,12 @@ class SeatingChartApp:
                 "separate_sheets_by_log_type": self.settings.get("excel_export_separate_sheets_by_default", True),
                 "excel_export_master_log_by_default": self.settings.get("excel_export_master_log_by_default", True)
             }
-            self.export_data_to_excel(filename, "xlsx", filter_settings, is_autosave=True)
+            if any(job.name == "Excel autosave" for job in self.export_jobs.active_jobs()):
+                self._excel_autosave_needed = True # The previous one is still being written; try again next time
+                return
+            snapshot = self._export_snapshot(filter_settings)
+            self.run_export_job("Excel autosave", lambda job: self.export_data_to_excel(filename, "xlsx", filter_settings, is_autosave=True, snapshot=snapshot, job=job),
+                                on_error=lambda e: print(f"Error during Excel autosave: {e}"), quiet=True)
                 # self.update_status(f"Log autosaved to {os.path.basename(filename)} at {datetime.now().strftime('%H:%M:%S')}")
             #except Exception as e:
             #    print(f"Error during Excel autosave: {e}")
@@ -4636,23 +4851,10 @@ class SeatingChartApp:
         self.all_homework_log_behaviors = DEFAULT_HOMEWORK_LOG_BEHAVIORS + [b["name"] for b in self.custom_homework_statuses if "name" in b]
    
     def get_earliest_log_date(self, type):
-        log_source = self.behavior_log + self.homework_log
-        
-        #all_recent_logs = sorted(
-        #            [log for log in log_source
-        #             if log["student_id"] == student_id and log.get("type") in type_filter_values and
-        #                datetime.fromisoformat(log["timestamp"]) >= cutoff_time],
-        #            key=lambda x: x["timestamp"], reverse=True
-        #        )
-        
-        
-        all_recent_logs = sorted([log for log in log_source],
-                                  key=lambda x: x["timestamp"], reverse=False)
+        earliest_date = self.log_store.earliest_log_date() # The logs are kept sorted, so no full sort is needed
 
-        if all_recent_logs:
-            v = all_recent_logs[0].get("timestamp")
-            b = v[:v.find("T")]
-            c = int(b.replace("-", ""))
+        if earliest_date:
+            c = int(earliest_date.strftime("%Y%m%d"))
             
         else:
             c = str(datetime.now())
@@ -4666,6 +4868,48 @@ class SeatingChartApp:
         print(c)
         return c
     
+    # --- Background export jobs ---
+    def _export_snapshot(self, filter_settings=None):
+        """Copies what the exporters read (and the logs selected by filter_settings), taken on the Tk thread for a background export."""
+        return ExportSnapshot(
+            students=copy.deepcopy(self.students), settings=copy.deepcopy(self.settings),
+            student_groups=copy.deepcopy(self.student_groups),
+            all_homework_session_types=copy.deepcopy(self.all_homework_session_types),
+            logs=copy.deepcopy(self._query_logs_for_export(filter_settings)) if filter_settings is not None else [])
+
+    def run_export_job(self, name, work, on_done=None, on_error=None, on_cancelled=None, quiet=False):
+        """Runs work(job) on the export worker against a snapshot it was given; the callbacks run on the Tk thread."""
+        return self.export_jobs.submit(name, work, on_done, on_error, on_cancelled, quiet)
+
+    def _poll_export_jobs(self):
+        self.export_jobs.poll()
+        self.root.after(100, self._poll_export_jobs)
+
+    def _on_export_job_progress(self, job):
+        if self.export_progress_frame is None: return
+        shown_jobs = [active_job for active_job in self.export_jobs.active_jobs() if not active_job.quiet]
+        bar = self.export_progress_bar
+        if not shown_jobs:
+            if self._export_progress_animating: bar.stop(); self._export_progress_animating = False
+            self.export_progress_frame.pack_forget()
+            return
+        current = next((active_job for active_job in shown_jobs if active_job.state == "running"), shown_jobs[0])
+        text = f"{current.name}: {current.message}"
+        if len(shown_jobs) > 1: text += f" (+{len(shown_jobs) - 1} queued)"
+        self.export_progress_label.configure(text=text)
+        if current.total:
+            if self._export_progress_animating: bar.stop(); self._export_progress_animating = False
+            bar.configure(mode="determinate", maximum=current.total, value=min(current.done or 0, current.total))
+        elif not self._export_progress_animating: # Nothing to count yet
+            bar.configure(mode="indeterminate"); bar.start(20); self._export_progress_animating = True
+        if not self.export_progress_frame.winfo_manager(): self.export_progress_frame.pack(side=tk.RIGHT, fill=tk.Y)
+
+    def cancel_export_jobs(self):
+        shown_jobs = [job for job in self.export_jobs.active_jobs() if not job.quiet]
+        if not shown_jobs: return
+        for job in shown_jobs: job.cancel() # Each job stops at its next progress report
+        self.export_progress_label.configure(text="Cancelling...")
+
     def export_log_dialog_with_filter(self, export_type="xlsx"):
         if self.password_manager.is_locked:
             if not self.prompt_for_password("Unlock to Export", "Enter password to export log data:"): return
@@ -4689,22 +4933,27 @@ class SeatingChartApp:
             else: return
 
             if file_path:
-                try:
+                snapshot = self._export_snapshot(filter_settings)
+                def export_log(job):
                     if export_type in ["xlsx", "xlsm"]:
-                        self.export_data_to_excel(file_path, export_type, filter_settings)
+                        self.export_data_to_excel(file_path, export_type, filter_settings, snapshot=snapshot, job=job)
                     elif export_type == "csv":
-                        self.export_data_to_csv_zip(file_path, filter_settings)
+                        self.export_data_to_csv_zip(file_path, filter_settings, snapshot=snapshot, job=job)
 
+                def on_exported(_result):
                     self.last_excel_export_path = file_path # Store path even for CSV for "Open Last Export Folder"
                     self.update_open_last_export_folder_menu_item()
                     self.save_data_wrapper(source="export_log")
                     self.update_status(f"Log exported to {os.path.basename(file_path)}")
                     if messagebox.askyesno("Export Successful", f"Log exported successfully to:\n{file_path}\n\nDo you want to open the file location?", parent=self.root):
                         self.open_last_export_folder()
-                except Exception as e:
+                def on_export_error(e):
                     messagebox.showerror("Export Error", f"Failed to export log: {e}", parent=self.root)
                     self.update_status(f"Error exporting log: {e}")
                     print(f"Error: {e}")
+                self.run_export_job(f"Exporting {os.path.basename(file_path)}", export_log, on_exported, on_export_error,
+                                    lambda: self.update_status("Export cancelled."))
+                self.update_status(f"Exporting log to {os.path.basename(file_path)}...")
             else: self.update_status("Export cancelled.")
             self.password_manager.record_activity()
 
@@ -4714,25 +4963,32 @@ class SeatingChartApp:
         if not safe_name: safe_name = str(id_fallback)
         return safe_name[:31] # Max 31 chars for sheet names
 
-    def export_data_to_excel(self, file_path, export_format="xlsx", filter_settings=None, is_autosave=False, export_all_students_info = True):
+    def _query_logs_for_export(self, filter_settings):
+        """Logs selected by the export dialog's log-type, date range and student filters (the exporters apply the rest)."""
+        start_date, end_date = filter_settings.get("start_date"), filter_settings.get("end_date")
+        student_ids = filter_settings.get("student_ids", []) if filter_settings.get("selected_students", "all") == "specific" else None
+        logs_to_process = []
+        if filter_settings.get("include_behavior_logs", True):
+            logs_to_process.extend(self.log_store.query("behavior", ("behavior",), start_date, end_date, student_ids))
+        if filter_settings.get("include_quiz_logs", True):
+            logs_to_process.extend(self.log_store.query("behavior", ("quiz",), start_date, end_date, student_ids))
+        if filter_settings.get("include_homework_logs", True):
+            logs_to_process.extend(self.log_store.query("homework", HOMEWORK_LOG_TYPES, start_date, end_date, student_ids))
+        return logs_to_process
+
+    def export_data_to_excel(self, file_path, export_format="xlsx", filter_settings=None, is_autosave=False, export_all_students_info = True, snapshot=None, job=None):
         # ... (substantially updated for new log types, summaries, and filtering)
-        wb = Workbook()
-        wb.remove(wb.active) # Remove default sheet
-        mark_type_configs = self.settings.get("quiz_mark_types", [])
-        mark_type_configs_h = self.settings.get("homework_mark_types", [])
+        # Reads only the snapshot, so it can run as a background job (which also gets progress reports and can be cancelled)
+        if snapshot is None: snapshot = self._export_snapshot(filter_settings)
+        mark_type_configs = snapshot.settings.get("quiz_mark_types", [])
+        mark_type_configs_h = snapshot.settings.get("homework_mark_types", [])
         quiz_mark_type_headers = [mt["name"] for mt in mark_type_configs]
         homework_mark_type_headers = [mt["name"] for mt in mark_type_configs_h]
-        homework_session_types_headers = [mt["name"] for mt in self.all_homework_session_types]
+        homework_session_types_headers = [mt["name"] for mt in snapshot.all_homework_session_types]
 
-        student_data_for_export = {sid: {"first_name": s["first_name"], "last_name": s["last_name"], "full_name": s["full_name"]} for sid, s in self.students.items()}
+        student_data_for_export = {sid: {"first_name": s["first_name"], "last_name": s["last_name"], "full_name": s["full_name"]} for sid, s in snapshot.students.items()}
         
-        logs_to_process = []
-        if filter_settings.get("include_behavior_logs", True):
-            logs_to_process.extend([log for log in self.behavior_log if log.get("type") == "behavior"])
-        if filter_settings.get("include_quiz_logs", True):
-            logs_to_process.extend([log for log in self.behavior_log if log.get("type") == "quiz"])
-        if filter_settings.get("include_homework_logs", True): # New
-            logs_to_process.extend([log for log in self.homework_log if log.get("type") == "homework" or log.get("type") == "homework_session_y" or log.get("type") == "homework_session_s"])
+        logs_to_process = snapshot.logs
 
         # Apply filters
         filtered_stud_ids = set()
@@ -4747,9 +5003,9 @@ class SeatingChartApp:
         homework_types_list_filter = filter_settings.get("homework_types_list", []) # New
         for entry in logs_to_process:
             try:
-                entry_date = datetime.fromisoformat(entry["timestamp"]).date()
-                if start_date and entry_date < start_date: continue
-                if end_date and entry_date > end_date: continue
+                entry_ordinal = log_time(entry["timestamp"]).ordinal
+                if start_date and entry_ordinal < start_date.toordinal(): continue
+                if end_date and entry_ordinal > end_date.toordinal(): continue
             except ValueError: continue # Skip if timestamp is invalid
 
             if selected_students_option == "specific" and entry["student_id"] not in student_ids_filter: continue
@@ -4802,27 +5058,26 @@ class SeatingChartApp:
         else:
             sheets_data["Combined Log"] = filtered_log
 
-
-        bold_font = OpenpyxlFont(bold=True)
-        center_alignment = OpenpyxlAlignment(horizontal='center', vertical='center', wrap_text=True)
-        left_alignment = OpenpyxlAlignment(horizontal='left', vertical='center', wrap_text=True)
-        right_alignment = OpenpyxlAlignment(horizontal='right', vertical='center', wrap_text=False)
+        # Written with a write-only workbook, so cells never pile up in memory. Column widths have to be
+        # set before a sheet's first row: the log sheets measure them while building their row values.
+        total_rows = sum(len(entries) for entries in sheets_data.values()) + (len(filtered_log) if export_all_students_info else 0)
+        wb = StreamingWorkbook(on_progress=(lambda workbook: job.progress(f"{workbook.rows_written} rows written, {workbook.sheet_count} sheets",
+                                                                          min(workbook.rows_written, total_rows), total_rows)) if job else None)
 
         for sheet_name, entries_for_sheet in sheets_data.items():
             if not entries_for_sheet and ((sheet_name != "Combined Log" or sheet_name != "Master Log") or not filtered_log) : continue # Skip empty specific sheets
 
-            ws = wb.create_sheet(title=sheet_name)
             headers = ["Timestamp", "Date", "Time", "Day", "Student ID", "First Name", "Last Name"]
             if sheet_name == "Behavior Log" or not separate_sheets or sheet_name == "Master Log": headers.append("Behavior")
             if sheet_name == "Quiz Log" or not separate_sheets or sheet_name == "Master Log":
                 headers.extend(["Quiz Name", "Num Questions"])
                 # Add headers for each mark type (e.g., Correct, Incorrect, Bonus)
-                for mt in self.settings.get("quiz_mark_types", []): headers.append(mt["name"])
+                for mt in snapshot.settings.get("quiz_mark_types", []): headers.append(mt["name"])
                 headers.append("Quiz Score (%)")
             if sheet_name == "Homework Log" or not separate_sheets or sheet_name == "Master Log": # New headers for Homework
                 headers.extend(["Homework Type/Session Name", "Num Items"])
                 # Add headers for each homework mark type
-                for hmt in self.settings.get("homework_mark_types", []): headers.append(hmt["name"])
+                for hmt in snapshot.settings.get("homework_mark_types", []): headers.append(hmt["name"])
                 headers.extend(["Homework Score (Total Pts)", "Homework Effort"]) # Example summary fields
                 headers.extend(homework_session_types_headers)
             headers.append("Comment")
@@ -4833,37 +5088,36 @@ class SeatingChartApp:
             if not separate_sheets or sheet_name == "Master Log": headers.append("Log Type")
 
 
-            for col_num, header_title in enumerate(headers, 1):
-                cell = ws.cell(row=1, column=col_num, value=header_title)
-                cell.font = bold_font; cell.alignment = center_alignment
-            ws.freeze_panes = 'A2'
+            sheet_rows = [[ExportCell(header_title, "export_header") for header_title in headers]]
+            column_widths = ColumnWidths()
+            column_widths.measure(sheet_rows[0])
 
-            row_num = 2
             for entry in entries_for_sheet:
+                cells = {} # {column number: value}; some entry types skip or go back over columns
                 student_info = student_data_for_export.get(entry["student_id"], {"first_name": "N/A", "last_name": "N/A"})
-                try: dt_obj = datetime.fromisoformat(entry["timestamp"])
+                try: dt_obj = log_time(entry["timestamp"]).dt
                 except ValueError: dt_obj = datetime.now() # Fallback
                 col_num = 1
-                ws.cell(row=row_num, column=col_num, value=entry["timestamp"]); col_num+=1
-                ws.cell(row=row_num, column=col_num, value=dt_obj.strftime('%Y-%m-%d')).alignment = right_alignment; col_num+=1
-                ws.cell(row=row_num, column=col_num, value=dt_obj.strftime('%H:%M:%S')).alignment = right_alignment; col_num+=1
-                ws.cell(row=row_num, column=col_num, value=entry.get("day", dt_obj.strftime('%A'))); col_num+=1
-                ws.cell(row=row_num, column=col_num, value=entry["student_id"]); col_num+=1
-                ws.cell(row=row_num, column=col_num, value=student_info["first_name"]); col_num+=1
-                ws.cell(row=row_num, column=col_num, value=student_info["last_name"]); col_num+=1
+                cells[col_num] = entry["timestamp"]; col_num+=1
+                cells[col_num] = ExportCell(dt_obj.strftime('%Y-%m-%d'), "export_right"); col_num+=1
+                cells[col_num] = ExportCell(dt_obj.strftime('%H:%M:%S'), "export_right"); col_num+=1
+                cells[col_num] = entry.get("day", dt_obj.strftime('%A')); col_num+=1
+                cells[col_num] = entry["student_id"]; col_num+=1
+                cells[col_num] = student_info["first_name"]; col_num+=1
+                cells[col_num] = student_info["last_name"]; col_num+=1
 
                 entry_type = entry.get("type", "behavior")
 
                 if sheet_name == "Behavior Log" or ((not separate_sheets or sheet_name == "Master Log") and entry_type == "behavior"):
-                    ws.cell(row=row_num, column=col_num, value=entry.get("behavior")); col_num+=1
+                    cells[col_num] = entry.get("behavior"); col_num+=1
                 elif sheet_name == "Quiz Log" or ((not separate_sheets or sheet_name == "Master Log") and entry_type == "quiz"):
-                    ws.cell(row=row_num, column=col_num, value=entry.get("behavior")); col_num+=1 # Quiz Name
-                    num_q = entry.get("num_questions", 0); ws.cell(row=row_num, column=col_num, value=num_q).alignment = right_alignment; col_num+=1
+                    cells[col_num] = entry.get("behavior"); col_num+=1 # Quiz Name
+                    num_q = entry.get("num_questions", 0); cells[col_num] = ExportCell(num_q, "export_right"); col_num+=1
                     marks_data = entry.get("marks_data", {})
                     total_possible_points_for_calc = 0; total_earned_points_for_calc = 0; extra_credit_earned = 0
-                    for mt in self.settings.get("quiz_mark_types", []):
+                    for mt in snapshot.settings.get("quiz_mark_types", []):
                         points = marks_data.get(mt["id"], 0)
-                        ws.cell(row=row_num, column=col_num, value=points).alignment = right_alignment; col_num+=1
+                        cells[col_num] = ExportCell(points, "export_right"); col_num+=1
                         if mt.get("contributes_to_total", True): total_possible_points_for_calc += mt.get("default_points",1) * num_q # Simplified: assumes each question can get this mark type
                         if points > 0 : # Only add earned if student got this mark
                             if mt.get("is_extra_credit", False): extra_credit_earned += points * mt.get("default_points",1)
@@ -4874,16 +5128,16 @@ class SeatingChartApp:
                         # Calculate total possible for main questions based on default points of contributing mark types
                         # This is a simplification; assumes each question has a potential max based on one 'correct' type
                         main_q_total_possible = 0
-                        correct_type = next((m for m in self.settings.get("quiz_mark_types",[]) if m.get("id") == "mark_correct"), None)
+                        correct_type = next((m for m in snapshot.settings.get("quiz_mark_types",[]) if m.get("id") == "mark_correct"), None)
                         if correct_type: main_q_total_possible = correct_type.get("default_points", 1) * num_q
 
                         if main_q_total_possible > 0:
                             score_percent = ((total_earned_points_for_calc + extra_credit_earned) / main_q_total_possible) * 100
                         elif total_earned_points_for_calc + extra_credit_earned > 0 : # Scored only on EC or non-standard
                             score_percent = 100 # Or some other representation
-                    ws.cell(row=row_num, column=col_num, value=round(score_percent,2) if score_percent else "").alignment = right_alignment; col_num+=1
+                    cells[col_num] = ExportCell(round(score_percent,2) if score_percent else "", "export_right"); col_num+=1
                 elif sheet_name == "Homework Log" or ((not separate_sheets or sheet_name == "Master Log") and (entry_type == "homework" or entry_type == "homework_session_y" or entry_type == "homework_session_s")): # New Homework
-                    ws.cell(row=row_num, column=col_num, value=entry.get("homework_type", entry.get("behavior"))); col_num+=1 # Homework Type/Session Name
+                    cells[col_num] = entry.get("homework_type", entry.get("behavior")); col_num+=1 # Homework Type/Session Name
                     num_items = entry.get("num_items") # For manually logged with marks
                     if entry.get("type") == "homework_session_s": # For live sessions
                         # Try to count items from details if Yes/No mode
@@ -4895,7 +5149,7 @@ class SeatingChartApp:
                     
                     if separate_sheets and (sheet_name == "Combined Log") or sheet_name == "Master Log":
                         col_num += len(headers)-(len(homework_session_types_headers))-(col_num)-10
-                    ws.cell(row=row_num, column=col_num, value=num_items if num_items is not None else "").alignment = right_alignment; col_num+=1
+                    cells[col_num] = ExportCell(num_items if num_items is not None else "", "export_right"); col_num+=1
                     total_hw_points = 0; effort_score_val = "" # For summary columns
                     if entry_type == "homework" and "marks_data" in entry: # Graded manual log
                         
@@ -4903,9 +5157,9 @@ class SeatingChartApp:
                         #    col_num += len(headers)-(len(homework_session_types_headers))-(col_num)-9
                         
                         hw_marks_data = entry.get("marks_data", {})
-                        for hmt in self.settings.get("homework_mark_types", []):
+                        for hmt in snapshot.settings.get("homework_mark_types", []):
                             val = hw_marks_data.get(hmt["id"], "")
-                            ws.cell(row=row_num, column=col_num, value=val).alignment = right_alignment; col_num+=1
+                            cells[col_num] = ExportCell(val, "export_right"); col_num+=1
                             if isinstance(val, (int,float)): total_hw_points += val # Sum points if numeric
                             if hmt["id"] == "hmark_effort": effort_score_val = val # Capture effort score
                             
@@ -4941,13 +5195,13 @@ class SeatingChartApp:
                             col_num += ((((len(headers)-col_num)-len(homework_session_types_headers))) if not is_autosave else (((len(headers)-col_num)-len(homework_session_types_headers)))) if "Master Log" not in sheet_name or "Combined Log" not in sheet_name else ((((len(headers)-col_num)-len(homework_session_types_headers))-1) if not is_autosave else (((len(headers)-col_num)-len(homework_session_types_headers))))
                             for typeh in entry.get("homework_details"):
                                 #print(typeh)
-                                for hwtype in self.all_homework_session_types:
+                                for hwtype in snapshot.all_homework_session_types:
                                     h_id = hwtype.get("id")
                                     name = hwtype.get("name")
                                     if typeh == h_id:
                                         found_status_for_mark_type2 = entry.get("homework_details").get(typeh).capitalize()
                                 i += 1
-                                ws.cell(row=row_num, column=col_num, value=found_status_for_mark_type2).alignment = right_alignment; col_num+=1
+                                cells[col_num] = ExportCell(found_status_for_mark_type2, "export_right"); col_num+=1
                         elif live_session_mode == "homework_session_s":
                             selected_options = session_details.get("selected_options", [])
                             
@@ -4955,7 +5209,7 @@ class SeatingChartApp:
                             s_correct = str(selected_options).removeprefix("[").removesuffix("]")
                             #s_total = len(selected_options)
                             #ws.cell(row=row_num, column=col_num, value=s_total).alignment = right_alignment; col_num+=1
-                            ws.cell(row=row_num, column=col_num, value=s_correct).alignment = right_alignment; col_num+=1
+                            cells[col_num] = ExportCell(s_correct, "export_right"); col_num+=1
                             """for hmt in self.settings.get("homework_mark_types", []): # Fill placeholders based on selected options
                                 val_to_put = ""
                                 if hmt["name"] in selected_options: # If a mark type name matches a selected option
@@ -4965,28 +5219,23 @@ class SeatingChartApp:
                                 
                                 
                         else: # Unknown live mode or no details
-                            for _ in self.settings.get("homework_mark_types", []): ws.cell(row=row_num, column=col_num, value="").alignment = right_alignment; col_num+=1
+                            for _ in snapshot.settings.get("homework_mark_types", []): cells[col_num] = ExportCell("", "export_right"); col_num+=1
 
-                    ws.cell(row=row_num, column=col_num, value=total_hw_points if total_hw_points else "").alignment = right_alignment; col_num+=1 # Total Points
-                    ws.cell(row=row_num, column=col_num, value=effort_score_val).alignment = right_alignment; col_num+=1 # Effort
+                    cells[col_num] = ExportCell(total_hw_points if total_hw_points else "", "export_right"); col_num+=1 # Total Points
+                    cells[col_num] = ExportCell(effort_score_val, "export_right"); col_num+=1 # Effort
 
                 comment_col = headers.index("Comment") + 1
-                ws.cell(row=row_num, column=comment_col, value=entry.get("comment", "")).alignment = left_alignment
+                cells[comment_col] = ExportCell(entry.get("comment", ""), "export_left")
                 if not separate_sheets or sheet_name == "Master Log":
                     log_type_col = headers.index("Log Type") + 1
-                    ws.cell(row=row_num, column=log_type_col, value=entry.get("type", "behavior").capitalize())
-                row_num += 1
-
-            # Auto-size columns
-            for col_letter in [get_column_letter(i) for i in range(1, ws.max_column + 1)]:
-                max_length = 0
-                column_values = [cell.value for cell in ws[col_letter]]
-                for cell_val in column_values:
-                    if cell_val is not None:
-                        try: max_length = max(max_length, len(str(cell_val)))
-                        except: pass
-                adjusted_width = (max_length + 2) * 1.2
-                ws.column_dimensions[col_letter].width = min(max(adjusted_width, 10), 50) # Min/Max width
+                    cells[log_type_col] = entry.get("type", "behavior").capitalize()
+                row = row_from_columns(cells)
+                column_widths.measure(row)
+                sheet_rows.append(row)
+
+            ws = wb.create_sheet(sheet_name, widths=column_widths.widths(), freeze_panes='A2')
+            for row in sheet_rows: wb.append(ws, row)
+            sheet_rows = None
 
         log_data_to_export = filtered_log
 
@@ -5000,10 +5249,19 @@ class SeatingChartApp:
             student_headers.extend(homework_session_types_headers)
             # Put this line below back if it puts something in those columns
             #student_headers.extend(["Homework Type/Session Name", "Num Items"])
+            student_widths = {}
+            for col_num, header_text in enumerate(student_headers, 1):
+                width = len(header_text) + 5 # Basic width
+                if header_text == "Timestamp": width = 20
+                elif header_text == "Behavior/Homework/Quiz Name": width = 30
+                elif header_text == "Type": width = 20
+                elif header_text == "Comment": width = 40
+                elif header_text == "Day": width = 12
+                student_widths[col_num] = width
 
             for entry in log_data_to_export:
                 student_id = entry["student_id"]
-                student_data = self.students.get(student_id)
+                student_data = snapshot.students.get(student_id)
                 student_name_for_sheet = self._make_safe_sheet_name(
                     f"{student_data['first_name']}_{student_data['last_name']}" if student_data else f"Unknown_{student_id}",
                     student_id
@@ -5014,7 +5272,7 @@ class SeatingChartApp:
                     total_hw_points = 0; effort_score_val = "" # For summary columns
                     hw_marks_data = entry.get("marks_data", {})
                     i=0
-                    for hmt in self.settings.get("homework_mark_types", []):
+                    for hmt in snapshot.settings.get("homework_mark_types", []):
                         val = hw_marks_data.get(hmt["id"], "")
                         #ws.cell(row=row_num, column=col_num, value=val).alignment = right_alignment; col_num+=1
                         if isinstance(val, (int,float)): total_hw_points += val # Sum points if numeric
@@ -5029,33 +5287,22 @@ class SeatingChartApp:
                     
                     
                 if student_id not in student_worksheets:
-                    ws_student = wb.create_sheet(title=student_name_for_sheet)
+                    ws_student = wb.create_sheet(student_name_for_sheet, widths=student_widths)
                     student_worksheets[student_id] = ws_student
-                    ws_student.append(student_headers)
-                    for col_num, header_text in enumerate(student_headers, 1):
-                        cell = ws_student.cell(row=1, column=col_num)
-                        cell.font = OpenpyxlFont(bold=True)
-                        cell.alignment = OpenpyxlAlignment(horizontal="center")
-                        width = len(header_text) + 5 # Basic width
-                        if header_text == "Timestamp": width = 20
-                        elif header_text == "Behavior/Homework/Quiz Name": width = 30
-                        elif header_text == "Type": width = 20
-                        elif header_text == "Comment": width = 40
-                        elif header_text == "Day": width = 12
-                        ws_student.column_dimensions[get_column_letter(col_num)].width = width
+                    wb.append(ws_student, [ExportCell(header_text, "export_column_header") for header_text in student_headers])
 
                 ws_student = student_worksheets[student_id]
-                ts_obj_s = datetime.fromisoformat(entry["timestamp"])
+                ts_obj_s = log_time(entry["timestamp"]).dt
                 s_correct, s_total, s_perc = "", "", ""
                 s_quiz_marks_data = [""] * len(quiz_mark_type_headers)
-                all_h_types = self.all_homework_session_types
+                all_h_types = snapshot.all_homework_session_types
                 s_homework_marks_data_2 = [""] * len(all_h_types)
                 #print(all_h_types)
                 
                 
                 if entry.get("type") == "quiz":
                     s_marks_data = entry.get("marks_data")
-                    s_num_q = entry.get("num_questions", self.settings.get("default_quiz_questions",10))
+                    s_num_q = entry.get("num_questions", snapshot.settings.get("default_quiz_questions",10))
                     if "score_details" in entry: # Live quiz
                         s_correct = entry["score_details"].get("correct", "")
                         s_total = entry["score_details"].get("total_asked", "")
@@ -5098,50 +5345,46 @@ class SeatingChartApp:
                 s_row_base.extend(s_homework_marks_data)
                 s_row_base.extend(s_homework_marks_data_2)
                 
-                ws_student.append(s_row_base)
+                wb.append(ws_student, s_row_base)
 
         # --- Student Information Sheet ---
         #print((filtered_stud_ids))
         if export_all_students_info and len(filtered_stud_ids) > 1:
-            students_info_ws = wb.create_sheet(title="Students Info")
             student_info_headers = ["Student ID", "First Name", "Last Name", "Nickname", "Full Name", "Gender", "Group Name"]
-            students_info_ws.append(student_info_headers)
-            for col_num, header in enumerate(student_info_headers, 1):
-                cell = students_info_ws.cell(row=1, column=col_num)
-                cell.font = OpenpyxlFont(bold=True); cell.alignment = OpenpyxlAlignment(horizontal="center")
-                info_widths = {"Student ID": 15, "First Name": 15, "Last Name": 15, "Nickname": 15,
-                               "Full Name": 25, "Gender": 10, "Group Name": 20}
-                students_info_ws.column_dimensions[get_column_letter(col_num)].width = info_widths.get(header, 12)
+            info_widths = {"Student ID": 15, "First Name": 15, "Last Name": 15, "Nickname": 15,
+                           "Full Name": 25, "Gender": 10, "Group Name": 20}
+            students_info_ws = wb.create_sheet("Students Info", widths={col_num: info_widths.get(header, 12) for col_num, header in enumerate(student_info_headers, 1)})
+            wb.append(students_info_ws, [ExportCell(header, "export_column_header") for header in student_info_headers])
             
-            sorted_students_info = sorted(self.students.values(), key=lambda s: (s.get("last_name", "").lower(), s.get("first_name", "").lower()))
+            sorted_students_info = sorted(snapshot.students.values(), key=lambda s: (s.get("last_name", "").lower(), s.get("first_name", "").lower()))
 
             for student_data in sorted_students_info:
                 if student_data.get("id", "") in filtered_stud_ids:
                     group_id = student_data.get("group_id")
                     group_name = ""
-                    if self.settings.get("student_groups_enabled", True) and group_id and group_id in self.student_groups:
-                        group_name = self.student_groups[group_id].get("name", "")
+                    if snapshot.settings.get("student_groups_enabled", True) and group_id and group_id in snapshot.student_groups:
+                        group_name = snapshot.student_groups[group_id].get("name", "")
 
                     info_row = [
                         student_data.get("id", ""), student_data.get("first_name", ""),
                         student_data.get("last_name", ""), student_data.get("nickname", ""),
                         student_data.get("full_name", ""), student_data.get("gender", ""), group_name
                     ]
-                    students_info_ws.append(info_row)
+                    wb.append(students_info_ws, info_row)
 
 
         # Add Summary Sheet if requested
         if filter_settings.get("include_summaries", True) and filtered_log:
-            ws_summary = wb.create_sheet(title="Summary")
-            current_row = 1
-            ws_summary.cell(row=current_row, column=1, value="Log Summary").font = OpenpyxlFont(bold=True, size=14); current_row += 2
+            summary_columns = 4 if filter_settings.get("include_quiz_logs", True) or filter_settings.get("include_homework_logs", True) else (3 if filter_settings.get("include_behavior_logs", True) else 1)
+            ws_summary = wb.create_sheet("Summary", widths={col_num: 25 for col_num in range(1, summary_columns + 1)})
+            wb.append(ws_summary, [ExportCell("Log Summary", "export_title")])
+            wb.append(ws_summary, [])
 
             # Behavior Summary
             if filter_settings.get("include_behavior_logs", True):
-                ws_summary.cell(row=current_row, column=1, value="Behavior Summary by Student").font = bold_font; current_row += 1
+                wb.append(ws_summary, [ExportCell("Behavior Summary by Student", "export_section")])
                 b_headers = ["Student", "Behavior", "Count"]
-                for c_num, h_title in enumerate(b_headers, 1): ws_summary.cell(row=current_row, column=c_num, value=h_title).font = OpenpyxlFont(italic=True)
-                current_row += 1
+                wb.append(ws_summary, [ExportCell(h_title, "export_subheader") for h_title in b_headers])
                 behavior_counts = {} # {student_id: {behavior_name: count}}
                 for entry in filtered_log:
                     if entry.get("type") == "behavior":
@@ -5151,31 +5394,27 @@ class SeatingChartApp:
                 for sid in sorted(behavior_counts.keys(), key=lambda x: student_data_for_export.get(x, {}).get("last_name","")):
                     s_info = student_data_for_export.get(sid, {"full_name": "Unknown"})
                     for b_name, count in sorted(behavior_counts[sid].items()):
-                        ws_summary.cell(row=current_row, column=1, value=s_info["full_name"])
-                        ws_summary.cell(row=current_row, column=2, value=b_name)
-                        ws_summary.cell(row=current_row, column=3, value=count).alignment = right_alignment
-                        current_row +=1
-                current_row +=1 # Spacer
+                        wb.append(ws_summary, [s_info["full_name"], b_name, ExportCell(count, "export_right")])
+                wb.append(ws_summary, []) # Spacer
 
             # Quiz Summary
             if filter_settings.get("include_quiz_logs", True):
-                ws_summary.cell(row=current_row, column=1, value="Quiz Averages by Student").font = bold_font; current_row += 1
+                wb.append(ws_summary, [ExportCell("Quiz Averages by Student", "export_section")])
                 q_headers = ["Student", "Quiz Name", "Avg Score (%)", "Times Taken"]
-                for c_num, h_title in enumerate(q_headers, 1): ws_summary.cell(row=current_row, column=c_num, value=h_title).font = OpenpyxlFont(italic=True)
-                current_row += 1
+                wb.append(ws_summary, [ExportCell(h_title, "export_subheader") for h_title in q_headers])
                 quiz_scores_summary = {} # {student_id: {quiz_name: [scores]}}
                 for entry in filtered_log:
                     if entry.get("type") == "quiz":
                         sid = entry["student_id"]; q_name = entry.get("behavior"); num_q_s = entry.get("num_questions",0)
                         marks_d = entry.get("marks_data", {})
                         total_earned_s = 0; extra_credit_s = 0
-                        for mt_s in self.settings.get("quiz_mark_types", []):
+                        for mt_s in snapshot.settings.get("quiz_mark_types", []):
                             pts_s = marks_d.get(mt_s["id"], 0)
                             if pts_s > 0:
                                 if mt_s.get("is_extra_credit", False): extra_credit_s += pts_s * mt_s.get("default_points",1)
                                 else: total_earned_s += pts_s * mt_s.get("default_points",1)
                         main_q_total_possible_s = 0
-                        correct_type_s = next((m for m in self.settings.get("quiz_mark_types",[]) if m.get("id") == "mark_correct"), None)
+                        correct_type_s = next((m for m in snapshot.settings.get("quiz_mark_types",[]) if m.get("id") == "mark_correct"), None)
                         if correct_type_s and num_q_s > 0: main_q_total_possible_s = correct_type_s.get("default_points", 1) * num_q_s
                         score_val = ((total_earned_s + extra_credit_s) / main_q_total_possible_s) * 100 if main_q_total_possible_s > 0 else (100 if total_earned_s + extra_credit_s > 0 else 0)
                         quiz_scores_summary.setdefault(sid, {}).setdefault(q_name, []).append(score_val)
@@ -5183,19 +5422,14 @@ class SeatingChartApp:
                     s_info = student_data_for_export.get(sid, {"full_name": "Unknown"})
                     for q_name, scores_list in sorted(quiz_scores_summary[sid].items()):
                         avg_score = sum(scores_list) / len(scores_list) if scores_list else 0
-                        ws_summary.cell(row=current_row, column=1, value=s_info["full_name"])
-                        ws_summary.cell(row=current_row, column=2, value=q_name)
-                        ws_summary.cell(row=current_row, column=3, value=f"{avg_score:.2f}%").alignment = right_alignment
-                        ws_summary.cell(row=current_row, column=4, value=len(scores_list)).alignment = right_alignment
-                        current_row+=1
-                current_row +=1
+                        wb.append(ws_summary, [s_info["full_name"], q_name, ExportCell(f"{avg_score:.2f}%", "export_right"), ExportCell(len(scores_list), "export_right")])
+                wb.append(ws_summary, [])
 
             # Homework Summary (New)
             if filter_settings.get("include_homework_logs", True):
-                ws_summary.cell(row=current_row, column=1, value="Homework Completion by Student").font = bold_font; current_row += 1
+                wb.append(ws_summary, [ExportCell("Homework Completion by Student", "export_section")])
                 hw_headers = ["Student", "Homework Type/Session", "Count", "Total Points (if applicable)"]
-                for c_num, h_title in enumerate(hw_headers, 1): ws_summary.cell(row=current_row, column=c_num, value=h_title).font = OpenpyxlFont(italic=True)
-                current_row += 1
+                wb.append(ws_summary, [ExportCell(h_title, "export_subheader") for h_title in hw_headers])
                 homework_summary = {} # {student_id: {hw_type: {"count": 0, "total_points": 0}}}
                 for entry in filtered_log:
                     if entry.get("type") == "homework" or entry.get("type") == "homework_session_s" or entry.get("type") == "homework_session_y":
@@ -5214,52 +5448,46 @@ class SeatingChartApp:
                             if live_mode == "homework_session_y":
                                 for ht_id_key, status_val in hw_details.items():
                                      if status_val.lower() == "yes": # Simplified: 'yes' adds default points of 'complete' mark type
-                                        complete_mark_type = next((m for m in self.settings.get("homework_mark_types",[]) if m["id"] == "hmark_complete"), None)
+                                        complete_mark_type = next((m for m in snapshot.settings.get("homework_mark_types",[]) if m["id"] == "hmark_complete"), None)
                                         if complete_mark_type: summary_entry["total_points"] += complete_mark_type.get("default_points",0)
                             elif live_mode == "homework_session_s":
                                 selected_opts = hw_details.get("selected_options", [])
                                 for opt_name in selected_opts:
-                                    opt_mark_type = next((m for m in self.settings.get("homework_mark_types",[]) if m["name"] == opt_name), None)
+                                    opt_mark_type = next((m for m in snapshot.settings.get("homework_mark_types",[]) if m["name"] == opt_name), None)
                                     if opt_mark_type: summary_entry["total_points"] += opt_mark_type.get("default_points",0)
 
                 for sid in sorted(homework_summary.keys(), key=lambda x: student_data_for_export.get(x, {}).get("last_name","")):
                     s_info = student_data_for_export.get(sid, {"full_name": "Unknown"})
                     for hw_name, data in sorted(homework_summary[sid].items()):
-                        ws_summary.cell(row=current_row, column=1, value=s_info["full_name"])
-                        ws_summary.cell(row=current_row, column=2, value=hw_name)
-                        ws_summary.cell(row=current_row, column=3, value=data["count"]).alignment = right_alignment
-                        ws_summary.cell(row=current_row, column=4, value=f"{data['total_points']:.2f}" if data['total_points'] else "").alignment = right_alignment
-                        current_row += 1
-                current_row += 1
-
-            for col_letter_s in [get_column_letter(i) for i in range(1, ws_summary.max_column + 1)]:
-                 ws_summary.column_dimensions[col_letter_s].width = 25
+                        wb.append(ws_summary, [s_info["full_name"], hw_name, ExportCell(data["count"], "export_right"),
+                                               ExportCell(f"{data['total_points']:.2f}" if data['total_points'] else "", "export_right")])
+                wb.append(ws_summary, [])
 
 
         # Save workbook
+        wb.report_progress() # Last chance to cancel before the file is written
         try:
-            wb.save(filename=file_path)
+            with replace_when_written(file_path) as temp_path: # Never leaves a half-written file at file_path
+                wb.save(temp_path)
         except PermissionError as e:
             if is_autosave:
                 print(f"Autosave PermissionError: {e}. File might be open.")
                 # Don't show messagebox for autosave, just print
-            else:
+            elif job is None: # A job reports the error from its callback on the Tk thread
                 messagebox.showerror("Save Error", f"Permission denied. Could not save to '{file_path}'.\nPlease ensure the file is not open in another program and you have write permissions.", parent=self.root)
             raise # Re-raise to be caught by the calling function for status update
         except Exception as e_save:
             if is_autosave: print(f"Autosave error: {e_save}")
-            else: messagebox.showerror("Save Error", f"An unexpected error occurred while saving Excel file: {e_save}", parent=self.root)
+            elif job is None: messagebox.showerror("Save Error", f"An unexpected error occurred while saving Excel file: {e_save}", parent=self.root)
             raise
 
-    def export_data_to_csv_zip(self, zip_file_path, filter_settings=None):
+    def export_data_to_csv_zip(self, zip_file_path, filter_settings=None, snapshot=None, job=None):
         # ... (updated for new log types and filtering)
+        if snapshot is None: snapshot = self._export_snapshot(filter_settings)
         temp_dir = tempfile.mkdtemp()
         try:
-            student_data_for_export = {sid: {"first_name": s["first_name"], "last_name": s["last_name"], "full_name": s["full_name"]} for sid, s in self.students.items()}
-            logs_to_process_csv = []
-            if filter_settings.get("include_behavior_logs", True): logs_to_process_csv.extend([log for log in self.behavior_log if log.get("type") == "behavior"])
-            if filter_settings.get("include_quiz_logs", True): logs_to_process_csv.extend([log for log in self.behavior_log if log.get("type") == "quiz"])
-            if filter_settings.get("include_homework_logs", True): logs_to_process_csv.extend([log for log in self.homework_log if log.get("type") == "homework" or log.get("type") == "homework_session_y" or log.get("type") == "homework_session_s"])
+            student_data_for_export = {sid: {"first_name": s["first_name"], "last_name": s["last_name"], "full_name": s["full_name"]} for sid, s in snapshot.students.items()}
+            logs_to_process_csv = snapshot.logs
 
             filtered_log_csv = []
             start_date_csv, end_date_csv = filter_settings.get("start_date"), filter_settings.get("end_date")
@@ -5269,9 +5497,9 @@ class SeatingChartApp:
 
             for entry in logs_to_process_csv:
                 try:
-                    entry_date = datetime.fromisoformat(entry["timestamp"]).date()
-                    if start_date_csv and entry_date < start_date_csv: continue
-                    if end_date_csv and entry_date > end_date_csv: continue
+                    entry_ordinal = log_time(entry["timestamp"]).ordinal
+                    if start_date_csv and entry_ordinal < start_date_csv.toordinal(): continue
+                    if end_date_csv and entry_ordinal > end_date_csv.toordinal(): continue
                 except ValueError: continue
                 if sel_students_opt_csv == "specific" and entry["student_id"] not in student_ids_flt_csv: continue
                 log_type_csv = entry.get("type", "behavior")
@@ -5293,9 +5521,10 @@ class SeatingChartApp:
                               "Marks_Data_JSON", "Score_Details_JSON", "Homework_Details_JSON"]
                 writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
                 writer.writeheader()
-                for entry in filtered_log_csv:
+                for row_count, entry in enumerate(filtered_log_csv):
+                    if job and row_count % 500 == 0: job.progress(f"{row_count} of {len(filtered_log_csv)} rows written", row_count, len(filtered_log_csv))
                     student_info = student_data_for_export.get(entry["student_id"], {"first_name": "N/A", "last_name": "N/A"})
-                    try: dt_obj = datetime.fromisoformat(entry["timestamp"])
+                    try: dt_obj = log_time(entry["timestamp"]).dt
                     except ValueError: dt_obj = datetime.now()
                     row_data = {
                         "Timestamp": entry["timestamp"], "Date": dt_obj.strftime('%Y-%m-%d'), "Time": dt_obj.strftime('%H:%M:%S'),
@@ -5317,12 +5546,13 @@ class SeatingChartApp:
                 fieldnames_s = ["Student_ID", "First_Name", "Last_Name", "Nickname", "Gender", "Group_ID"]
                 writer_s = csv.DictWriter(csvfile, fieldnames=fieldnames_s, extrasaction='ignore')
                 writer_s.writeheader()
-                for sid, sdata in self.students.items():
+                for sid, sdata in snapshot.students.items():
                      writer_s.writerow({"Student_ID": sid, "First_Name": sdata["first_name"], "Last_Name": sdata["last_name"],
                                         "Nickname": sdata.get("nickname",""), "Gender": sdata.get("gender",""), "Group_ID": sdata.get("group_id","")})
 
             # Create ZIP file
-            with zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            if job: job.progress("Compressing...", len(filtered_log_csv), len(filtered_log_csv))
+            with replace_when_written(zip_file_path) as temp_zip_path, zipfile.ZipFile(temp_zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
                 zf.write(all_logs_csv_path, arcname="all_logs.csv")
                 zf.write(students_csv_path, arcname="students.csv")
                 if filter_settings.get("include_summaries", False): # type: ignore # Basic summary text file
@@ -5345,6 +5575,8 @@ class SeatingChartApp:
         try:
             # Determine current bounds of drawn items on canvas (in canvas coordinates)
             # This uses the scrollregion which should be set by draw_all_items
+            self.flush_redraw()
+            self.draw_culled_items() # The export covers the whole layout, not just the viewport
             s_region = self.canvas.cget("scrollregion")
             if not s_region: # Fallback if scrollregion is not set (e.g. empty canvas)
                  x1, y1, x2, y2 = 0,0, self.canvas.winfo_width(), self.canvas.winfo_height()
@@ -5428,6 +5660,10 @@ class SeatingChartApp:
         workbook = load_workbook(filename=file_path, data_only=True)
         imported_student_count = 0
 
+        # Everything imported is executed as one CompositeCommand at the end: one password prompt, one save, one undo step
+        commands_to_add_students = []
+        current_id_num_for_batch = self.next_student_id_num
+
         # --- Import Students ---
         if student_sheet_name_to_import:
             if student_sheet_name_to_import not in workbook.sheetnames:
@@ -5467,8 +5703,6 @@ class SeatingChartApp:
 
 
             existing_full_names_in_app = {s['full_name'].lower().strip(): s['id'] for s in self.students.values()}
-            commands_to_add_students = []
-            current_id_num_for_batch = self.next_student_id_num # Use app's current next ID
 
             for row_idx, row_values_tuple in enumerate(sheet.iter_rows(min_row=2, values_only=True)):
                 row_values = list(row_values_tuple)
@@ -5549,22 +5783,20 @@ class SeatingChartApp:
                             print(f"Student {full_name_display} already exists. Group update from Excel not yet fully implemented here.")
 
 
-            for cmd in commands_to_add_students:
-                self.execute_command(cmd) # This will update self.next_student_id_num via AddItemCommand
-
-            if commands_to_add_students: # If any students were added
-                 self.next_student_id_num = current_id_num_for_batch # Ensure app's counter is past the last used ID
 
         # --- Import Incidents (Simplified - does not import detailed quiz marks yet) ---
         imported_incident_count = 0
+        incident_commands_to_add = []
         if import_incidents_flag:
-            incident_commands_to_add = []
+            # Students from this import are not in self.students yet, but their sheets can be matched too
+            students_to_match = dict(self.students)
+            students_to_match.update({cmd.item_id: cmd.item_data for cmd in commands_to_add_students})
             for sheet_name_excel in workbook.sheetnames:
                 # Try to match Excel sheet name (e.g., "FirstName_LastName") to an existing student
                 matched_student_id, matched_student_first_name, matched_student_last_name = None, "", ""
                 normalized_excel_sheet_name_for_match = sheet_name_excel.replace("_", " ").lower()
 
-                for s_id_app, s_data_app in self.students.items():
+                for s_id_app, s_data_app in students_to_match.items():
                     # Check against "FirstName LastName" and "FirstName_LastName" formats
                     app_student_full_name_match = s_data_app['full_name'].lower()
                     app_student_export_format_match = f"{s_data_app['first_name']}_{s_data_app['last_name']}".lower()
@@ -5657,8 +5889,14 @@ class SeatingChartApp:
                         except IndexError:
                             print(f"Skipping row {row_idx_inc + 2} in '{sheet_name_excel}' for incident import: missing data columns.")
                             continue
-            for cmd in incident_commands_to_add:
-                self.execute_command(cmd)
+
+        import_commands = commands_to_add_students + incident_commands_to_add
+        if import_commands:
+            import_command = CompositeCommand(self, import_commands, "Excel import")
+            self.execute_command(import_command) # AddItemCommand updates self.next_student_id_num
+            if not self.undo_stack or self.undo_stack[-1] is not import_command: return 0, 0 # Cancelled at the password prompt or failed
+            if commands_to_add_students:
+                self.next_student_id_num = current_id_num_for_batch # Ensure app's counter is past the last used ID
 
         return imported_student_count, imported_incident_count
 
@@ -5676,8 +5914,7 @@ class SeatingChartApp:
                 if import_incidents_flag: status_msg += f" and {imported_incident_count} new incidents"
                 status_msg += ". Duplicates were skipped."
                 self.update_status(status_msg)
-                self.draw_all_items(check_collisions_on_redraw=True)
-                self.save_data_wrapper(source="import_excel") # Save after successful import
+                self.request_redraw(check_collisions=True)
                 self.password_manager.record_activity()
             except Exception as e:
                 messagebox.showerror("Import Error", f"Failed to import from Excel: {e}", parent=self.root)
@@ -5891,7 +6128,7 @@ class SeatingChartApp:
                         print("------------------------------------")
 
                     self.update_status(status_message)
-                    self.draw_all_items(check_collisions_on_redraw=True)
+                    self.request_redraw(check_collisions=True)
                     self.save_data_wrapper(source="load_template")
             except (json.JSONDecodeError, IOError) as e: messagebox.showerror("Load Error", f"Could not load layout template: {e}", parent=self.root)
         else: self.update_status("Layout template load cancelled.")
@@ -5917,76 +6154,68 @@ class SeatingChartApp:
             file_path = filedialog.asksaveasfilename(defaultextension=".xlsx", initialfile=default_filename,
                                                    filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")], parent=self.root)
             if file_path:
-                try:
-                    self.export_attendance_to_excel(file_path, report_data, start_date, end_date)
+                snapshot = self._export_snapshot()
+                def on_saved(_result):
                     self.update_status(f"Attendance report saved to {os.path.basename(file_path)}.")
                     if messagebox.askyesno("Export Successful", f"Attendance report saved to:\n{file_path}\n\nDo you want to open the file location?", parent=self.root):
                         self.open_specific_export_folder(file_path)
-                except Exception as e:
-                    messagebox.showerror("Export Error", f"Failed to save attendance report: {e}", parent=self.root)
+                self.run_export_job(f"Attendance report {os.path.basename(file_path)}",
+                                    lambda job: self.export_attendance_to_excel(file_path, report_data, start_date, end_date, snapshot=snapshot, job=job),
+                                    on_saved, lambda e: messagebox.showerror("Export Error", f"Failed to save attendance report: {e}", parent=self.root),
+                                    lambda: self.update_status("Attendance report export cancelled."))
+                self.update_status(f"Saving attendance report to {os.path.basename(file_path)}...")
             else:
                 self.update_status("Attendance report export cancelled.")
         self.password_manager.record_activity()
 
     def generate_attendance_data(self, start_date, end_date, student_ids):
-        attendance = {} # {date_obj: {student_id: "Present"}}
-        all_logs = self.behavior_log + self.homework_log # Combine logs for presence check
+        """{date: {student_id: "P"/"A"}} for every day of the range, built from one presence map of the logs."""
+        attendance = {}
+        presence = self.log_store.presence_by_day(start_date, end_date, student_ids) # A student is present on days with any log
 
         current_date = start_date
         while current_date <= end_date:
-            attendance[current_date] = {}
-            for student_id in student_ids:
-                # Check if any log entry exists for this student on this date
-                present = any(
-                    log["student_id"] == student_id and
-                    datetime.fromisoformat(log["timestamp"]).date() == current_date
-                    for log in all_logs
-                )
-                attendance[current_date][student_id] = "P" if present else "A" # Present / Absent
+            present_ids = presence.get(current_date, set())
+            attendance[current_date] = {student_id: "P" if student_id in present_ids else "A" for student_id in student_ids} # Present / Absent
             current_date += timedelta(days=1)
         return attendance
 
-    def export_attendance_to_excel(self, file_path, attendance_data, report_start_date, report_end_date):
+    def export_attendance_to_excel(self, file_path, attendance_data, report_start_date, report_end_date, snapshot=None, job=None):
+        students = snapshot.students if snapshot else self.students
         wb = Workbook()
         ws = wb.active
         ws.title = "Attendance Report"
 
-        headers = ["Student Name"]
-        date_columns_map = {} # date_obj -> column_index
-        current_col = 2
+        report_dates = []
         d_iter = report_start_date
         while d_iter <= report_end_date:
-            headers.append(d_iter.strftime("%Y-%m-%d (%a)"))
-            date_columns_map[d_iter] = current_col
-            current_col += 1
-        headers.append("Total Present")
-        headers.append("Total Absent")
+            report_dates.append(d_iter)
+            d_iter += timedelta(days=1)
+        headers = ["Student Name"] + [d.strftime("%Y-%m-%d (%a)") for d in report_dates] + ["Total Present", "Total Absent"]
 
         for col_num, header_title in enumerate(headers, 1):
             ws.cell(row=1, column=col_num, value=header_title).font = OpenpyxlFont(bold=True)
             ws.column_dimensions[get_column_letter(col_num)].width = 15 if col_num > 1 else 25
         ws.freeze_panes = 'B2'
 
-        current_row = 2
         sorted_student_ids = sorted(
-            list(set(sid for day_data in attendance_data.values() for sid in day_data.keys())),
-            key=lambda sid: (self.students.get(sid, {}).get("last_name", ""), self.students.get(sid, {}).get("first_name", ""))
+            {sid for day_data in attendance_data.values() for sid in day_data},
+            key=lambda sid: (students.get(sid, {}).get("last_name", ""), students.get(sid, {}).get("first_name", ""))
         )
-
-        for student_id in sorted_student_ids:
-            student_name = self.students.get(student_id, {}).get("full_name", student_id)
-            ws.cell(row=current_row, column=1, value=student_name)
-            total_present = 0
-            total_absent = 0
-            for date_obj, col_idx in date_columns_map.items():
-                status = attendance_data.get(date_obj, {}).get(student_id, "A")
-                ws.cell(row=current_row, column=col_idx, value=status).alignment = OpenpyxlAlignment(horizontal='center')
-                if status == "P": total_present += 1
-                else: total_absent += 1
-            ws.cell(row=current_row, column=len(headers)-1, value=total_present).alignment = OpenpyxlAlignment(horizontal='center')
-            ws.cell(row=current_row, column=len(headers), value=total_absent).alignment = OpenpyxlAlignment(horizontal='center')
-            current_row += 1
-        wb.save(file_path)
+        day_columns = [attendance_data.get(d, {}) for d in report_dates]
+        centered = OpenpyxlAlignment(horizontal='center') # Shared by every cell instead of one style object per cell
+        for current_row, student_id in enumerate(sorted_student_ids, 2):
+            if job: job.progress(f"{current_row - 2} of {len(sorted_student_ids)} students", current_row - 2, len(sorted_student_ids))
+            ws.cell(row=current_row, column=1, value=students.get(student_id, {}).get("full_name", student_id))
+            statuses = [day_data.get(student_id, "A") for day_data in day_columns]
+            for col_idx, status in enumerate(statuses, 2):
+                ws.cell(row=current_row, column=col_idx, value=status).alignment = centered
+            total_present = statuses.count("P")
+            ws.cell(row=current_row, column=len(headers)-1, value=total_present).alignment = centered
+            ws.cell(row=current_row, column=len(headers), value=len(statuses) - total_present).alignment = centered
+        if job: job.progress("Saving...", len(sorted_student_ids), len(sorted_student_ids))
+        with replace_when_written(file_path) as temp_path:
+            wb.save(temp_path)
 
     def align_selected_items(self, edge):
         if self.password_manager.is_locked:
@@ -6038,7 +6267,7 @@ class SeatingChartApp:
         if move_commands_for_align:
             self.execute_command(MoveItemsCommand(self, move_commands_for_align))
             self.update_status(f"Aligned {len(move_commands_for_align)} items to {edge}.")
-        else: self.update_status("Items already aligned."); self.draw_all_items(check_collisions_on_redraw=True)
+        else: self.update_status("Items already aligned."); self.request_redraw(check_collisions=True)
         self.password_manager.record_activity()
 
     def distribute_selected_items_evenly(self, direction='horizontal'):
@@ -6236,7 +6465,7 @@ class SeatingChartApp:
         enabled = self.settings.get("student_groups_enabled", True)
         if hasattr(self, 'manage_groups_btn'):
             self.manage_groups_btn.config(state=tk.NORMAL if enabled else tk.DISABLED)
-        self.draw_all_items(check_collisions_on_redraw=False) # Redraw to show/hide indicators
+        self.request_redraw() # Redraw to show/hide indicators
 
     def toggle_manage_boxes_visibility(self):
         if self.edit_mode_var.get() or self.settings.get("always_show_box_management", False): self.top_controls_frame_row2.pack(side=tk.TOP, fill=tk.X, pady=(2, 5)); self.top_frame.height_adjusted = 110
@@ -6340,11 +6569,13 @@ class SeatingChartApp:
                                 self.password_manager, self.theme_style_using, self.custom_canvas_color, self.styles, self.type_theme)
         if dialog.settings_changed_flag: # Check if dialog indicated changes
             # Settings are applied directly by the dialog for most parts
+            self._apply_log_storage_backend() # Before saving, so the data file matches where the logs now live
+            self.log_store.invalidate_day_totals() # Quiz scores depend on the quiz mark types
             self.save_data_wrapper(source="settings_dialog") # Save all data as settings are part of it
             self.load_and_apply_settings() # Reload settings based on sharing config
             self.update_all_behaviors(); self.update_all_homework_log_behaviors(); self.update_all_homework_session_types()
             self.guide_line_color = self.settings.get("guides_color", "blue")
-            self.draw_all_items(check_collisions_on_redraw=True)
+            self.request_redraw(check_collisions=True)
             self.update_status("Settings updated.")
             self._update_toggle_dragging_button_text()
             self.update_zoom_display()
@@ -6388,6 +6619,7 @@ class SeatingChartApp:
         try:
             # Clear current data in memory
             self.students.clear(); self.furniture.clear(); self.behavior_log.clear(); self.homework_log.clear()
+            self.invalidate_spatial_index()
             self.student_groups.clear(); self.quiz_templates.clear(); self.homework_templates.clear()
             self.custom_behaviors.clear(); self.custom_homework_statuses.clear(); #self.custom_homework_session_types.clear()
             self.undo_stack.clear(); self.redo_stack.clear()
@@ -6397,9 +6629,13 @@ class SeatingChartApp:
             self._ensure_next_ids() # Reset ID counters based on default settings
             self.password_manager = PasswordManager(self.settings) # Reset password manager with fresh settings
             self.guides.clear()
+            self._flush_pending_saves()
+            self.log_journal.clear()
+            self.log_store.close() # The log database (and its WAL files) is deleted below
+            self.log_store = LogStore(self); self._logs_in_database = False
             # Delete data files
             files_to_delete = [
-                DATA_FILE, CUSTOM_BEHAVIORS_FILE, 
+                DATA_FILE, *database_files(LOG_DATABASE_FILE), CUSTOM_BEHAVIORS_FILE, 
                 CUSTOM_HOMEWORK_TYPES_FILE, # NEW
                 CUSTOM_HOMEWORK_STATUSES_FILE, # RENAMED
                 STUDENT_GROUPS_FILE, QUIZ_TEMPLATES_FILE, HOMEWORK_TEMPLATES_FILE,
@@ -6435,7 +6671,7 @@ class SeatingChartApp:
             # Save fresh default data (which will create new empty files)
             self.save_data_wrapper(source="reset")
             self.update_all_behaviors(); self.update_all_homework_statuses(); self.update_all_homework_session_types()
-            self.draw_all_items(check_collisions_on_redraw=True)
+            self.request_redraw(check_collisions=True)
             self.update_undo_redo_buttons_state()
             self.update_lock_button_state()
             self.update_status("Application has been reset to default state.")
@@ -6462,6 +6698,7 @@ class SeatingChartApp:
             backup_zip_path = os.path.abspath(os.path.join(os.path.dirname(DATA_FILE), default_filename))
         # Ensure latest data is saved before backup
         self.save_data_wrapper(source="backup_preparation")
+        self._flush_pending_saves()
 
         files_to_backup = [
             DATA_FILE, CUSTOM_BEHAVIORS_FILE, 
@@ -6477,21 +6714,44 @@ class SeatingChartApp:
                 fpath = os.path.join(LAYOUT_TEMPLATES_DIR, fname)
                 if os.path.isfile(fpath): layout_template_files.append(fpath)
         
-        try:
-            with zipfile.ZipFile(backup_zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for file_path in files_to_backup:
-                    if os.path.exists(file_path) and os.path.isfile(file_path):
-                        zf.write(file_path, arcname=os.path.basename(file_path))
-                for file_path in layout_template_files:
-                     zf.write(file_path, arcname=os.path.join(LAYOUT_TEMPLATES_DIR_NAME, os.path.basename(file_path)))
+        def on_backup_created(_result):
             self.update_status(f"Backup created: {os.path.basename(backup_zip_path)}")
             messagebox.showinfo("Backup Successful", f"All application data backed up to:\n{backup_zip_path}", parent=self.root)
-        except Exception as e:
+        def on_backup_error(e):
             messagebox.showerror("Backup Error", f"Failed to create backup: {e}", parent=self.root)
             self.update_status(f"Error creating backup: {e}")
+
+        try:
+            # Read the files now, so saves made while the archive is being compressed can't end up half in it
+            backup_contents = [] # [(name in the archive, file bytes)]
+            for file_path in files_to_backup:
+                if os.path.exists(file_path) and os.path.isfile(file_path):
+                    with open(file_path, 'rb') as f: backup_contents.append((os.path.basename(file_path), f.read()))
+            if os.path.exists(LOG_DATABASE_FILE): # Copied with SQLite's backup, so changes still in its WAL file are included
+                log_database = LogDatabase(LOG_DATABASE_FILE)
+                try: backup_contents.append((os.path.basename(LOG_DATABASE_FILE), log_database.backup_bytes()))
+                finally: log_database.close()
+            for file_path in layout_template_files:
+                with open(file_path, 'rb') as f: backup_contents.append((os.path.join(LAYOUT_TEMPLATES_DIR_NAME, os.path.basename(file_path)), f.read()))
+            if force: # A backup taken right before the data is replaced has to be finished first
+                self._write_backup_zip(backup_zip_path, backup_contents)
+                on_backup_created(None)
+            else:
+                self.run_export_job(f"Backup {os.path.basename(backup_zip_path)}", lambda job: self._write_backup_zip(backup_zip_path, backup_contents, job),
+                                    on_backup_created, on_backup_error, lambda: self.update_status("Backup cancelled."))
+                self.update_status(f"Creating backup {os.path.basename(backup_zip_path)}...")
+        except Exception as e:
+            on_backup_error(e)
         finally:
             self.password_manager.record_activity()
 
+    def _write_backup_zip(self, backup_zip_path, backup_contents, job=None):
+        """Compresses [(name in the archive, file bytes)] into backup_zip_path; a cancelled job leaves no partial archive."""
+        with replace_when_written(backup_zip_path) as temp_zip_path, zipfile.ZipFile(temp_zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for file_count, (arcname, content) in enumerate(backup_contents):
+                if job: job.progress(f"{file_count} of {len(backup_contents)} files", file_count, len(backup_contents))
+                zf.writestr(arcname, content)
+
     def restore_all_data_dialog(self):
         if self.password_manager.is_locked:
             if not self.prompt_for_password("Unlock to Restore", "Enter password to restore data:"): return
@@ -6508,6 +6768,7 @@ class SeatingChartApp:
             self.update_status("Restore cancelled."); return
 
         app_data_dir = os.path.dirname(DATA_FILE) # Get the directory where app data is stored
+        self._flush_pending_saves() # Don't let a queued save overwrite the restored files
         
         try:
             with zipfile.ZipFile(backup_zip_path, 'r') as zf:
@@ -6541,6 +6802,11 @@ class SeatingChartApp:
                     os.makedirs(LAYOUT_TEMPLATES_DIR, exist_ok=True)
 
 
+                if os.path.basename(LOG_DATABASE_FILE) in zf.namelist():
+                    # The restored database replaces the current one; its WAL files must not be applied to it
+                    self.log_store.close()
+                    remove_database_files(LOG_DATABASE_FILE)
+
                 # Extract files directly into the application data directory
                 # This will overwrite existing files with the same names.
                 for member in zf.infolist():
@@ -6560,12 +6826,13 @@ class SeatingChartApp:
             # The load_data method handles migration.
             path_to_load_after_restore = os.path.join(app_data_dir, main_data_filename_in_zip) if main_data_filename_in_zip else DATA_FILE
 
+            self.save_manager.forget() # Files on disk were replaced behind the save manager's back
             self.load_data(file_path=path_to_load_after_restore, is_restore=True) # Reload all data from extracted files
             self.load_custom_behaviors(); self.load_custom_homework_statuses(); #self.load_custom_homework_session_types()
             self.load_student_groups(); self.load_quiz_templates(); self.load_homework_templates()
             self._ensure_next_ids() # Crucial after loading potentially old data
             self.update_all_behaviors(); self.update_all_homework_log_behaviors(); self.update_all_homework_session_types()
-            self.draw_all_items(check_collisions_on_redraw=True)
+            self.request_redraw(check_collisions=True)
             self.update_undo_redo_buttons_state()
             self.update_lock_button_state()
             self.toggle_student_groups_ui_visibility()
@@ -6584,7 +6851,7 @@ class SeatingChartApp:
             self.update_status(f"Error restoring data: {e}")
             # Attempt to reload current (pre-restore attempt) data to stabilize
             self.load_data(DATA_FILE, is_restore=False)
-            self.draw_all_items()
+            self.request_redraw()
         finally:
             self.password_manager.record_activity()
 
@@ -6660,7 +6927,7 @@ class SeatingChartApp:
                 self.undo_stack.append(command_to_temporarily_undo) # Put it back if undo failed
                 for cmd_to_re_push in reversed(temp_undone_for_redo_stack): # Re-push successfully undone ones
                     self.undo_stack.append(cmd_to_re_push)
-                self.draw_all_items(check_collisions_on_redraw=True)
+                self.request_redraw(check_collisions=True)
                 return
 
         # 2. The target command is now at the top of the undo_stack. Pop it.
@@ -6682,7 +6949,7 @@ class SeatingChartApp:
             messagebox.showerror("Selective Redo Error", f"Error undoing the target action: {e}", parent=self.root)
             self.undo_stack.append(target_command) # Put target back
             for cmd_to_re_push in reversed(temp_undone_for_redo_stack): self.undo_stack.append(cmd_to_re_push) # Put subsequent back
-            self.draw_all_items(check_collisions_on_redraw=True)
+            self.request_redraw(check_collisions=True)
             return
 
         # 4. Re-execute the target command
@@ -6694,7 +6961,7 @@ class SeatingChartApp:
             # State might be inconsistent. Try to restore the target command to its "undone" state.
             # This is tricky. Simplest is to inform user.
             # For now, we'll leave it as executed on the undo_stack and let user manually undo if needed.
-            self.draw_all_items(check_collisions_on_redraw=True)
+            self.request_redraw(check_collisions=True)
             return
 
         # 5. Invalidate subsequent history: Clear the redo_stack and the temp_undone_for_redo_stack is discarded.
@@ -6703,13 +6970,32 @@ class SeatingChartApp:
         # These actions are now "lost" as a new history branch has been created.
 
         self.update_status(f"Redid action: {target_command.get_description()}. Subsequent history cleared.")
-        self.draw_all_items(check_collisions_on_redraw=True)
+        self.request_redraw(check_collisions=True)
         self.save_data_wrapper(source="selective_redo")
         self.password_manager.record_activity()
         # The UndoHistoryDialog should refresh itself.
 
+    def _finish_export_jobs(self, action):
+        """
+        Before the app exits or restarts: asks whether to wait for the exports and backups the user
+        started or to cancel them (quiet jobs such as the Excel autosave are always cancelled).
+        Returns False if the user chose to stay. Call export_jobs.shutdown() afterwards.
+        """
+        if not any(not job.quiet for job in self.export_jobs.active_jobs()): return True
+        answer = messagebox.askyesnocancel("Export Running", f"An export or backup is still running.\n\nWait for it to finish before {action}?\n"
+                                           "Yes waits, No cancels it, Cancel goes back.", parent=self.root)
+        if answer is None: return False
+        if answer:
+            for job in self.export_jobs.active_jobs():
+                if job.quiet: job.cancel()
+            self.update_status(f"Waiting for exports to finish before {action}...")
+            while self.export_jobs.active_jobs(): # Their callbacks and the progress display still run, but no other input
+                self.export_jobs.poll(); self.root.update_idletasks(); time.sleep(0.05)
+        return True
+
     def switch_profile(self, profile_name_to_load=None):
         """Restarts the application to switch to a different profile."""
+        if not self._finish_export_jobs("switching profiles"): return
         if profile_name_to_load:
             try:
                 # Use a simple file to signal which profile to load on restart.
@@ -6719,6 +7005,8 @@ class SeatingChartApp:
                 messagebox.showerror("Profile Switch Error", f"Could not prepare profile switch: {e}", parent=self.root)
                 return # Abort if we can't write the file
 
+        self.export_jobs.shutdown() # Whatever is still running was cancelled by the user; see _finish_export_jobs
+        self._flush_pending_saves(stop_worker=True)
         if self.file_lock_manager:
             self.file_lock_manager.release_lock()
 
@@ -6785,6 +7073,7 @@ class SeatingChartApp:
 
                 if self.is_live_quiz_active and not self.prompt_end_live_session_on_mode_switch("quiz"): return
                 if self.is_live_homework_active and not self.prompt_end_live_session_on_mode_switch("homework"): return
+                if not self._finish_export_jobs("exiting"): return
 
                 #if messagebox.askyesno("Exit", "Save changes and exit application?", parent=self.root, ):
                 #    self.save_data_wrapper(source="exit_protocol")
@@ -6793,19 +7082,26 @@ class SeatingChartApp:
                 dialog = ExitConfirmationDialog(self.root, "Exit Confirmation")
                 if dialog.result == "save_quit":
                     self.save_data_wrapper(source="exit_protocol")
+                    self.export_jobs.shutdown()
+                    self._flush_pending_saves(stop_worker=True)
                     self.root.destroy()
                     sys.exit(0) # Ensure clean exit
                 elif dialog.result == "no_save_quit":
                     #if self.file_lock_manager: self.file_lock_manager.release_lock()
                     self.update_status("Exited without saving.")
+                    self.export_jobs.shutdown()
+                    self._flush_pending_saves(stop_worker=True) # Saves already queued still complete
                     self.root.destroy()
                     
                     sys.exit(0) # Ensure clean exit
             else: # Force quit (e.g. after save_and_quit or if lock fails)
+                self.export_jobs.shutdown()
+                self._flush_pending_saves(stop_worker=True)
                 self.root.destroy()
                 sys.exit(0) # Ensure clean exit # Data should have been saved by save_and_quit if called from there
         except Exception as e:
             print(f"Error during exit procedure: {e}") # Log error but proceed with exit
+            self.save_manager.stop_worker()
             self.root.destroy()
             sys.exit(0) # Ensure clean exit
         #finally:
@@ -489,6 +489,23 @@ class SettingsDialog(simpledialog.Dialog):
         self.create_sharing_toggle(lf_view_options, "guides_color", row=0, column=7)
         self.widget_map["guides_color"] = {"widget": self.guides_color_entry}
 
+        # Level of detail for student boxes when zoomed out
+        ttk.Label(lf_view_options, text="Show only color and initials below zoom:").grid(row=5, column=0, sticky=tk.W, padx=5, pady=3)
+        self.lod_low_zoom_var = tk.DoubleVar(value=self.settings.get("lod_low_zoom_threshold", 0.5), name='lod_low_zoom_var')
+        self.lod_low_zoom_var.trace_add("write", lambda *args: self.on_setting_change(self.lod_low_zoom_var, "lod_low_zoom_threshold", *args))
+        self.lod_low_zoom_spinbox = ttk.Spinbox(lf_view_options, from_=0.0, to=2.0, increment=0.05, textvariable=self.lod_low_zoom_var, width=6)
+        self.lod_low_zoom_spinbox.grid(row=5, column=1, sticky=tk.W, padx=5, pady=3)
+        self.create_sharing_toggle(lf_view_options, "lod_low_zoom_threshold", row=5, column=3)
+        self.widget_map["lod_low_zoom_threshold"] = {"widget": self.lod_low_zoom_spinbox}
+
+        ttk.Label(lf_view_options, text="Show only names below zoom:").grid(row=6, column=0, sticky=tk.W, padx=5, pady=3)
+        self.lod_medium_zoom_var = tk.DoubleVar(value=self.settings.get("lod_medium_zoom_threshold", 0.75), name='lod_medium_zoom_var')
+        self.lod_medium_zoom_var.trace_add("write", lambda *args: self.on_setting_change(self.lod_medium_zoom_var, "lod_medium_zoom_threshold", *args))
+        self.lod_medium_zoom_spinbox = ttk.Spinbox(lf_view_options, from_=0.0, to=2.0, increment=0.05, textvariable=self.lod_medium_zoom_var, width=6)
+        self.lod_medium_zoom_spinbox.grid(row=6, column=1, sticky=tk.W, padx=5, pady=3)
+        self.create_sharing_toggle(lf_view_options, "lod_medium_zoom_threshold", row=6, column=3)
+        self.widget_map["lod_medium_zoom_threshold"] = {"widget": self.lod_medium_zoom_spinbox}
+
     def style_set(self, event=None):
         self.theme2 = self.theme.get()
         try:
@@ -1254,6 +1271,12 @@ class SettingsDialog(simpledialog.Dialog):
         self.encrypt_data_var.trace_add("write", lambda *args: self.on_setting_change(self.encrypt_data_var, "encrypt_data_files", *args))
         ttk.Checkbutton(lf_encryption, text="Encrypt data files on save (This does NOT protect from deletion)", variable=self.encrypt_data_var).pack(anchor=tk.W, padx=5, pady=2)
 
+        lf_log_storage = ttk.LabelFrame(tab_frame, text="Log Storage", padding=10)
+        lf_log_storage.pack(fill=tk.X, pady=5)
+        self.sqlite_log_storage_var = tk.BooleanVar(value=self.settings.get("use_sqlite_log_storage", False), name='sqlite_log_storage_var')
+        self.sqlite_log_storage_var.trace_add("write", lambda *args: self.on_setting_change(self.sqlite_log_storage_var, "use_sqlite_log_storage", *args))
+        ttk.Checkbutton(lf_log_storage, text="Store behavior, quiz and homework logs in an SQLite database (faster with large log histories)", variable=self.sqlite_log_storage_var).pack(anchor=tk.W, padx=5, pady=2)
+
     def set_or_change_password(self):
         new_pw = self.new_pw_var.get()
         confirm_pw = self.confirm_pw_var.get()
@@ -1487,6 +1510,7 @@ class SettingsDialog(simpledialog.Dialog):
             "password_auto_lock_enabled": False,
             "password_auto_lock_timeout_minutes": 15,
             "encrypt_data_files": True,
+            "use_sqlite_log_storage": False,
 
             # Next ID counters (managed by _ensure_next_ids but good to have defaults)
             "next_student_id_num": 1,
@@ -1512,6 +1536,8 @@ class SettingsDialog(simpledialog.Dialog):
             "guides_stay_when_rulers_hidden": True, # New setting for guides
             "next_guide_id_num": 1, # Added in migration, also good here
             "guides_color": "blue", # Default color for guides
+            "lod_low_zoom_threshold": 0.5, # Below this zoom student boxes show only their color and initials
+            "lod_medium_zoom_threshold": 0.75, # Below this zoom student boxes show names but no logs
             "hidden_default_homework_types": [], # New for hiding default homework types
             "allow_box_dragging": True, # New setting for box dragging
             "canvas_color": "Default"
@@ -2100,6 +2126,7 @@ class SettingsDialog(simpledialog.Dialog):
             "password_auto_lock_enabled": False,
             "password_auto_lock_timeout_minutes": 15,
             "encrypt_data_files": True,
+            "use_sqlite_log_storage": False,
 
             # Next ID counters (managed by _ensure_next_ids but good to have defaults)
             "next_student_id_num": 1,
@@ -2125,6 +2152,8 @@ class SettingsDialog(simpledialog.Dialog):
             "guides_stay_when_rulers_hidden": True, # New setting for guides
             "next_guide_id_num": 1, # Added in migration, also good here
             "guides_color": "blue", # Default color for guides
+            "lod_low_zoom_threshold": 0.5, # Below this zoom student boxes show only their color and initials
+            "lod_medium_zoom_threshold": 0.75, # Below this zoom student boxes show names but no logs
             "hidden_default_homework_types": [], # New for hiding default homework types
             "allow_box_dragging": True, # New setting for box dragging
             "canvas_color": "Default"
@@ -0,0 +1,95 @@
+class SpatialIndex:
+    """
+    Uniform grid over the world rectangles of the items on the canvas (students,
+    furniture, stat boxes), for overlap queries, point hit-testing and the overall
+    bounds without scanning every item.
+
+    Each item is registered in every cell its rectangle touches, so a query only
+    looks at the items in the cells it covers. Rectangles are (x1, y1, x2, y2) in
+    world coordinates; the index does not know about item types or canvas items.
+    """
+    def __init__(self, cell_size=200):
+        self.cell_size = cell_size
+        self._rects = {} # {item_id: (x1, y1, x2, y2)}
+        self._cells = {} # {(column, row): {item_id, ...}}
+        self._bounds = None # (min_x, min_y, max_x, max_y) of all rectangles, None when empty or stale
+        self._bounds_stale = False
+
+    def __len__(self):
+        return len(self._rects)
+
+    def __contains__(self, item_id):
+        return item_id in self._rects
+
+    def _cell_range(self, x1, y1, x2, y2):
+        size = self.cell_size
+        for column in range(int(x1 // size), int(x2 // size) + 1):
+            for row in range(int(y1 // size), int(y2 // size) + 1):
+                yield (column, row)
+
+    def update(self, item_id, x1, y1, x2, y2):
+        """Adds item_id with the given rectangle, or moves it there."""
+        rect = (x1, y1, x2, y2)
+        old_rect = self._rects.get(item_id)
+        if old_rect == rect: return
+        if old_rect is not None: self._unlink(item_id, old_rect)
+        self._rects[item_id] = rect
+        for cell in self._cell_range(*rect):
+            self._cells.setdefault(cell, set()).add(item_id)
+        if self._bounds is not None and not self._bounds_stale:
+            min_x, min_y, max_x, max_y = self._bounds
+            self._bounds = (min(min_x, x1), min(min_y, y1), max(max_x, x2), max(max_y, y2))
+
+    def remove(self, item_id):
+        old_rect = self._rects.pop(item_id, None)
+        if old_rect is not None: self._unlink(item_id, old_rect)
+
+    def _unlink(self, item_id, old_rect):
+        for cell in self._cell_range(*old_rect):
+            cell_items = self._cells.get(cell)
+            if cell_items is None: continue
+            cell_items.discard(item_id)
+            if not cell_items: del self._cells[cell]
+        if self._bounds is not None and (old_rect[0] <= self._bounds[0] or old_rect[1] <= self._bounds[1] or
+                                         old_rect[2] >= self._bounds[2] or old_rect[3] >= self._bounds[3]):
+            self._bounds_stale = True # The item was on the edge, so the bounds may shrink
+
+    def clear(self):
+        self._rects.clear()
+        self._cells.clear()
+        self._bounds, self._bounds_stale = None, False
+
+    def rect(self, item_id):
+        return self._rects.get(item_id)
+
+    def query(self, x1, y1, x2, y2, exclude=None):
+        """Returns the IDs of the items whose rectangles overlap (x1, y1, x2, y2); touching edges do not count."""
+        candidates = set()
+        for cell in self._cell_range(x1, y1, x2, y2):
+            cell_items = self._cells.get(cell)
+            if cell_items: candidates.update(cell_items)
+        candidates.discard(exclude)
+        found = []
+        for item_id in candidates:
+            other_x1, other_y1, other_x2, other_y2 = self._rects[item_id]
+            if not (x2 <= other_x1 or x1 >= other_x2 or y2 <= other_y1 or y1 >= other_y2):
+                found.append(item_id)
+        return found
+
+    def query_point(self, x, y):
+        """Returns the IDs of the items whose rectangles contain the point (x, y)."""
+        cell_items = self._cells.get((int(x // self.cell_size), int(y // self.cell_size)), ())
+        found = []
+        for item_id in cell_items:
+            x1, y1, x2, y2 = self._rects[item_id]
+            if x1 <= x <= x2 and y1 <= y <= y2: found.append(item_id)
+        return found
+
+    def bounds(self):
+        """Returns (min_x, min_y, max_x, max_y) over all items, or None if the index is empty."""
+        if not self._rects: return None
+        if self._bounds is None or self._bounds_stale:
+            rects = self._rects.values()
+            self._bounds = (min(r[0] for r in rects), min(r[1] for r in rects), max(r[2] for r in rects), max(r[3] for r in rects))
+            self._bounds_stale = False
+        return self._bounds
@@ -2,8 +2,9 @@ import unittest
 import sys
 import os
 import tkinter as tk
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 import datetime
+import json
 
 # Ensure the application's root directory is in the Python path
 # to allow for direct imports of your modules.
@@ -11,7 +12,20 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from data_encryption import encrypt_data, decrypt_data, f
 from other import PasswordManager
-from seatingchartmain import name_similarity_ratio, SeatingChartApp, levenshtein_distance
+from seatingchartmain import name_similarity_ratio, SeatingChartApp, levenshtein_distance, LOD_LOW, LOD_MEDIUM, LOD_FULL
+from log_journal import LogJournal
+from save_manager import SaveManager
+from log_store import LogStore, SQLiteLogStore, LogDatabase, migrate_json_data_file, log_time, epoch_ordinal, benchmark_attendance
+from canvas_renderer import RetainedCanvasRenderer, FontCache
+from spatial_index import SpatialIndex
+from conditional_formatting import ConditionalFormattingEngine
+from export_jobs import ExportJobRunner, JobCancelled
+from commands import Command, CompositeCommand, ChangeItemStyleCommand, LogEntryCommand, MoveItemsCommand, ManageStudentGroupCommand, REDRAW_ALL, REDRAW_STAT_BOXES
+import tempfile
+import threading
+import time
+import types
+import zipfile
 
 
 class TestDataEncryption(unittest.TestCase):
@@ -119,6 +133,811 @@ class TestUtilityFunctions(unittest.TestCase):
         self.assertEqual(name_similarity_ratio("test", ""), 0.0)
 
 
+class TestLogJournal(unittest.TestCase):
+    """Tests for the append-only log journal."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.journal_path = os.path.join(self.temp_dir.name, "test.journal")
+        self.journal = LogJournal(self.journal_path)
+        self.command_dict = {"type": "LogEntryCommand", "timestamp": "2023-10-26T10:00:00",
+                             "data": {"log_entry": {"student_id": "student_1", "behavior": "Talking"}, "student_id": "student_1"}}
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_append_and_read_records(self):
+        self.journal.append("execute", self.command_dict)
+        self.journal.append("undo", self.command_dict, encrypt=False)
+        records = LogJournal(self.journal_path).read_records()
+        self.assertEqual([r["action"] for r in records], ["execute", "undo"])
+        self.assertEqual(records[0]["command"], self.command_dict)
+        self.assertEqual(self.journal.record_count, 2)
+
+    def test_truncated_record_stops_replay(self):
+        self.journal.append("execute", self.command_dict)
+        with open(self.journal_path, 'ab') as f:
+            f.write(b'{"action": "exec')
+        self.assertEqual(len(self.journal.read_records()), 1)
+
+    def test_rotate_and_discard_segments(self):
+        self.journal.append("execute", self.command_dict)
+        sealed_segments = self.journal.rotate()
+        self.assertEqual(len(sealed_segments), 1)
+        self.assertFalse(self.journal.has_records())
+        self.journal.append("undo", self.command_dict)
+        self.assertEqual([r["action"] for r in self.journal.read_records()], ["execute", "undo"])
+        self.journal.discard_segments(sealed_segments)
+        self.assertEqual([r["action"] for r in self.journal.read_records()], ["undo"])
+
+    def test_clear(self):
+        self.journal.append("execute", self.command_dict)
+        self.journal.rotate()
+        self.journal.clear()
+        self.assertFalse(os.path.exists(self.journal_path))
+        self.assertFalse(self.journal.has_records())
+        self.assertEqual(self.journal.read_records(), [])
+
+
+class TestSaveManager(unittest.TestCase):
+    """Tests for writing only dirty stores and background saving."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, "store.json")
+        self.save_manager = SaveManager()
+
+    def tearDown(self):
+        self.save_manager.stop_worker()
+        self.temp_dir.cleanup()
+
+    def test_only_dirty_stores_are_serialized(self):
+        data = {"students": {"student_1": {"first_name": "John"}}}
+        get_data = MagicMock(return_value=data)
+        self.save_manager.mark_dirty(self.file_path)
+        for _ in range(2):
+            self.save_manager.begin_pass("autosave")
+            self.save_manager.write_if_dirty(self.file_path, get_data)
+            self.save_manager.end_pass()
+        completed = self.save_manager.pop_completed()
+        self.assertEqual([report[0]["written"] for _, report, _ in completed], [True, False])
+        self.assertEqual(get_data.call_count, 1) # The clean pass didn't encode the store
+        self.assertTrue(completed[0][1][0]["bytes"] > 0)
+        self.assertIn("0/1 files written", self.save_manager.format_report(completed[1][1]))
+
+    def test_loaded_store_is_clean_until_encryption_changes(self):
+        self.save_manager.loaded(self.file_path, encrypt=True)
+        self.assertFalse(self.save_manager.is_store_dirty(self.file_path, encrypt=True))
+        self.assertTrue(self.save_manager.is_store_dirty(self.file_path, encrypt=False))
+        self.save_manager.write(self.file_path, ["Talking"], encrypt=False)
+        self.save_manager.pop_completed()
+        self.assertFalse(self.save_manager.is_store_dirty(self.file_path, encrypt=False))
+
+    def test_failed_write_stays_dirty(self):
+        missing_dir_path = os.path.join(self.temp_dir.name, "missing", "store.json")
+        self.save_manager.mark_dirty(missing_dir_path)
+        self.save_manager.write_if_dirty(missing_dir_path, lambda: ["Talking"])
+        (_, _, errors), = self.save_manager.pop_completed()
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(self.save_manager.is_store_dirty(missing_dir_path))
+
+    def test_background_pass_and_after_write(self):
+        self.save_manager.start_worker()
+        after_write_calls = []
+        for i in range(5): # Passes submitted while one is waiting are merged
+            self.save_manager.begin_pass("autosave")
+            self.save_manager.write(self.file_path, {"version": i})
+            self.save_manager.after_write(self.file_path, lambda: after_write_calls.append(True))
+            self.save_manager.end_pass()
+        self.assertTrue(self.save_manager.flush())
+        completed = self.save_manager.pop_completed()
+        self.assertTrue(all(not errors for _, _, errors in completed))
+        self.assertEqual(len(after_write_calls), 5)
+        with open(self.file_path, 'rb') as f:
+            self.assertEqual(json.loads(decrypt_data(f.read())), {"version": 4})
+        self.assertFalse(os.path.exists(self.file_path + ".tmp"))
+
+
+class TestLogStore(unittest.TestCase):
+    """Tests for the in-memory log store and its per-student index."""
+
+    def setUp(self):
+        self.app = types.SimpleNamespace(behavior_log=[], homework_log=[], settings={})
+        self.store = LogStore(self.app)
+
+    def _entry(self, student_id, hour, behavior="Talking"):
+        return {"student_id": student_id, "timestamp": f"2023-10-26T{hour:02d}:00:00", "type": "behavior", "behavior": behavior}
+
+    def test_index_follows_mutations(self):
+        for hour in (11, 9, 10): self.store.add("behavior", self._entry("student_1", hour))
+        self.store.add("behavior", self._entry("student_2", 10))
+        since = datetime.datetime(2023, 10, 26, 9, 30)
+        self.assertEqual([log["timestamp"][11:13] for log in self.store.logs_for_student("behavior", "student_1", since=since)], ["10", "11"])
+        self.store.remove("behavior", self._entry("student_1", 10))
+        self.assertEqual(len(self.store.logs_for_student("behavior", "student_1", since=since)), 1)
+        self.assertEqual(self.store.remove_student("student_2"), (1, 0))
+        self.assertEqual(self.store.logs_for_student("behavior", "student_2"), [])
+        self.store.restore("behavior", [self._entry("student_2", 12)])
+        self.assertEqual(len(self.store.logs_for_student("behavior", "student_2")), 1)
+
+    def test_journal_replay_keeps_the_index_in_step(self):
+        logged = [dict(self._entry("student_1", hour), log_id=f"log_{hour}") for hour in (9, 10)]
+        for entry in logged: self.store.add("behavior", entry)
+        self.assertEqual(len(self.store.logs_for_student("behavior", "student_1")), 2) # Index built before the replay
+        def record(action, entry):
+            return {"action": action, "command": {"type": "LogEntryCommand", "timestamp": entry["timestamp"],
+                                                  "data": {"log_entry": entry, "student_id": "student_1"}}}
+        replayed_entry = dict(self._entry("student_1", 11), log_id="log_11")
+        records = [record("execute", replayed_entry), record("undo", logged[0]), record("execute", logged[1])] # The last is already logged
+        self.app.log_store, self.app.undo_stack, self.app.redo_stack = self.store, [], []
+        self.app.log_journal = types.SimpleNamespace(read_records=lambda: records, journal_path="test.journal")
+        SeatingChartApp._replay_log_journal(self.app)
+        self.assertEqual([log["log_id"] for log in self.store.logs_for_student("behavior", "student_1")], ["log_10", "log_11"])
+        self.assertEqual([log["log_id"] for log in self.app.behavior_log], ["log_10", "log_11"])
+
+    def test_save_snapshot_is_a_copy_reused_until_the_logs_change(self):
+        self.app.log_store, self.app._log_snapshots = self.store, {}
+        self.store.add("behavior", dict(self._entry("student_1", 9), marks_data={"mark_correct": 1}))
+        snapshot = SeatingChartApp._log_snapshot(self.app, "behavior")
+        self.assertIsNot(snapshot[0], self.app.behavior_log[0])
+        self.assertIsNot(snapshot[0]["marks_data"], self.app.behavior_log[0]["marks_data"])
+        self.assertIs(SeatingChartApp._log_snapshot(self.app, "behavior"), snapshot)
+        self.store.add("behavior", self._entry("student_1", 10))
+        self.assertEqual(len(SeatingChartApp._log_snapshot(self.app, "behavior")), 2)
+        self.assertEqual(len(snapshot), 1) # A snapshot already handed to the save worker is left alone
+
+    def test_log_time_and_indexed_epochs(self):
+        parsed = log_time("2023-10-26T10:30:00")
+        self.assertEqual(epoch_ordinal(parsed.epoch), parsed.ordinal)
+        self.assertEqual(parsed.ordinal, datetime.date(2023, 10, 26).toordinal())
+        self.assertEqual(parsed.epoch - log_time("2023-10-26T10:00:00").epoch, 1800)
+        with self.assertRaises(ValueError): log_time("not a timestamp")
+
+    def test_query_and_presence_by_date(self):
+        for hour in (9, 10): self.store.add("behavior", self._entry("student_1", hour))
+        self.store.add("homework", {"student_id": "student_2", "timestamp": "2023-10-27T08:00:00", "type": "homework"})
+        day = datetime.date(2023, 10, 26)
+        self.assertEqual(len(self.store.query("behavior", ("behavior",), day, day)), 2)
+        self.assertEqual(self.store.query("homework", start_date=day, end_date=day), [])
+        self.assertEqual(self.store.presence_by_day(day, datetime.date(2023, 10, 27)),
+                         {day: {"student_1"}, datetime.date(2023, 10, 27): {"student_2"}})
+        self.assertEqual(self.store.earliest_log_date(), day)
+
+    def test_log_ids(self):
+        entry = self._entry("student_1", 9)
+        logged = self.store.add("behavior", entry)
+        self.assertNotIn("log_id", entry) # Only the logged copy gets the new log_id
+        self.assertIsNone(self.store.add("behavior", dict(logged, behavior="Edited"))) # Same log_id
+        for hour in (11, 10): self.store.add("behavior", self._entry("student_1", hour))
+        self.assertEqual([log["timestamp"][11:13] for log in self.app.behavior_log], ["09", "10", "11"])
+        removed = self.store.remove("behavior", dict(logged, behavior="Edited")) # Found by log_id
+        self.assertEqual(removed["behavior"], "Talking")
+        self.assertEqual(len(self.app.behavior_log), 2)
+        self.assertIsNotNone(self.store.add("behavior", self._entry("student_1", 10))) # Same event fields, but another log
+        self.assertEqual(len(self.app.behavior_log), 3)
+        legacy_entry = self._entry("student_1", 10) # Recorded before log IDs existed (old undo history)
+        self.assertIsNotNone(self.store.remove("behavior", legacy_entry))
+        self.assertEqual(len(self.app.behavior_log), 2)
+
+    def test_student_revision_changes_with_their_logs(self):
+        revision = self.store.student_revision("behavior", "student_1")
+        self.store.add("behavior", self._entry("student_2", 9))
+        self.assertEqual(self.store.student_revision("behavior", "student_1"), revision)
+        self.store.add("behavior", self._entry("student_1", 9))
+        self.assertNotEqual(self.store.student_revision("behavior", "student_1"), revision)
+        revision = self.store.student_revision("behavior", "student_1")
+        self.app.behavior_log = [] # Replaced, e.g. by load_data
+        self.assertNotEqual(self.store.student_revision("behavior", "student_1"), revision)
+
+    def test_window_times_follow_mutations(self):
+        for hour in (9, 10, 11): self.store.add("behavior", self._entry("student_1", hour))
+        self.store.add("behavior", dict(self._entry("student_1", 12), type="quiz"))
+        self.store.add("behavior", self._entry("student_1", 12, "Shouting"))
+        since = log_time("2023-10-26T10:00:00").epoch
+        self.assertEqual(len(self.store.window_times("behavior", "student_1", "Talking", since, ("behavior", "quiz"))), 3)
+        self.store.remove("behavior", self._entry("student_1", 11))
+        window = self.store.window_times("behavior", "student_1", "Talking", since, ("behavior",))
+        self.assertEqual(window, [since])
+        self.store.remove_student("student_1")
+        self.assertEqual(self.store.window_times("behavior", "student_1", "Talking", 0, ("behavior", "quiz")), [])
+
+    def test_day_totals_follow_mutations(self):
+        self.app._calculate_quiz_score_percentage = lambda entry: entry["score_details"]["correct"] * 10.0
+        day = datetime.date(2023, 10, 26)
+        self.store.add("behavior", self._entry("student_1", 9))
+        totals = self.store.day_totals(day)
+        self.assertEqual((totals.present_student_ids, totals.behavior_total), ({"student_1"}, 1))
+        quiz = dict(self._entry("student_2", 10, "Quiz 1"), type="quiz", score_details={"correct": 8, "total_asked": 10})
+        self.store.add("behavior", quiz)
+        self.store.add("homework", {"student_id": "student_3", "timestamp": "2023-10-26T11:00:00", "type": "homework", "homework_status": "Done"})
+        self.store.add("behavior", self._entry("student_1", 9, "Shouting"))
+        self.assertIs(self.store.day_totals(day), totals) # Updated in place, not rebuilt
+        self.assertEqual(totals.present_student_ids, {"student_1", "student_2", "student_3"})
+        self.assertEqual((totals.quiz_score_sum, totals.quiz_score_count), (80.0, 1))
+        self.assertEqual((totals.homework_completed, totals.homework_total), (1, 1))
+        self.store.remove("behavior", quiz) # Undo
+        self.store.remove("behavior", self._entry("student_1", 9))
+        self.assertEqual((totals.quiz_score_count, dict(totals.behavior_counts)), (0, {"Shouting": 1}))
+        self.assertEqual(self.store.remove_student("student_3"), (0, 1))
+        self.assertEqual((totals.present_student_ids, totals.homework_total), ({"student_1"}, 0))
+        next_day = self.store.day_totals(day + datetime.timedelta(days=1)) # Rolled over
+        self.assertEqual(next_day.present_student_ids, set())
+
+    def test_attendance_report_from_one_presence_map(self):
+        for hour in (9, 10, 11): self.store.add("behavior", self._entry("student_1", hour)) # Several logs on one day
+        self.store.add("homework", {"student_id": "student_2", "timestamp": "2023-10-28T08:00:00", "type": "homework"})
+        self.store.add("behavior", self._entry("student_3", 9)) # Not in the report
+        self.app.log_store = self.store
+        self.app.students = {"student_1": {"full_name": "A B", "last_name": "B"}, "student_2": {"full_name": "C D", "last_name": "D"}}
+        start, end = datetime.date(2023, 10, 26), datetime.date(2023, 11, 30) # Across months
+        attendance = SeatingChartApp.generate_attendance_data(self.app, start, end, ["student_1", "student_2"])
+        self.assertEqual(len(attendance), 36)
+        self.assertEqual(attendance[start], {"student_1": "P", "student_2": "A"})
+        self.assertEqual(attendance[datetime.date(2023, 10, 28)], {"student_1": "A", "student_2": "P"})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "attendance.xlsx")
+            SeatingChartApp.export_attendance_to_excel(self.app, file_path, attendance, start, end)
+            from openpyxl import load_workbook
+            rows = list(load_workbook(file_path).active.iter_rows(values_only=True))
+        self.assertEqual(rows[1][0], "A B")
+        self.assertEqual(rows[1][-2:], (1, 35)) # Total present, total absent
+        results = benchmark_attendance(students=3, days=10, logs_per_day=4, sample_days=2) # Checks both approaches agree
+        self.assertEqual(results["logs"], 40)
+
+    def test_index_rebuilt_when_lists_change_directly(self):
+        self.store.add("behavior", self._entry("student_1", 9))
+        self.app.behavior_log.append(self._entry("student_1", 10)) # e.g. journal replay
+        self.assertEqual(len(self.store.logs_for_student("behavior", "student_1")), 2)
+        self.app.behavior_log = [self._entry("student_3", 8)] # e.g. load_data
+        self.assertEqual(self.store.logs_for_student("behavior", "student_1"), [])
+        after = datetime.datetime(2023, 10, 26, 8)
+        self.assertEqual(self.store.logs_for_student("behavior", "student_3", after=after), [])
+
+
+class TestSQLiteLogStore(unittest.TestCase):
+    """Tests for the SQLite log store and the JSON to SQLite log migration."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.temp_dir.name, "logs.sqlite3")
+        self.app = types.SimpleNamespace(behavior_log=[], homework_log=[], settings={"encrypt_data_files": True})
+        self.store = SQLiteLogStore(self.app, self.database_path)
+        self.entries = [
+            {"student_id": "student_1", "timestamp": "2023-10-26T09:00:00", "type": "behavior", "behavior": "Talking", "log_id": "log_1"},
+            {"student_id": "student_1", "timestamp": "2023-10-26T10:00:00", "type": "quiz", "behavior": "Math Quiz", "log_id": "log_2"},
+            {"student_id": "student_2", "timestamp": "2023-10-27T10:00:00", "type": "behavior", "behavior": "Helping", "log_id": "log_3"},
+        ]
+
+    def tearDown(self):
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def test_add_remove_and_queries_match_list_store(self):
+        for entry in self.entries: self.store.add("behavior", entry)
+        self.assertFalse(self.store.add("behavior", self.entries[0])) # Already logged
+        list_store = LogStore(self.app)
+        since = datetime.datetime(2023, 10, 26, 9, 30)
+        self.assertEqual(self.store.logs_for_student("behavior", "student_1", ("behavior", "quiz"), since=since),
+                         list_store.logs_for_student("behavior", "student_1", ("behavior", "quiz"), since=since))
+        day = datetime.date(2023, 10, 26)
+        self.assertEqual(self.store.query("behavior", ("behavior",), day, day), [self.entries[0]])
+        self.assertEqual(self.store.presence_by_day(day, datetime.date(2023, 10, 27)),
+                         list_store.presence_by_day(day, datetime.date(2023, 10, 27)))
+        self.assertEqual(self.store.remove("behavior", self.entries[1]), self.entries[1])
+        self.assertEqual(self.store.remove_student("student_2"), (1, 0))
+        self.store.close() # Rows are committed as they are written
+        self.assertEqual(LogDatabase(self.database_path).load_all(), ([self.entries[0]], []))
+
+    def test_backup_includes_changes_still_in_the_wal_file(self):
+        for entry in self.entries: self.store.add("behavior", entry) # Connection left open, nothing checkpointed
+        backup_path = os.path.join(self.temp_dir.name, "backup.sqlite3")
+        with open(backup_path, 'wb') as f: f.write(self.store.db.backup_bytes())
+        backup_database = LogDatabase(backup_path)
+        self.assertEqual(backup_database.load_all(), (self.entries, []))
+        backup_database.close()
+
+    def test_rows_without_log_ids_get_them_in_place(self):
+        legacy_entry = {key: value for key, value in self.entries[0].items() if key != "log_id"}
+        self.store.db.replace_all([legacy_entry], [])
+        self.assertEqual(self.store.db.assign_missing_log_ids(), 1)
+        self.assertEqual(self.store.db.assign_missing_log_ids(), 0)
+        (stored_entry,), _ = self.store.db.load_all()
+        self.assertTrue(stored_entry["log_id"].startswith("log_"))
+        self.app.behavior_log = [stored_entry]
+        self.assertIsNotNone(self.store.remove("behavior", stored_entry)) # Deleted from the database by its log_id
+        self.assertEqual(self.store.db.load_all(), ([], []))
+
+    def test_migrate_json_data_file(self):
+        data_file_path = os.path.join(self.temp_dir.name, "classroom_data_v10.json")
+        homework_entry = {"student_id": "student_2", "timestamp": "2023-10-26T11:00:00", "type": "homework", "homework_type": "Reading"}
+        with open(data_file_path, 'wb') as f:
+            f.write(encrypt_data(json.dumps({"behavior_log": self.entries, "homework_log": [homework_entry]})))
+        self.assertEqual(migrate_json_data_file(data_file_path, self.database_path), 4)
+        behavior_log, homework_log = LogDatabase(self.database_path).load_all()
+        self.assertEqual(behavior_log, self.entries)
+        self.assertEqual(homework_log, [homework_entry])
+
+
+class TestRetainedCanvasRenderer(unittest.TestCase):
+    """Tests that the renderer reuses canvas items and only creates or deletes them when the structure changes."""
+
+    def setUp(self):
+        self.canvas = MagicMock()
+        item_ids = iter(range(1, 1000))
+        self.canvas.create_rectangle.side_effect = lambda *args, **kwargs: next(item_ids)
+        self.canvas.create_text.side_effect = lambda *args, **kwargs: next(item_ids)
+        self.renderer = RetainedCanvasRenderer(self.canvas)
+
+    def draw_student(self, x, lines, selected=False):
+        self.renderer.begin("student_1")
+        self.renderer.item("rectangle", "rect", (x, 0, x + 100, 50), fill="white", tags=("student_item", "student_1", "rect"))
+        for line_num, line in enumerate(lines):
+            self.renderer.item("text", ("line", line_num), (x + 50, 10 + line_num * 10), text=line)
+        if selected: self.renderer.item("rectangle", "selection_highlight", (x - 2, -2, x + 102, 52), outline="red")
+        self.renderer.end()
+
+    def test_redraw_updates_items_in_place(self):
+        self.draw_student(0, ["Alice", "Talking"])
+        self.assertEqual(self.renderer.item_count(), 3)
+        self.draw_student(0, ["Alice", "Talking"]) # Nothing changed: no Tk calls at all
+        self.canvas.coords.assert_not_called()
+        self.canvas.itemconfigure.assert_not_called()
+        self.draw_student(20, ["Alice", "Helping"])
+        self.assertEqual(self.canvas.create_rectangle.call_count + self.canvas.create_text.call_count, 3)
+        self.canvas.delete.assert_not_called()
+        self.canvas.itemconfigure.assert_called_once_with(3, text="Helping")
+        self.assertEqual(self.canvas.coords.call_count, 3)
+
+    def test_structure_changes_create_and_delete_items(self):
+        self.draw_student(0, ["Alice", "Talking"])
+        self.draw_student(0, ["Alice"], selected=True)
+        self.canvas.delete.assert_called_once_with(3) # The dropped incident line
+        self.assertEqual(self.canvas.create_rectangle.call_count, 2)
+        self.canvas.tag_raise.assert_called() # New item restacked above the student's other items
+        self.renderer.prune(set())
+        self.assertEqual(self.renderer.item_count(), 0)
+
+    def test_recreate_mode_deletes_and_recreates(self):
+        self.renderer.retained = False
+        self.draw_student(0, ["Alice"])
+        self.draw_student(0, ["Alice"])
+        self.assertEqual(self.canvas.create_rectangle.call_count, 2)
+        self.assertEqual(self.canvas.delete.call_count, 2)
+
+
+class TestFontCache(unittest.TestCase):
+    """Tests that fonts are reused and measurements are memoized."""
+
+    @patch("canvas_renderer.tkfont.Font")
+    def test_fonts_and_metrics_are_cached(self, font_class):
+        font_names = iter(range(1000))
+        def make_font(**kwargs):
+            font_obj = MagicMock(); font_obj.name = f"font{next(font_names)}"
+            font_obj.measure.return_value = 42; font_obj.metrics.return_value = 12
+            return font_obj
+        font_class.side_effect = make_font
+        cache = FontCache(max_fonts=2)
+        name_font = cache.font("Arial", 10, "bold")
+        self.assertIs(cache.font("Arial", 10, "bold"), name_font)
+        for _ in range(3):
+            self.assertEqual(cache.measure(name_font, "Alice"), 42)
+            self.assertEqual(cache.linespace(name_font), 12)
+        name_font.measure.assert_called_once_with("Alice")
+        name_font.metrics.assert_called_once_with('linespace')
+        cache.font("Arial", 9); cache.font("Arial", 8) # Evicts the least recently used font
+        self.assertIsNot(cache.font("Arial", 10, "bold"), name_font)
+        self.assertEqual(font_class.call_count, 4)
+
+
+class TestSpatialIndex(unittest.TestCase):
+    def test_queries_and_bounds_follow_updates(self):
+        index = SpatialIndex(cell_size=100)
+        index.update("student_1", 0, 0, 120, 80)
+        index.update("student_2", 500, 500, 620, 580)
+        index.update("furniture_1", 110, 50, 300, 150)
+        self.assertEqual(sorted(index.query(0, 0, 120, 80, exclude="student_1")), ["furniture_1"])
+        self.assertEqual(index.query(120, 0, 200, 40), []) # Touching edges do not overlap
+        self.assertEqual(index.query_point(550, 550), ["student_2"])
+        self.assertEqual(index.bounds(), (0, 0, 620, 580))
+        index.update("student_2", 200, 200, 320, 280) # Moved inward, so the bounds shrink
+        self.assertEqual(index.query_point(550, 550), [])
+        self.assertEqual(index.bounds(), (0, 0, 320, 280))
+        index.remove("student_1")
+        self.assertEqual(index.bounds(), (110, 50, 320, 280))
+        self.assertEqual(len(index), 2)
+
+    def _collision_app(self, students, furniture=None):
+        app = types.SimpleNamespace(students=students, furniture=furniture or {}, stat_boxes={}, spatial_index=SpatialIndex(),
+                                    layout_generation=0, _spatial_index_generation=None,
+                                    execute_command=MagicMock(), update_status=MagicMock())
+        for name in ("update_spatial_index", "rebuild_spatial_index", "invalidate_spatial_index", "_ensure_spatial_index",
+                     "_item_type", "find_item_at", "resolve_layout_collisions"):
+            setattr(app, name, getattr(SeatingChartApp, name).__get__(app))
+        return app
+
+    def test_index_is_rebuilt_when_items_are_replaced(self):
+        app = self._collision_app({"student_1": {"x": 0, "y": 0, "width": 100, "height": 60}})
+        app._ensure_spatial_index()
+        app.students = {"student_2": {"x": 500, "y": 500, "width": 100, "height": 60}} # Same count, as after loading a file
+        app.invalidate_spatial_index()
+        app._ensure_spatial_index()
+        self.assertEqual(app.spatial_index.query_point(550, 550), ["student_2"])
+        self.assertNotIn("student_1", app.spatial_index)
+
+    def test_find_item_at_picks_the_box_stacked_on_top(self):
+        app = self._collision_app({"student_1": {"x": 0, "y": 0, "width": 100, "height": 60}},
+                                  {"furniture_1": {"x": 50, "y": 20, "width": 100, "height": 60}})
+        app.canvas_to_world_coords_guides = lambda x, y: (x, y)
+        canvas_tags = {1: ("furniture_item", "furniture_1", "rect"), 2: ("student_item", "student_1", "rect"), 3: ("guide", "guide_1")}
+        app.canvas = types.SimpleNamespace(canvasx=lambda x: x, canvasy=lambda y: y, gettags=canvas_tags.get,
+                                           find_overlapping=lambda *coords: (1, 2, 3)) # Bottom to top
+        self.assertEqual(app.find_item_at(60, 30), ("student_1", "student"))
+        self.assertEqual(app.find_item_at(60, 30, ("furniture",)), ("furniture_1", "furniture"))
+        self.assertEqual(app.find_item_at(10, 10), ("student_1", "student"))
+        self.assertEqual(app.find_item_at(400, 400), (None, None))
+
+    def test_collisions_only_look_at_overlapping_items(self):
+        app = self._collision_app({"student_1": {"x": 0, "y": 0, "width": 100, "height": 60, "full_name": "A"},
+                                   "student_2": {"x": 50, "y": 40, "width": 100, "height": 60},
+                                   "student_3": {"x": 1000, "y": 1000, "width": 100, "height": 60}})
+        SeatingChartApp.handle_layout_collision(app, "student_1")
+        move_command = app.execute_command.call_args[0][0]
+        self.assertEqual(move_command.items_moves, [{"id": "student_2", "type": "student", "old_x": 50, "old_y": 40, "new_x": 50, "new_y": 65}])
+
+    def test_cascading_collisions_settle_in_one_command(self):
+        app = self._collision_app({"student_1": {"x": 0, "y": 0, "width": 100, "height": 60, "full_name": "A"},
+                                   "student_2": {"x": 0, "y": 50, "width": 100, "height": 60},
+                                   "student_3": {"x": 0, "y": 100, "width": 100, "height": 60}})
+        self.assertEqual(SeatingChartApp.resolve_layout_collisions(app, ["student_1"]), 2)
+        app.execute_command.assert_called_once()
+        new_positions = {move["id"]: move["new_y"] for move in app.execute_command.call_args[0][0].items_moves}
+        self.assertEqual(new_positions, {"student_2": 65, "student_3": 130}) # student_2 pushed student_3 on
+        self.assertEqual(SeatingChartApp.resolve_layout_collisions(app, ["student_1"], max_iterations=0), 0)
+
+
+class TestConditionalFormatting(unittest.TestCase):
+    """Tests for the compiled conditional formatting rules and the per-student result cache."""
+
+    def setUp(self):
+        self.app = types.SimpleNamespace(
+            behavior_log=[], homework_log=[], students={"student_1": {"group_id": "group_1"}, "student_2": {}},
+            student_groups={"group_1": {"color": "#00FF00"}}, live_quiz_scores={}, live_homework_scores={},
+            is_live_quiz_active=False, is_live_homework_active=False, mode_var=MagicMock(), _recent_incidents_hidden_globally=False,
+            root=MagicMock(), request_redraw=MagicMock(),
+            settings={"conditional_formatting_rules": [
+                {"type": "group", "group_id": "group_1", "color": "#111111", "outline": ""},
+                {"type": "behavior_count", "behavior_name": "Talking", "count_threshold": 2, "time_window_hours": 1, "color": "#FF0000"},
+                {"type": "behavior_count", "behavior_name": "Talking", "count_threshold": 1, "time_window_hours": 1,
+                 "color": "#0000FF", "enabled": False}]})
+        self.app.mode_var.get.return_value = "behavior"
+        self.app.log_store = LogStore(self.app)
+        self.engine = ConditionalFormattingEngine(self.app)
+
+    def _log(self, student_id, minutes_ago):
+        timestamp = (datetime.datetime.now() - datetime.timedelta(minutes=minutes_ago)).isoformat()
+        self.app.log_store.add("behavior", {"student_id": student_id, "timestamp": timestamp, "type": "behavior", "behavior": "Talking"})
+
+    def test_group_colors_and_stripes(self):
+        self._log("student_2", 5); self._log("student_2", 50)
+        self.engine.begin_pass()
+        self.assertEqual(self.engine.formatting_for("student_1"), ("#111111", None, []))
+        self.assertEqual(self.engine.formatting_for("student_2").stripes, [{"fill": "#FF0000", "outline": None}])
+        self.app.settings["conditional_formatting_rules"][2]["enabled"] = True # Edited in place, picked up on the next pass
+        self.engine.begin_pass()
+        self.assertEqual(len(self.engine.formatting_for("student_2").stripes), 2)
+
+    def test_results_cached_until_inputs_change(self):
+        self.engine.begin_pass()
+        with patch.object(self.app.log_store, "window_times", wraps=self.app.log_store.window_times) as window_times:
+            self.assertEqual(self.engine.formatting_for("student_2").stripes, [])
+            self.engine.begin_pass()
+            self.assertEqual(self.engine.formatting_for("student_2").stripes, [])
+            self.assertEqual(window_times.call_count, 1) # The disabled rule is never evaluated; the other only once
+            self._log("student_2", 1); self._log("student_2", 2)
+            self.assertEqual(len(self.engine.formatting_for("student_2").stripes), 1)
+            self.assertEqual(window_times.call_count, 2)
+
+    def test_windowed_count_expires_on_a_timer(self):
+        self._log("student_2", 59); self._log("student_2", 1)
+        self.engine.begin_pass()
+        self.assertEqual(len(self.engine.formatting_for("student_2").stripes), 1)
+        expires_at = self.engine._results["student_2"][1]
+        self.assertAlmostEqual(expires_at - log_time(self.app.behavior_log[0]["timestamp"]).epoch, 3600)
+        self.app.root.after.assert_called_once()
+        self.assertLess(abs(self.app.root.after.call_args[0][0] - 60_000), 2_000) # When the 59-minute-old log leaves the hour
+        self.engine.formatting_for("student_2") # Cached; the timer stays
+        self.app.root.after.assert_called_once()
+        self.app.root.after.call_args[0][1]() # The timer fires
+        self.app.request_redraw.assert_called_once_with({"student_2"}) # Only that box is repainted
+
+
+    def test_time_boundaries_repaint_only_affected_students(self):
+        self._log("student_2", 1); self._log("student_2", 2)
+        rules = self.app.settings["conditional_formatting_rules"]
+        rules[1]["active_times"] = [{"days_of_week": [0], "start_time": "09:00", "end_time": "10:00"}] # Mondays
+        self.engine.begin_pass()
+        monday = datetime.datetime(2023, 10, 23, 9, 30)
+        self.assertEqual(self.engine.next_time_boundary(monday), datetime.datetime(2023, 10, 23, 10, 0))
+        self.assertEqual(self.engine.next_time_boundary(monday.replace(hour=11)), datetime.datetime(2023, 10, 30, 9, 0))
+        self.engine.refresh_active_times(monday.replace(hour=8))
+        self.assertEqual(self.engine.refresh_active_times(monday), {"student_2"}) # student_1 is not matched by the rule
+        self.assertEqual(self.engine.refresh_active_times(monday.replace(minute=45)), set()) # Nothing flipped
+        self.app.root.after.reset_mock()
+        self.engine._on_time_boundary()
+        self.app.root.after.assert_called_once() # Re-armed for the next boundary
+
+
+class TestRedrawScopes(unittest.TestCase):
+    """Tests that commands declare the items they change and only those are repainted."""
+
+    def setUp(self):
+        self.app = types.SimpleNamespace(
+            canvas=MagicMock(), renderer=MagicMock(), students={"student_1": {}, "student_2": {}}, furniture={"furniture_1": {}},
+            stat_boxes={"stat_box_1": {}}, guides={}, draw_single_student=MagicMock(), draw_single_furniture=MagicMock(),
+            draw_single_stat_box=MagicMock(), draw_guides=MagicMock(), draw_all_items=MagicMock(), update_scroll_region=MagicMock(),
+            visible_world_bounds=MagicMock(return_value=None), _cull_if_off_screen=MagicMock(return_value=False), _culled_items=set(),
+            settings={}, resolve_layout_collisions=MagicMock(), conditional_formatting=MagicMock())
+
+    def test_command_scopes(self):
+        log_entry = {"student_id": "student_1", "timestamp": "2023-10-26T09:00:00", "type": "behavior", "behavior": "Talking"}
+        self.assertEqual(LogEntryCommand(self.app, log_entry, "student_1").redraw_scope(), {"student_1", REDRAW_STAT_BOXES})
+        move = {"id": "furniture_1", "type": "furniture", "old_x": 0, "old_y": 0, "new_x": 10, "new_y": 10}
+        self.assertEqual(MoveItemsCommand(self.app, [move]).redraw_scope(), {"furniture_1"})
+        self.assertEqual(ManageStudentGroupCommand.redraw_scope(None), {REDRAW_ALL})
+        self.assertEqual(ChangeItemStyleCommand(self.app, "stat_box_1", "stat_box", "fill_color", None, "#ffffff").redraw_scope(), {"stat_box_1"})
+
+    def test_style_changes_request_a_redraw_instead_of_painting(self):
+        self.app.request_redraw, self.app.update_status = MagicMock(), MagicMock()
+        self.app.stat_boxes["stat_box_1"] = {"name": "Counts"}
+        command = CompositeCommand(self.app, [ChangeItemStyleCommand(self.app, "stat_box_1", "stat_box", style_property, None, value)
+                                              for style_property, value in (("fill_color", "#ffffff"), ("font_size", 14))])
+        command.execute(); command.undo()
+        self.app.draw_single_stat_box.assert_not_called()
+        self.app.request_redraw.assert_called_with({"stat_box_1"}, check_collisions=True)
+        self.assertNotIn("style_overrides", self.app.stat_boxes["stat_box_1"])
+
+    def test_redraw_items_repaints_only_the_scope(self):
+        SeatingChartApp.redraw_items(self.app, {"student_1", REDRAW_STAT_BOXES, "student_9"}, check_collisions=True)
+        self.app.draw_single_student.assert_called_once_with("student_1")
+        self.app.resolve_layout_collisions.assert_called_once_with(["student_1"]) # One collision pass for the whole scope
+        self.app.draw_single_stat_box.assert_called_once_with("stat_box_1")
+        self.app.draw_single_furniture.assert_not_called()
+        self.app.renderer.remove.assert_called_once_with("student_9") # Deleted student
+        self.app.draw_all_items.assert_not_called()
+        SeatingChartApp.redraw_items(self.app, {REDRAW_ALL})
+        self.app.draw_all_items.assert_called_once()
+
+    def test_requests_coalesce_into_one_paint(self):
+        app = types.SimpleNamespace(root=MagicMock(), redraw_items=MagicMock(), _pending_redraw_scope=set(),
+                                    _pending_redraw_collisions=False, _redraw_after_id=None)
+        app.flush_redraw = lambda: SeatingChartApp.flush_redraw(app)
+        SeatingChartApp.request_redraw(app, {"student_1", REDRAW_STAT_BOXES})
+        SeatingChartApp.request_redraw(app, {"student_2"}, check_collisions=True)
+        app.root.after_idle.assert_called_once()
+        app.root.after_idle.call_args[0][0]() # The idle callback
+        app.redraw_items.assert_called_once_with({"student_1", "student_2", REDRAW_STAT_BOXES}, check_collisions=True)
+        SeatingChartApp.request_redraw(app, {"student_1"}); SeatingChartApp.request_redraw(app)
+        app.flush_redraw()
+        app.redraw_items.assert_called_with({REDRAW_ALL}, check_collisions=False)
+
+
+    def test_off_screen_items_are_culled_and_materialized_on_scroll(self):
+        app = types.SimpleNamespace(renderer=MagicMock(), selected_items=set(), _culled_items=set(), request_redraw=MagicMock(),
+                                    students={"student_1": {"x": 0, "y": 0, "width": 100, "height": 50},
+                                              "student_2": {"x": 5000, "y": 5000, "width": 100, "height": 50}},
+                                    furniture={}, stat_boxes={}, _item_in_bounds=SeatingChartApp._item_in_bounds)
+        bounds = (-100, -100, 800, 600)
+        self.assertFalse(SeatingChartApp._cull_if_off_screen(app, "student_1", app.students["student_1"], bounds))
+        self.assertTrue(SeatingChartApp._cull_if_off_screen(app, "student_2", app.students["student_2"], bounds))
+        app.renderer.remove.assert_called_once_with("student_2")
+        app.visible_world_bounds = lambda: bounds
+        SeatingChartApp.materialize_visible_items(app) # Still off screen
+        app.request_redraw.assert_not_called()
+        app.visible_world_bounds = lambda: (4800, 4800, 5700, 5500) # Scrolled to it
+        SeatingChartApp.materialize_visible_items(app)
+        app.request_redraw.assert_called_once_with({"student_2"})
+
+    def test_level_of_detail_follows_zoom_thresholds(self):
+        app = types.SimpleNamespace(current_zoom_level=1.0, settings={"lod_low_zoom_threshold": 0.5, "lod_medium_zoom_threshold": 0.75},
+                                    _lod_cache_key=None, _lod_level=LOD_FULL)
+        self.assertEqual(SeatingChartApp.current_lod_level(app), LOD_FULL)
+        app.current_zoom_level = 0.6
+        self.assertEqual(SeatingChartApp.current_lod_level(app), LOD_MEDIUM)
+        app.current_zoom_level = 0.3
+        self.assertEqual(SeatingChartApp.current_lod_level(app), LOD_LOW)
+        app.settings["lod_low_zoom_threshold"] = 0.2 # Thresholds are configurable
+        self.assertEqual(SeatingChartApp.current_lod_level(app), LOD_MEDIUM)
+
+    def test_wheel_zoom_scales_around_cursor_and_defers_rerender(self):
+        canvas = MagicMock(); canvas.canvasx.side_effect = lambda x: x; canvas.canvasy.side_effect = lambda y: y
+        canvas.cget.return_value = "0 0 4000 3000"
+        app = types.SimpleNamespace(canvas=canvas, root=MagicMock(), renderer=MagicMock(), password_manager=MagicMock(is_locked=False),
+                                    current_zoom_level=1.0, pan_x=0.0, pan_y=0.0, _zoom_render_after_id=None, update_scroll_region=MagicMock(),
+                                    update_status=MagicMock(), update_zoom_display=MagicMock(), zoom_var=MagicMock(), zoom_display_label=MagicMock(),
+                                    font_cache=MagicMock(), request_redraw=MagicMock())
+        app.finish_zoom = lambda: SeatingChartApp.finish_zoom(app)
+        SeatingChartApp.zoom_canvas(app, 2.0, anchor=(300, 200))
+        canvas.scale.assert_any_call("student_item", 0.0, 0.0, 2.0, 2.0)
+        # The world point (300, 200) is now drawn at (600, 400); the view scrolls so it stays under the cursor
+        canvas.xview_moveto.assert_called_once_with((600 - 300) / 4000)
+        canvas.yview_moveto.assert_called_once_with((400 - 200) / 3000)
+        SeatingChartApp.zoom_canvas(app, 1.1, anchor=(300, 200))
+        app.request_redraw.assert_not_called() # Only the scaled items until the wheel pauses
+        self.assertEqual(app.root.after.call_count, 2); app.root.after_cancel.assert_called_once()
+        app.root.after.call_args[0][1]() # The debounced re-render
+        app.request_redraw.assert_called_once_with()
+
+
+class TestCompositeCommand(unittest.TestCase):
+    """Tests that a bulk operation is one history entry with one save."""
+
+    def setUp(self):
+        self.app = types.SimpleNamespace(log_store=MagicMock(is_persistent=False), students={"student_1": {}, "student_2": {}},
+                                         update_student_display_text=MagicMock(), request_redraw=MagicMock(), update_status=MagicMock())
+        self.entries = [{"student_id": f"student_{i}", "timestamp": f"2023-10-26T09:00:0{i}", "type": "behavior", "behavior": "Talking",
+                         "log_id": f"log_{i}"} for i in (1, 2)]
+        self.composite = CompositeCommand(self.app, [LogEntryCommand(self.app, entry, entry["student_id"]) for entry in self.entries], "Logged Talking")
+
+    def test_executes_in_order_and_undoes_in_reverse(self):
+        self.composite.execute()
+        self.assertEqual([c.args[1] for c in self.app.log_store.add.call_args_list], self.entries)
+        self.composite.undo()
+        self.assertEqual([c.args[1] for c in self.app.log_store.remove.call_args_list], self.entries[::-1])
+        self.assertEqual(self.composite.redraw_scope(), {"student_1", "student_2", REDRAW_STAT_BOXES})
+
+    def test_failed_sub_command_rolls_back(self):
+        self.app.log_store.add.side_effect = [None, RuntimeError("disk full")]
+        with self.assertRaises(RuntimeError): self.composite.execute()
+        self.app.log_store.remove.assert_called_once_with("behavior", self.entries[0])
+
+    def test_round_trip_and_single_save(self):
+        restored = Command.from_dict(self.app, json.loads(json.dumps(self.composite.to_dict())))
+        self.assertIsInstance(restored, CompositeCommand)
+        self.assertEqual([c.log_entry for c in restored.commands], self.entries)
+        self.assertEqual(restored.get_description(), "Logged Talking")
+
+        app = types.SimpleNamespace(settings={"use_log_journal": True}, log_store=self.app.log_store, undo_stack=[], redo_stack=[],
+                                    update_undo_redo_buttons_state=MagicMock(), save_manager=MagicMock(), save_data_wrapper=MagicMock(),
+                                    password_manager=MagicMock(), _journal_command=MagicMock())
+        app._should_journal_command = lambda command: SeatingChartApp._should_journal_command(app, command)
+        app._is_stored_log_command = lambda command: SeatingChartApp._is_stored_log_command(app, command)
+        SeatingChartApp.execute_command(app, self.composite)
+        self.assertEqual(app.undo_stack, [self.composite])
+        app.save_data_wrapper.assert_called_once_with(source="command_execution")
+        app._journal_command.assert_not_called()
+
+
+class TestDataMigrations(unittest.TestCase):
+    """Tests for the data_version field and the migration registry, on a fake app (no Tk needed)."""
+
+    def setUp(self):
+        self.app = types.SimpleNamespace(settings={})
+        for name in ("_get_data_migrations", "_get_data_version", "_run_data_migrations", "_migrate_v3_edited_data", "_migrate_v4_data",
+                     "_migrate_v5_data", "_migrate_v6_data", "_migrate_v7_data", "_migrate_v8_data", "_migrate_v9_data"):
+            setattr(self.app, name, types.MethodType(getattr(SeatingChartApp, name), self.app))
+
+    def test_get_data_version(self):
+        self.assertEqual(self.app._get_data_version({"data_version": 10}, "export.json"), 10)
+        self.assertEqual(self.app._get_data_version({}, "classroom_data_v10.json"), 10)
+        self.assertEqual(self.app._get_data_version({}, "classroom_data_v7.json"), 7)
+        self.assertEqual(self.app._get_data_version({}, "classroom_data_v4.json"), 3)
+        self.assertEqual(self.app._get_data_version({}, "classroom_data.json"), 3)
+
+    def test_run_data_migrations_from_v8(self):
+        data = {"settings": {}, "behavior_log": [], "students": {}}
+        migrated = self.app._run_data_migrations(data, 8)
+        self.assertEqual(migrated["data_version"], 10)
+        self.assertEqual([from_version for from_version, _ in self.app.last_migration_report], [8, 9])
+        self.assertIn("guides", migrated)
+
+
+class TestExcelExport(unittest.TestCase):
+    """Tests for the streaming log export to Excel."""
+
+    def test_streamed_export_keeps_layout_and_widths(self):
+        app = types.SimpleNamespace(behavior_log=[], homework_log=[], student_groups={}, all_homework_session_types=[],
+                                    settings={"quiz_mark_types": [{"id": "mark_correct", "name": "Correct", "default_points": 1}], "homework_mark_types": []},
+                                    students={f"student_{i}": {"id": f"student_{i}", "first_name": f"F{i}", "last_name": f"L{i}", "full_name": f"F{i} L{i}"} for i in (1, 2)})
+        app.log_store = LogStore(app)
+        app._query_logs_for_export = lambda filter_settings: SeatingChartApp._query_logs_for_export(app, filter_settings)
+        app._make_safe_sheet_name = lambda name, id_fallback="Sheet": SeatingChartApp._make_safe_sheet_name(app, name, id_fallback)
+        app._export_snapshot = lambda filter_settings=None: SeatingChartApp._export_snapshot(app, filter_settings)
+        self.app = app
+        app.log_store.add("behavior", {"student_id": "student_1", "timestamp": "2023-10-26T09:00:00", "type": "behavior", "behavior": "Talking",
+                                       "comment": "A much longer comment than any header"})
+        app.log_store.add("behavior", {"student_id": "student_2", "timestamp": "2023-10-26T10:00:00", "type": "quiz", "behavior": "Math Quiz",
+                                       "num_questions": 4, "marks_data": {"mark_correct": 3}})
+        filter_settings = {"include_summaries": True, "separate_sheets_by_log_type": True, "include_master_log": True}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "export.xlsx")
+            SeatingChartApp.export_data_to_excel(app, file_path, "xlsx", filter_settings)
+            from openpyxl import load_workbook
+            wb = load_workbook(file_path)
+        self.assertEqual(wb.sheetnames, ["Behavior Log", "Quiz Log", "Master Log", "F1_L1", "F2_L2", "Students Info", "Summary"])
+        behavior_ws = wb["Behavior Log"]
+        self.assertEqual(behavior_ws.freeze_panes, "A2")
+        self.assertTrue(behavior_ws["A1"].font.b)
+        self.assertEqual(behavior_ws["I2"].value, "A much longer comment than any header")
+        self.assertEqual(behavior_ws["I2"].alignment.horizontal, "left")
+        self.assertAlmostEqual(behavior_ws.column_dimensions["I"].width, (len("A much longer comment than any header") + 2) * 1.2)
+        self.assertAlmostEqual(behavior_ws.column_dimensions["D"].width, 12) # "Thursday", the longest value, is 8 characters
+        self.assertEqual(wb["Quiz Log"]["K2"].value, 75)
+        self.assertEqual(wb["Summary"]["A1"].font.sz, 14)
+        self.assertEqual(wb["Summary"]["C5"].value, 1) # Talking count for student_1
+
+    def test_discarded_workbook_leaves_no_temporary_files(self):
+        from excel_export import StreamingWorkbook, ExportCell
+        def stop_after_first_batch(workbook):
+            if workbook.rows_written: raise KeyboardInterrupt
+        with tempfile.TemporaryDirectory() as temp_dir, patch.object(tempfile, "tempdir", temp_dir):
+            wb = StreamingWorkbook(on_progress=stop_after_first_batch, progress_every=10)
+            ws = wb.create_sheet("Log")
+            with self.assertRaises(KeyboardInterrupt):
+                while True: wb.append(ws, [ExportCell("row", "export_left"), 1])
+            self.assertEqual(os.listdir(temp_dir), [])
+
+    def test_cancelled_backup_keeps_the_previous_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            backup_path = os.path.join(temp_dir, "backup.zip")
+            with open(backup_path, "wb") as f: f.write(b"previous backup")
+            job = types.SimpleNamespace(progress=MagicMock(side_effect=[None, JobCancelled("Backup")]))
+            with self.assertRaises(JobCancelled):
+                SeatingChartApp._write_backup_zip(None, backup_path, [("a.json", b"{}"), ("b.json", b"{}")], job)
+            self.assertEqual(os.listdir(temp_dir), ["backup.zip"])
+            with open(backup_path, "rb") as f: self.assertEqual(f.read(), b"previous backup")
+            SeatingChartApp._write_backup_zip(None, backup_path, [("a.json", b"{}")])
+            with zipfile.ZipFile(backup_path) as zf: self.assertEqual(zf.namelist(), ["a.json"])
+            self.assertEqual(os.listdir(temp_dir), ["backup.zip"])
+
+    def _run_until_finished(self, runner, timeout=10):
+        deadline = time.monotonic() + timeout
+        while runner.active_jobs() and time.monotonic() < deadline:
+            runner.poll(); time.sleep(0.01)
+        runner.poll()
+
+    def test_background_export_reports_progress_on_the_calling_thread(self):
+        self.test_streamed_export_keeps_layout_and_widths()
+        for hour in range(10, 20):
+            self.app.log_store.add("behavior", {"student_id": "student_1", "timestamp": f"2023-10-27T{hour}:00:00", "type": "behavior", "behavior": "Talking"})
+        updates, results = [], []
+        runner = ExportJobRunner(on_progress=lambda job: updates.append((job.state, job.done, threading.current_thread())))
+        filter_settings = {"include_summaries": False, "separate_sheets_by_log_type": False}
+        snapshot = SeatingChartApp._export_snapshot(self.app, filter_settings)
+        self.app.log_store.add("behavior", {"student_id": "student_2", "timestamp": "2023-10-28T09:00:00", "type": "behavior", "behavior": "Late"}) # After the snapshot
+        self.app.behavior_log[0]["comment"] = "Edited after the snapshot"
+        self.assertNotIn("Edited after the snapshot", [entry.get("comment") for entry in snapshot.logs])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "export.xlsx")
+            runner.submit("Export", lambda job: SeatingChartApp.export_data_to_excel(self.app, file_path, "xlsx", filter_settings, snapshot=snapshot, job=job) or "saved",
+                          on_done=results.append)
+            self._run_until_finished(runner)
+            from openpyxl import load_workbook
+            combined_rows = len(list(load_workbook(file_path)["Combined Log"].iter_rows()))
+        self.assertEqual(results, ["saved"])
+        self.assertEqual(combined_rows, 13) # Header and the 12 logs in the snapshot
+        self.assertEqual([state for state, _, _ in updates][-1], "done")
+        self.assertIn(("running", None), [(state, done) for state, done, _ in updates])
+        self.assertTrue(all(thread is threading.main_thread() for _, _, thread in updates))
+        runner.shutdown()
+
+    def test_cancelled_job_stops_and_leaves_no_file(self):
+        started, cancelled, done = threading.Event(), [], []
+        def endless_export(job):
+            from excel_export import StreamingWorkbook
+            wb = StreamingWorkbook(on_progress=lambda workbook: job.progress(f"{workbook.rows_written} rows"), progress_every=10)
+            ws = wb.create_sheet("Log")
+            while True:
+                wb.append(ws, ["row"]); started.set()
+        runner = ExportJobRunner()
+        job = runner.submit("Endless", endless_export, on_done=done.append, on_cancelled=lambda: cancelled.append(True))
+        queued = runner.submit("Queued", lambda job: "never run", on_done=done.append, on_cancelled=lambda: cancelled.append(True))
+        self.assertTrue(started.wait(5))
+        runner.cancel_all()
+        self._run_until_finished(runner)
+        self.assertEqual((job.state, queued.state), ("cancelled", "cancelled"))
+        self.assertEqual((cancelled, done), ([True, True], []))
+        self.assertTrue(runner.shutdown(timeout=5))
+
 class TestSeatingChartApp(unittest.TestCase):
     def setUp(self):
         # Create a mock Tk root window